@@ -278,18 +278,87 @@ export class PDF2zhHelperFactory {
         }
     }
 
-    // 准备文件数据
+    // 准备文件数据：只定位文件，真正读取放到 sendRequest 里按上传协议决定
     static async prepareFileData(
         item: Zotero.Item,
-    ): Promise<{ fileName: string; base64: string }> {
+    ): Promise<{ fileName: string; filepath: string }> {
         const filepath = await this.validatePDFAttachment(item);
         const fileName = PathUtils.filename(filepath);
-        const base64 = await this.readPDFAsBase64(filepath);
-        return { fileName, base64 }; // 返回PDF数据用于传输, 返回fileName
+        return { fileName, filepath };
+    }
+
+    // Server 支持的上传协议，按 serverUrl 缓存。旧 Server 只支持 base64-in-JSON。
+    // 只缓存成功的 /health 响应：Server 暂时不可用时本次用 base64，下次再查询。
+    private static uploadModesCache = new Map<string, string[]>();
+
+    static async serverUploadModes(config: ServerConfig): Promise<string[]> {
+        const base = this.normalizeServerUrl(config.serverUrl);
+        const cached = this.uploadModesCache.get(base);
+        if (cached) {
+            return cached;
+        }
+        try {
+            const res = await fetch(`${base}/health`, {
+                cache: "no-store",
+            });
+            if (res.ok) {
+                const data = (await res.json()) as {
+                    uploadModes?: unknown;
+                };
+                const modes = this.stringList(data.uploadModes);
+                this.uploadModesCache.set(base, modes);
+                return modes;
+            }
+        } catch (error) {
+            ztoolkit.log("读取 Server 上传协议失败，使用 base64:", error);
+        }
+        return [];
+    }
+
+    static async sha256Hex(content: Uint8Array): Promise<string> {
+        try {
+            const subtle = Zotero.getMainWindow().crypto.subtle;
+            const digest = await subtle.digest("SHA-256", content);
+            return Array.from(new Uint8Array(digest))
+                .map((b) => b.toString(16).padStart(2, "0"))
+                .join("");
+        } catch (error) {
+            ztoolkit.log("计算 PDF SHA-256 失败，改为直接上传:", error);
+            return "";
+        }
+    }
+
+    // 先按哈希询问 Server，只有 Server 上没有这个 PDF 时才真正上传。
+    static async ensureServerHasUpload(
+        config: ServerConfig,
+        sha256: string,
+        content: Uint8Array,
+    ): Promise<boolean> {
+        const url = `${this.normalizeServerUrl(config.serverUrl)}/api/uploads/${sha256}`;
+        try {
+            const head = await fetch(url, {
+                method: "HEAD",
+                cache: "no-store",
+            });
+            if (head.ok) {
+                ztoolkit.log(`Server 已有该 PDF，跳过上传: ${sha256}`);
+                return true;
+            }
+            const put = await fetch(url, {
+                method: "PUT",
+                headers: { "Content-Type": "application/pdf" },
+                body: content,
+                cache: "no-store",
+            });
+            return put.ok;
+        } catch (error) {
+            ztoolkit.log("按哈希上传 PDF 失败，改为随请求上传:", error);
+            return false;
+        }
     }
 
     static async sendRequest(
-        fileData: { fileName: string; base64: string },
+        fileData: { fileName: string; filepath: string },
         config: ServerConfig,
         endpoint: string,
         onProgress?: (
@@ -307,7 +376,6 @@ export class PDF2zhHelperFactory {
 
             const requestBody: any = {
                 fileName: fileData.fileName,
-                fileContent: fileData.base64,
                 ...config, // 发送config数据
                 // 新协议：Server 立刻返回 accepted + taskId，插件再轮询。
                 // 没带这个标记的旧插件（含 DCC 4.0.3）会走 Server 同步返回 fileList。
@@ -325,15 +393,76 @@ export class PDF2zhHelperFactory {
                     extraDataKeys: Object.keys(llmApiConfig.extraData || {}),
                 });
             }
-            const response = await fetch(`${config.serverUrl}/${endpoint}`, {
-                method: "POST",
-                headers: {
-                    "Content-Type": "application/json",
-                    "X-PDF2zh-Protocol": "accepted",
-                },
-                body: JSON.stringify(requestBody),
-                cache: "no-store",
-            });
+            let response: Response | null = null;
+            const uploadModes = await this.serverUploadModes(config);
+            const content = uploadModes.length
+                ? await IOUtils.read(fileData.filepath)
+                : null;
+            const sha256 =
+                content && uploadModes.includes("sha256")
+                    ? await this.sha256Hex(content)
+                    : "";
+            if (
+                content &&
+                sha256 &&
+                (await this.ensureServerHasUpload(config, sha256, content))
+            ) {
+                // Server 上已有这个 PDF（按 SHA-256），请求里只带哈希。
+                requestBody.fileSha256 = sha256;
+                response = await fetch(`${config.serverUrl}/${endpoint}`, {
+                    method: "POST",
+                    headers: {
+                        "Content-Type": "application/json",
+                        "X-PDF2zh-Protocol": "accepted",
+                    },
+                    body: JSON.stringify(requestBody),
+                    cache: "no-store",
+                });
+                if (response.status === 410) {
+                    // 询问之后 Server 的上传库淘汰了这个 PDF：改为随请求直接上传
+                    ztoolkit.log(
+                        `Server 上已没有该 PDF，改为直接上传: ${sha256}`,
+                    );
+                    delete requestBody.fileSha256;
+                    response = null;
+                }
+            }
+            if (!response) {
+                if (content && uploadModes.includes("multipart")) {
+                    // 新 Server：配置作为 config 字段、PDF 原样作为 file 字段用 multipart 上传，
+                    // 省去 base64 编码，Server 端也可以边收边写盘。
+                    // 配置里有 API Key 和自定义 prompt，不能放进请求头：反向代理会记录请求头，
+                    // 而且请求头通常限制在 8-16 KB 以内。
+                    const form = new FormData();
+                    form.append("config", JSON.stringify(requestBody));
+                    form.append(
+                        "file",
+                        new Blob([content], { type: "application/pdf" }),
+                        fileData.fileName,
+                    );
+                    response = await fetch(`${config.serverUrl}/${endpoint}`, {
+                        method: "POST",
+                        headers: {
+                            "X-PDF2zh-Protocol": "accepted",
+                        },
+                        body: form,
+                        cache: "no-store",
+                    });
+                } else {
+                    requestBody.fileContent = await this.readPDFAsBase64(
+                        fileData.filepath,
+                    );
+                    response = await fetch(`${config.serverUrl}/${endpoint}`, {
+                        method: "POST",
+                        headers: {
+                            "Content-Type": "application/json",
+                            "X-PDF2zh-Protocol": "accepted",
+                        },
+                        body: JSON.stringify(requestBody),
+                        cache: "no-store",
+                    });
+                }
+            }
             const text = await response.text();
             let result: {
                 status?: string;
@@ -486,6 +615,22 @@ export class PDF2zhHelperFactory {
     ): Promise<Record<string, unknown> | undefined> {
         const base = this.normalizeServerUrl(config.serverUrl);
         try {
+            // 新版 Server 按 taskId 直接返回单个任务（活动任务或历史记录）
+            const taskRes = await fetch(
+                `${base}/api/tasks/${encodeURIComponent(taskId)}`,
+                { cache: "no-store" },
+            );
+            const taskData = (await taskRes.json().catch(() => null)) as {
+                task?: Record<string, unknown>;
+                errorType?: string;
+            } | null;
+            if (taskRes.ok && taskData?.task) {
+                return taskData.task;
+            }
+            if (taskData?.errorType === "TaskNotFound") {
+                return undefined;
+            }
+            // 旧版 Server 没有该路由：退回到扫描完整的任务列表和历史记录
             const tasksRes = await fetch(`${base}/api/tasks`, {
                 cache: "no-store",
             });
@@ -533,6 +678,38 @@ export class PDF2zhHelperFactory {
         return this.completedTaskPayload(task, taskId);
     }
 
+    static async longPollTask(
+        config: ServerConfig,
+        taskId: string,
+        since: number,
+    ): Promise<
+        { supported: boolean; task?: Record<string, unknown> } | undefined
+    > {
+        // 新版 Server：GET /api/tasks/<id>?since=<version> 会阻塞到任务有变化才返回。
+        // 旧版 Server 没有这个路由（返回非 JSON 的 404），此时 supported=false。
+        const base = this.normalizeServerUrl(config.serverUrl);
+        try {
+            const res = await fetch(
+                `${base}/api/tasks/${encodeURIComponent(taskId)}?since=${since}`,
+                { cache: "no-store" },
+            );
+            const data = (await res.json().catch(() => null)) as {
+                task?: Record<string, unknown>;
+                errorType?: string;
+            } | null;
+            if (res.ok && data?.task) {
+                return { supported: true, task: data.task };
+            }
+            if (data?.errorType === "TaskNotFound") {
+                return { supported: true };
+            }
+            return { supported: false };
+        } catch (error) {
+            ztoolkit.log("长轮询翻译任务状态失败:", error);
+            return undefined;
+        }
+    }
+
     static async waitForAcceptedTask(
         config: ServerConfig,
         taskId: string,
@@ -541,8 +718,28 @@ export class PDF2zhHelperFactory {
         // Zotero 插件沙箱没有 AbortController / ReadableStream / EventSource，
         // 不能去拉无限的 /events。POST 已经成功开工，这里只等这个 taskId 结束。
         const deadline = Date.now() + 3 * 60 * 60 * 1000;
+        let longPoll = true;
+        let since = 0;
         while (Date.now() < deadline) {
-            const task = await this.fetchTaskRecord(config, taskId);
+            let task: Record<string, unknown> | undefined;
+            let waited = false;
+            if (longPoll) {
+                const result = await this.longPollTask(config, taskId, since);
+                if (result?.supported) {
+                    task = result.task;
+                    const version = Number(task?.version);
+                    // 版本号前进说明 Server 已经替我们等过了，无需再 sleep
+                    waited = Number.isFinite(version) && version > since;
+                    if (waited) {
+                        since = version;
+                    }
+                } else if (result) {
+                    longPoll = false;
+                }
+            }
+            if (!longPoll) {
+                task = await this.fetchTaskRecord(config, taskId);
+            }
             const payload = this.completedTaskPayload(task, taskId);
             if (payload) {
                 if (payload.status === "error") {
@@ -568,7 +765,9 @@ export class PDF2zhHelperFactory {
                     message: String(task.message || task.status || ""),
                 });
             }
-            await Zotero.Promise.delay(1000);
+            if (!waited) {
+                await Zotero.Promise.delay(1000);
+            }
         }
         throw new Error("等待翻译结果超时");
     }
@@ -2,13 +2,16 @@
 # guaguastandup
 # zotero-pdf2zh
 import os
-from flask import Flask, request, jsonify, send_file, Response
+from flask import Flask, Request, request, jsonify, send_file, Response, g, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.serving import WSGIRequestHandler
 from urllib.parse import unquote
 import base64
+import hashlib
+import shutil
 import subprocess
+import tempfile
 import json, toml
-import shutil
 from pypdf import PdfReader
 from utils.venv import VirtualEnvManager
 from utils.environment_lifecycle import (
@@ -17,9 +20,10 @@ from utils.environment_lifecycle import (
     pdf2zh_next_meets_minimum,
     read_versions,
 )
-from utils.config import Config
+from utils.config import Config, cleanup_job_config_files
 from utils.config_migration import prepare_config_files
-from utils.cropper import Cropper
+from utils.cropper import Cropper, PARALLEL_MIN_PAGES as DEFAULT_CROP_PARALLEL_MIN_PAGES, SAVE_PROFILES, DEFAULT_SAVE_PROFILE, CROP_ENGINES, DEFAULT_CROP_ENGINE, DEFAULT_MERGE_MEMORY_MB
+from utils.column_layout import CROP_LAYOUTS, DEFAULT_CROP_LAYOUT
 import traceback
 import argparse
 import sys  # 用于退出脚本
@@ -33,9 +37,26 @@ from datetime import datetime  # 用于记录任务开始/结束时间
 # 导入自动更新模块
 from utils.auto_update import check_for_updates, fetch_and_show_notices, perform_update_optimized
 # 导入任务管理器（用于 index.html 前端进度显示）
-from utils.task_manager import task_manager
+from utils.task_manager import task_manager, DEFAULT_RETENTION_SECONDS, DEFAULT_PROGRESS_HZ
 # 导入带进度解析的命令执行器
 from utils.execute import execute_with_progress
+# 导入翻译任务调度器（限制同时运行的翻译数量）
+from utils.job_scheduler import job_scheduler, DEFAULT_MAX_CONCURRENT_JOBS
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+# 导入任务取消（结束翻译进程组、清理部分输出）
+from utils.cancellation import cancel_registry, JobCancelled, JobTimeout
+# 导入卡住检测 / 运行时长预算（上游接口无响应时结束翻译进程并让出槽位）
+from utils.watchdog import job_watchdog, DEFAULT_STALL_TIMEOUT, DEFAULT_JOB_TIMEOUT, DEFAULT_STALL_RETRIES
+# 导入资源用量统计（翻译进程的 CPU / 内存峰值 / I/O，裁剪等步骤的耗时）
+from utils.resource_usage import usage_tracker, summarize as summarize_usage
+from utils.next_shards import page_shards, ShardPlan, ShardProgress, stitch_pdfs, DEFAULT_SHARDS, DEFAULT_SHARD_MIN_PAGES
+# 导入常驻 pdf2zh_next 进程池（省去每个任务的解释器启动和依赖导入）
+from utils.warm_pool import warm_pool, DEFAULT_WARM_WORKERS
+# 导入翻译结果缓存（相同 PDF + 相同配置直接复用已有结果）
+from utils.result_cache import ResultCache, DEFAULT_MAX_ENTRIES as DEFAULT_CACHE_ENTRIES, DEFAULT_MAX_MB as DEFAULT_CACHE_MB
+# 导入按 SHA-256 存储的上传文件库（插件已上传过的 PDF 无需重复发送）
+from utils.upload_store import UploadStore, UploadMissingError, UploadTooLargeError, DEFAULT_MAX_MB as DEFAULT_UPLOAD_STORE_MB, DEFAULT_MAX_UPLOAD_MB, normalize_sha256, place_file
+from utils.task_store import TaskStore, DEFAULT_RETENTION_DAYS as DEFAULT_TASK_STORE_DAYS, DEFAULT_MAX_ENTRIES as DEFAULT_TASK_STORE_ENTRIES
 
 _VALUE_ERROR_RE = re.compile(r'(?m)^ValueError:\s*(?P<msg>.+)$')
 
@@ -78,12 +99,31 @@ enable_venv = True
 
 PORT = 8890     # 默认端口号
 
+# 上传协议：旧插件把整个 PDF 以 base64 放进 JSON 的 fileContent；
+# 新插件用 multipart/form-data (file + config 字段)，按块流式写盘。
+# 原始 application/pdf 请求体 (配置放在 X-PDF2zh-Config 头里) 只适合脚本等简单客户端：
+# 请求头会被反向代理记录、且大小受限，不要在里面放 API Key 或很长的 prompt。
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_CONFIG_HEADER = 'X-PDF2zh-Config'
+UPLOAD_FILENAME_HEADER = 'X-PDF2zh-File-Name'
+RAW_UPLOAD_MIMETYPES = {'application/pdf', 'application/octet-stream'}
+# 单个 PDF 的字节数上限放在 app.config 里（由 --upload_max_mb 设置），所有上传方式共用
+UPLOAD_MAX_BYTES_KEY = 'PDF2ZH_UPLOAD_MAX_BYTES'
+
+# 任务推送：/events 空闲时的保活间隔、两次推送的最小间隔，以及长轮询的最长等待时间（秒）
+SSE_KEEPALIVE_SECONDS = 15
+SSE_MIN_INTERVAL = 0.2
+LONG_POLL_TIMEOUT = 30
+
 
 class _QuietAccessHandler(WSGIRequestHandler):
     # 进度查询很勤，默认访问日志会插进 tqdm/rich 进度条中间。
     _SILENT_PREFIXES = (
         '/api/tasks',
         '/api/history',
+        '/api/queue',
+        '/api/cache',
+        '/api/uploads',
         '/events',
         '/health',
         '/favicon',
@@ -96,13 +136,76 @@ class _QuietAccessHandler(WSGIRequestHandler):
         super().log_request(code, size)
 
 
+class _UploadPart:
+    """File part of a multipart upload, written straight into the output folder.
+
+    Werkzeug would otherwise spool the part to its own temporary file and
+    the PDF would be written twice. The part is hashed and size-checked as
+    it arrives; ``publish`` moves it into place. A part that is never
+    published is removed when the request closes it.
+    """
+
+    def __init__(self, folder, max_bytes):
+        fd, self.name = tempfile.mkstemp(prefix='.upload-', suffix='.part', dir=folder)
+        self.file = os.fdopen(fd, 'w+b')
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, data):
+        self.size += len(data)
+        if self.max_bytes and self.size > self.max_bytes:
+            self.close()
+            # 表单解析器会吞掉 ValueError，这里必须抛 HTTP 413
+            raise RequestEntityTooLarge(_upload_too_large_message(self.max_bytes))
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def publish(self, path):
+        self.file.close()
+        os.replace(self.name, path)
+        return self.digest.hexdigest()
+
+    def close(self):
+        self.file.close()
+        try:
+            os.remove(self.name)
+        except OSError:
+            pass
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class _UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return _UploadPart(output_folder, current_app.config.get(UPLOAD_MAX_BYTES_KEY))
+
+
+def _upload_too_large_message(max_bytes):
+    return f"Upload exceeds the limit of {max_bytes // (1024 * 1024)} MB"
+
+
 class PDFTranslator:
 
     def __init__(self, args):
         self.app = Flask(__name__)
+        self.app.request_class = _UploadRequest
+        upload_max_bytes = max(1, int(args.upload_max_mb)) * 1024 * 1024
+        self.app.config[UPLOAD_MAX_BYTES_KEY] = upload_max_bytes
+        # 请求体上限：base64-in-JSON 比 PDF 本身大 1/3，再留 1 MB 给配置字段
+        self.app.config['MAX_CONTENT_LENGTH'] = upload_max_bytes * 4 // 3 + 1024 * 1024
         if args.enable_venv:
             self.env_manager = VirtualEnvManager(config_path[venv], venv_name, args.env_tool, args.enable_mirror, args.skip_install, args.mirror_source)
-        self.cropper = Cropper()
+        self.cropper = Cropper(args.crop_workers, args.crop_parallel_min_pages, args.save_profile, args.crop_engine, args.crop_layout,
+                               args.merge_memory_mb)
+        self.result_cache = ResultCache(output_folder, args.result_cache_max_entries, args.result_cache_max_mb)
+        self.result_cache.configure(enabled=args.result_cache)
+        self.upload_store = UploadStore(output_folder, args.upload_store_max_mb, args.upload_max_mb)
+        if args.task_store:
+            store = TaskStore(output_folder, args.task_store_days, args.task_store_max_entries)
+            restored = task_manager.attach_store(store)
+            print(f"🗂️ [Zotero PDF2zh Server] 任务日志: {store.path} (已恢复 {restored} 条历史记录)")
         self.setup_routes()
 
     def setup_routes(self):
@@ -133,6 +236,24 @@ class PDFTranslator:
         # 新增：历史记录 API - 供 index.html 前端获取翻译历史
         self.app.add_url_rule('/api/history', 'history', self.get_history)
         self.app.add_url_rule('/api/tasks', 'tasks', self.get_tasks)
+        # 新增：单个任务 API - 带 ?since=<version> 时为长轮询，任务有变化才返回
+        self.app.add_url_rule('/api/tasks/<task_id>', 'task', self.get_task)
+        # 新增：取消任务 - 排队中的直接移除，运行中的结束翻译进程并让出槽位
+        self.app.add_url_rule('/api/tasks/<task_id>', 'cancel-task', self.cancel_task, methods=['DELETE'])
+        # 新增：排队状态 API - 查看并发槽位、排队中的任务和平均耗时
+        self.app.add_url_rule('/api/queue', 'queue', self.get_queue)
+        # 新增：资源用量 API - 按翻译引擎 / 服务汇总 CPU 时间、内存峰值、I/O 和各步骤耗时
+        self.app.add_url_rule('/api/usage', 'usage', self.get_usage)
+        # 新增：翻译缓存 API - 查看缓存命中率和占用空间
+        self.app.add_url_rule('/api/cache', 'cache', self.get_cache_stats)
+        # 新增：上传去重 API - 插件先按 SHA-256 询问，Server 没有时才上传 PDF
+        self.app.add_url_rule('/api/uploads', 'uploads', self.get_upload_stats)
+        self.app.add_url_rule(
+            '/api/uploads/<sha256>',
+            'upload_blob',
+            self.upload_blob,
+            methods=['GET', 'HEAD', 'PUT'],
+        )
         # 新增：配置信息 API - 供 index.html 前端显示当前服务配置
         self.app.add_url_rule('/api/config', 'config', self.get_config)
         # 新增：favicon 路由
@@ -150,6 +271,7 @@ class PDFTranslator:
             'version': __version__,
             'message': 'PDF2zh Server is running',
             'outputDir': os.path.abspath(output_folder),
+            'uploadModes': ['json-base64', 'multipart', 'raw', 'sha256'],
         }), 200
 
     ##################################################################
@@ -170,19 +292,10 @@ class PDFTranslator:
     # index.html 通过 EventSource('/events') 接收数据
     ##################################################################
     def events(self):
-        def generate():
-            while True:
-                try:
-                    tasks_data = {
-                        'type': 'tasks',
-                        'data': task_manager.get_active_tasks_list()
-                    }
-                    yield f"data: {json.dumps(tasks_data)}\n\n"
-                    time.sleep(1)  # 每秒推送一次
-                except GeneratorExit:
-                    break
+        task_id = request.args.get('taskId')
+        generate = self._task_delta_events(task_id) if task_id else self._task_list_events()
         return Response(
-            generate(),
+            generate,
             mimetype='text/event-stream',
             headers={
                 'Cache-Control': 'no-cache, no-store',
@@ -190,14 +303,151 @@ class PDFTranslator:
             },
         )
 
+    def _task_list_events(self):
+        # 只在任务有变化时推送完整列表；空闲时仅定期发送注释行保活
+        since = -1
+        while True:
+            try:
+                version = task_manager.wait_for_change(since, SSE_KEEPALIVE_SECONDS)
+                if version == since:
+                    yield ": keepalive\n\n"
+                    continue
+                since = version
+                tasks_data = {
+                    'type': 'tasks',
+                    'version': version,
+                    'data': task_manager.get_active_tasks_list()
+                }
+                yield f"data: {json.dumps(tasks_data)}\n\n"
+                # 进度刷新很密集时合并为每 SSE_MIN_INTERVAL 秒最多一次
+                time.sleep(SSE_MIN_INTERVAL)
+            except GeneratorExit:
+                break
+
+    def _task_delta_events(self, task_id):
+        # /events?taskId=xxx：首条为完整任务，之后只推送发生变化的字段
+        since = 0
+        last = {}
+        while True:
+            try:
+                task = task_manager.wait_for_task(task_id, since, SSE_KEEPALIVE_SECONDS)
+                if task is None:
+                    yield f"data: {json.dumps({'type': 'error', 'taskId': task_id, 'message': 'Task not found'})}\n\n"
+                    break
+                version = task.get('version', 0)
+                if version <= since:
+                    yield ": keepalive\n\n"
+                    continue
+                delta = {key: value for key, value in task.items() if last.get(key) != value}
+                since, last = version, task
+                yield f"data: {json.dumps({'type': 'task', 'taskId': task_id, 'version': version, 'data': delta})}\n\n"
+                if task.get('finished'):
+                    break
+            except GeneratorExit:
+                break
+
     ##################################################################
     # 历史记录 API /api/history - 供 index.html 前端获取翻译历史
     ##################################################################
     def get_history(self):
-        return jsonify({'status': 'success', 'history': task_manager.get_history()})
+        # 可选过滤：?taskId=&status=success|failed&since=2025-01-01&until=...&limit=
+        filters = {key: request.args.get(key) for key in ('taskId', 'status', 'since', 'until')}
+        limit = request.args.get('limit', type=int)
+        if not any(filters.values()) and limit is None:
+            return jsonify({'status': 'success', 'history': task_manager.get_history()})
+        history = task_manager.query_history(
+            task_id=filters['taskId'],
+            status=filters['status'],
+            since=filters['since'],
+            until=filters['until'],
+            limit=limit or 200,
+        )
+        return jsonify({'status': 'success', 'history': history})
 
     def get_tasks(self):
-        return jsonify({'status': 'success', 'tasks': task_manager.get_active_tasks_list()})
+        return jsonify({
+            'status': 'success',
+            'tasks': task_manager.get_active_tasks_list(),
+            'stats': task_manager.stats(),
+        })
+
+    def get_task(self, task_id):
+        # 长轮询：?since=<version> 时阻塞到任务版本号超过 since 或 timeout 秒后返回
+        since = request.args.get('since', type=int)
+        if since is None:
+            task = task_manager.get_task(task_id)
+        else:
+            timeout = min(max(request.args.get('timeout', LONG_POLL_TIMEOUT, type=float), 0), LONG_POLL_TIMEOUT)
+            task = task_manager.wait_for_task(task_id, since, timeout)
+        if task is None:
+            return jsonify({
+                'status': 'error',
+                'ok': False,
+                'message': f'Task {task_id} not found',
+                'errorType': 'TaskNotFound',
+            }), 404
+        return jsonify({'status': 'success', 'task': task})
+
+    def cancel_task(self, task_id):
+        state = job_scheduler.cancel(task_id)
+        if state is None:
+            if task_manager.get_task(task_id) is None:
+                return jsonify({
+                    'status': 'error',
+                    'ok': False,
+                    'message': f'Task {task_id} not found',
+                    'errorType': 'TaskNotFound',
+                }), 404
+            return jsonify({
+                'status': 'error',
+                'ok': False,
+                'message': f'Task {task_id} is not queued or running',
+                'errorType': 'TaskNotCancellable',
+            }), 409
+        task_manager.complete_task(task_id, 'cancelled', '任务已取消')
+        print(f"🛑 [Zotero PDF2zh Server] 已取消任务 {task_id} ({'排队中' if state == 'queued' else '运行中'})")
+        return jsonify({'status': 'success', 'taskId': task_id, 'cancelled': state})
+
+    def get_usage(self):
+        # 按 engine / service 汇总已完成任务的资源用量；过滤参数同 /api/history
+        items = task_manager.query_history(
+            status=request.args.get('status'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            limit=request.args.get('limit', 1000, type=int),
+        )
+        return jsonify({'status': 'success', 'jobs': len(items), 'usage': summarize_usage(items)})
+
+    def get_queue(self):
+        return jsonify({'status': 'success', 'queue': job_scheduler.stats(), 'warmPool': warm_pool.stats(), 'watchdog': job_watchdog.stats()})
+
+    def get_cache_stats(self):
+        return jsonify({'status': 'success', 'cache': self.result_cache.stats()})
+
+    def get_upload_stats(self):
+        return jsonify({'status': 'success', 'uploads': self.upload_store.stats()})
+
+    def upload_blob(self, sha256):
+        # HEAD/GET: 询问该 PDF 是否已在 Server 上；PUT: 上传原始 PDF 字节（会校验哈希）
+        try:
+            sha256 = normalize_sha256(sha256)
+            if request.method == 'PUT':
+                self.upload_store.put_stream(request.stream, sha256, request.content_length)
+                return jsonify({'status': 'success', 'exists': True, 'sha256': sha256}), 200
+            if self.upload_store.has(sha256):
+                return jsonify({
+                    'status': 'success',
+                    'exists': True,
+                    'sha256': sha256,
+                    'size': self.upload_store.size(sha256),
+                }), 200
+            return jsonify({'status': 'success', 'exists': False, 'sha256': sha256}), 404
+        except (UploadTooLargeError, RequestEntityTooLarge) as e:
+            return jsonify({'status': 'error', 'errorType': 'UploadTooLarge', 'message': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 400
+        except Exception as e:
+            return self._handle_exception(e, context='/api/uploads')
 
     ##################################################################
     # 配置信息 API /api/config - 供 index.html 前端显示当前服务配置
@@ -212,6 +462,8 @@ class PDFTranslator:
             'mirror_source': args.mirror_source if args.enable_mirror else '-',
             'skip_install': args.skip_install,
             'enable_winexe': args.enable_winexe,
+            'max_concurrent_jobs': args.max_concurrent_jobs,
+            'result_cache': args.result_cache,
         }
         return jsonify({'status': 'success', 'config': config_info})
 
@@ -251,8 +503,72 @@ class PDFTranslator:
             raise ValueError("Only PDF uploads are accepted")
         return name
 
+    @staticmethod
+    def _decode_config_header(raw):
+        raw = (raw or '').strip()
+        if not raw:
+            return {}
+        # 支持三种写法：原始 JSON、encodeURIComponent 后的 JSON、UTF-8 JSON 的 base64
+        if raw.startswith('%'):
+            raw = unquote(raw)
+        elif not raw.startswith('{'):
+            try:
+                raw = base64.b64decode(raw).decode('utf-8')
+            except Exception as exc:
+                raise ValueError(f"Invalid {UPLOAD_CONFIG_HEADER} header: {exc}") from exc
+        try:
+            return json.loads(raw)
+        except ValueError as exc:
+            raise ValueError(f"Invalid {UPLOAD_CONFIG_HEADER} header: {exc}") from exc
+
+    def _request_data(self):
+        """Request config for every upload mode, parsed once per request."""
+        if 'pdf2zh_request_data' in g:
+            return g.pdf2zh_request_data
+        if request.mimetype == 'multipart/form-data':
+            raw = request.form.get('config') or request.headers.get(UPLOAD_CONFIG_HEADER)
+            data = self._decode_config_header(raw)
+            if not data.get('fileName'):
+                upload = request.files.get('file')
+                if upload is not None and upload.filename:
+                    data['fileName'] = upload.filename
+        elif request.mimetype in RAW_UPLOAD_MIMETYPES:
+            data = self._decode_config_header(request.headers.get(UPLOAD_CONFIG_HEADER))
+            header_name = request.headers.get(UPLOAD_FILENAME_HEADER)
+            if header_name and not data.get('fileName'):
+                data['fileName'] = unquote(header_name)
+        else:
+            data = request.get_json(silent=True)
+        g.pdf2zh_request_data = data
+        return data
+
+    @staticmethod
+    def _write_upload_stream(stream, input_path):
+        # 先写临时文件再原子替换，避免并发请求读到写了一半的 PDF；边写边算 SHA-256
+        max_bytes = current_app.config.get(UPLOAD_MAX_BYTES_KEY)
+        digest = hashlib.sha256()
+        received = 0
+        part_path = f"{input_path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(part_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if max_bytes and received > max_bytes:
+                        raise UploadTooLargeError(_upload_too_large_message(max_bytes))
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.replace(part_path, input_path)
+        except Exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        return digest.hexdigest()
+
     def process_request(self):
-        data = request.get_json(silent=True)
+        data = self._request_data()
         if not isinstance(data, dict):
             raise ValueError("Invalid JSON request")
         config = Config(data)
@@ -266,19 +582,40 @@ class PDFTranslator:
         except ValueError:
             raise ValueError("Invalid PDF filename")
 
-        file_content = data.get('fileContent', '')
-        if not isinstance(file_content, str):
-            raise ValueError("Invalid PDF content")
-        if file_content.startswith('data:application/pdf;base64,'):
-            file_content = file_content[len('data:application/pdf;base64,'):]
+        if request.mimetype == 'multipart/form-data':
+            upload = request.files.get('file')
+            if upload is None:
+                raise ValueError("Missing PDF file field")
+            if isinstance(upload.stream, _UploadPart):
+                # 解析表单时已写到 output 目录并算好哈希，这里只需原子改名
+                config.input_sha256 = upload.stream.publish(input_path)
+            else:
+                config.input_sha256 = self._write_upload_stream(upload.stream, input_path)
+        elif request.mimetype in RAW_UPLOAD_MIMETYPES:
+            config.input_sha256 = self._write_upload_stream(request.stream, input_path)
+        elif data.get('fileSha256') and not data.get('fileContent'):
+            # 去重协议：PDF 已通过 /api/uploads/<sha256> 存在 Server 上，只引用哈希
+            config.input_sha256 = normalize_sha256(data.get('fileSha256'))
+            self.upload_store.materialize(config.input_sha256, input_path)
+            return input_path, config
+        else:
+            # 旧插件协议：base64-in-JSON
+            file_content = data.get('fileContent', '')
+            if not isinstance(file_content, str):
+                raise ValueError("Invalid PDF content")
+            if file_content.startswith('data:application/pdf;base64,'):
+                file_content = file_content[len('data:application/pdf;base64,'):]
+            try:
+                decoded = base64.b64decode(file_content)
+            except Exception as exc:
+                raise ValueError(f"Invalid PDF content: {exc}") from exc
+            config.input_sha256 = self._write_upload_stream(io.BytesIO(decoded), input_path)
+
+        # 记入上传库，之后同一个 PDF 的 crop / compare 等请求可以只发哈希
         try:
-            decoded = base64.b64decode(file_content)
+            self.upload_store.put_file(input_path, config.input_sha256)
         except Exception as exc:
-            raise ValueError(f"Invalid PDF content: {exc}") from exc
-
-        with open(input_path, 'wb') as f:
-            f.write(decoded)
-
+            print(f"⚠️ [Zotero PDF2zh Server] 记录上传文件失败, 不影响本次请求: {exc}")
         return input_path, config
 
     def _existing_output_files(self, paths):
@@ -369,7 +706,7 @@ class PDFTranslator:
         header = (request.headers.get('X-PDF2zh-Protocol') or '').strip().lower()
         if header in {'accepted', 'async'}:
             return True
-        data = request.get_json(silent=True) or {}
+        data = self._request_data() or {}
         if not isinstance(data, dict):
             return False
         if 'asyncJob' in data:
@@ -380,21 +717,24 @@ class PDFTranslator:
     def _start_accepted_job(self, task_id, task_info, worker, context):
         # 新插件：POST 立刻 accepted，翻完后按 taskId 取结果，避免 Windows 长连接被掐。
         # 旧插件：阻塞到完成，再返回 {status: success, fileList, ...}。
+        # 两种协议都经过 job_scheduler 排队，同时运行的翻译数不超过 --max_concurrent_jobs。
         task_manager.add_task(task_id, task_info)
         if self._client_wants_async_job():
             def run():
                 try:
-                    worker()
+                    return worker()
+                except JobCancelled:
+                    return {'status': 'error', 'message': '任务已取消'}
                 except Exception as exc:
                     task_manager.complete_task(task_id, 'failed', str(exc), error=str(exc))
-                    self._exception_payload(exc, context=context)
+                    return self._exception_payload(exc, context=context)
 
-            threading.Thread(target=run, daemon=True).start()
+            job_scheduler.submit(task_id, run)
             return jsonify({'status': 'accepted', 'taskId': task_id}), 200
 
         print(f"ℹ️ [Zotero PDF2zh Server] 旧插件协议：同步等待完成后返回 fileList ({context})")
         try:
-            payload = worker() or {}
+            payload = job_scheduler.submit(task_id, worker).result() or {}
             if payload.get('status') == 'error':
                 return jsonify(payload), 500
             if payload.get('status') != 'success':
@@ -403,6 +743,8 @@ class PDFTranslator:
                     'message': payload.get('message') or '操作失败，请查看详细日志。',
                 }), 500
             return jsonify(payload), 200
+        except (JobCancelled, CancelledError):
+            return jsonify({'status': 'error', 'message': '任务已取消'}), 409
         except Exception as exc:
             task_manager.complete_task(task_id, 'failed', str(exc), error=str(exc))
             return self._handle_exception(exc, context=context)
@@ -514,31 +856,63 @@ class PDFTranslator:
             task_manager.complete_task(task_id, 'failed', str(e), error=str(e))
             return self._handle_exception(e, context='/translate')
 
+    def _run_metered_job(self, task_id, config, run):
+        """所有后台任务（translate / compare / crop-compare）共用的执行包装。"""
+        # 卡住 / 超过时长预算时 job_watchdog 结束翻译进程，任务以 JobTimeout 失败
+        job_watchdog.begin(task_id, config.stall_timeout, config.job_timeout)
+        try:
+            # 资源用量随进程结束写到任务的 usage 字段，完成时一并进入历史记录
+            with usage_tracker.collect(task_id):
+                return run()
+        finally:
+            job_watchdog.finish(task_id)
+
     def _execute_translate_job(self, task_id, input_path, config, engine):
+        return self._run_metered_job(
+            task_id, config, lambda: self._run_translate_job(task_id, input_path, config, engine)
+        )
+
+    def _run_translate_job(self, task_id, input_path, config, engine):
         def addFileList(fileList, filePath):
             if os.path.exists(filePath):
                 fileList.append(filePath)
 
+        # 先查翻译结果缓存：同一 PDF + 同样的翻译配置不再重新跑 pdf2zh/pdf2zh_next。
+        # 缓存键必须在下面修改 config 之前计算。
+        cache_key = None
+        if config.use_cache and self.result_cache.enabled:
+            # 基础 config.json / config.toml 的内容和 Server 的裁剪默认值也会影响输出，一并计入缓存键
+            cache_key = self.result_cache.make_key(input_path, config, config.input_sha256, config_path[engine],
+                                                   self.cropper.effective_settings(config))
+            cached = self.result_cache.lookup(cache_key, input_path, output_folder)
+            if cached:
+                print(f"⚡ [Zotero PDF2zh Server] 命中翻译缓存, 复用 {len(cached)} 个文件: {os.path.basename(input_path)}")
+                return self._complete_job_files(task_id, cached, f'命中翻译缓存, 复用 {len(cached)} 个文件')
+
         if engine == pdf2zh:
             print("🔍 [Zotero PDF2zh Server] PDF2zh 开始翻译文件...")
-            fileList = self.translate_pdf(input_path, config, task_id)
+            with usage_tracker.timed('translate'):
+                fileList = self.translate_pdf(input_path, config, task_id)
+            cancel_registry.check(task_id)
             mono_path, dual_path = fileList[0], fileList[1]
+            # 同一个源文件的所有后处理输出一次打开、一并生成（见 Cropper.crop_many）
             if config.mono_cut:
                 mono_cut_path = self.get_filename_after_process(mono_path, 'mono-cut', engine)
-                self.cropper.crop_pdf(config, mono_path, 'mono', mono_cut_path, 'mono-cut')
+                cancel_registry.add_outputs(task_id, [mono_cut_path])
+                self.cropper.crop_many(config, mono_path, [('mono-cut', mono_cut_path)])
                 addFileList(fileList, mono_cut_path)
+            dual_targets = []
             if config.dual_cut:
-                dual_cut_path = self.get_filename_after_process(dual_path, 'dual-cut', engine)
-                self.cropper.crop_pdf(config, dual_path, 'dual', dual_cut_path, 'dual-cut')
-                addFileList(fileList, dual_cut_path)
+                dual_targets.append(('dual-cut', self.get_filename_after_process(dual_path, 'dual-cut', engine)))
             if config.crop_compare:
-                crop_compare_path = self.get_filename_after_process(dual_path, 'crop-compare', engine)
-                self.cropper.crop_pdf(config, dual_path, 'dual', crop_compare_path, 'crop-compare')
-                addFileList(fileList, crop_compare_path)
+                dual_targets.append(('crop-compare', self.get_filename_after_process(dual_path, 'crop-compare', engine)))
             if config.compare and config.babeldoc == False: # babeldoc不支持compare
-                compare_path = self.get_filename_after_process(dual_path, 'compare', engine)
-                self.cropper.merge_pdf(dual_path, compare_path)
-                addFileList(fileList, compare_path)
+                dual_targets.append(('compare', self.get_filename_after_process(dual_path, 'compare', engine)))
+            if dual_targets:
+                cancel_registry.add_outputs(task_id, [target for _, target in dual_targets])
+                self.cropper.crop_many(config, dual_path, dual_targets)
+                for _, target_path in dual_targets:
+                    addFileList(fileList, target_path)
 
         elif engine == pdf2zh_next:
             print("🔍 [Zotero PDF2zh Server] PDF2zh_next 开始翻译文件...")
@@ -551,7 +925,9 @@ class PDFTranslator:
                 raise ValueError("⚠️ [Zotero PDF2zh Server] pdf2zh_next 引擎至少需要生成 mono 或 dual 文件, 请检查 no_dual 和 no_mono 配置项")
 
             fileList = []
-            retList = self.translate_pdf_next(input_path, config, task_id)
+            with usage_tracker.timed('translate'):
+                retList = self.translate_pdf_next(input_path, config, task_id)
+            cancel_registry.check(task_id)
 
             if config.no_mono:
                 dual_path = retList[0]
@@ -572,51 +948,57 @@ class PDFTranslator:
                 primary_dual_path = self._canonicalize_pdf2zh_next_dual(dual_path, config.dual_mode)
                 if config.dual_mode == 'LR':
                     LR_dual_path = primary_dual_path
-                    if config.dual_cut or config.crop_compare:
-                        _, TB_dual_path = self.cropper.pdf_dual_mode(primary_dual_path, 'LR', 'TB')
                 else:
                     TB_dual_path = primary_dual_path
 
-                if config.dual:
-                    fileList.append(primary_dual_path)
+            def tb_dual():
+                # LR 输出只在 dual-cut / crop-compare 真正需要时才拆成 TB（已生成过的直接复用）
+                nonlocal TB_dual_path
+                if TB_dual_path is None and LR_dual_path:
+                    _, TB_dual_path = self.cropper.pdf_dual_mode(LR_dual_path, 'LR', 'TB', config.save_profile)
+                return TB_dual_path
+
+            if not config.no_dual and config.dual:
+                fileList.append(primary_dual_path)
 
             if config.mono_cut:
                 mono_cut_path = self.get_filename_after_process(mono_path, 'mono-cut', engine)
-                self.cropper.crop_pdf(config, mono_path, 'mono', mono_cut_path, 'mono-cut')
+                cancel_registry.add_outputs(task_id, [mono_cut_path])
+                self.cropper.crop_many(config, mono_path, [('mono-cut', mono_cut_path)])
                 addFileList(fileList, mono_cut_path)
 
-            if config.dual_cut:
-                if not TB_dual_path:
-                    raise ValueError("dual-cut 需要 TB dual 输入，但未能准备该布局。")
-                dual_cut_path = self.get_filename_after_process(TB_dual_path, 'dual-cut', engine)
-                self.cropper.crop_pdf(config, TB_dual_path, 'dual', dual_cut_path, 'dual-cut')
-                addFileList(fileList, dual_cut_path)
-
-            if config.crop_compare:
-                if not TB_dual_path:
-                    raise ValueError("crop-compare 需要 TB dual 输入，但未能准备该布局。")
-                crop_compare_path = self.get_filename_after_process(TB_dual_path, 'crop-compare', engine)
-                self.cropper.crop_pdf(config, TB_dual_path, 'dual', crop_compare_path, 'crop-compare')
-                addFileList(fileList, crop_compare_path)
-
-            if config.compare:
-                if config.dual_mode == 'LR':
-                    if not LR_dual_path:
-                        raise ValueError("compare 需要 LR dual 输入，但未能准备该布局。")
-                    compare_path = self.get_filename_after_process(LR_dual_path, 'compare', engine)
-                    if os.path.exists(compare_path):
-                        os.remove(compare_path)
-                    shutil.copyfile(LR_dual_path, compare_path)
-                    addFileList(fileList, compare_path)
-                else:
-                    if not TB_dual_path:
-                        raise ValueError("compare 需要 TB dual 输入，但未能准备该布局。")
-                    compare_path = self.get_filename_after_process(TB_dual_path, 'compare', engine)
-                    self.cropper.merge_pdf(TB_dual_path, compare_path)
-                    addFileList(fileList, compare_path)
+            # dual-cut / crop-compare / (TB 模式的) compare 都从 TB dual 派生：一次打开、一并生成
+            tb_targets = []
+            if config.dual_cut or config.crop_compare or (config.compare and config.dual_mode != 'LR'):
+                if not tb_dual():
+                    raise ValueError("dual-cut / crop-compare / compare 需要 TB dual 输入，但未能准备该布局。")
+                if config.dual_cut:
+                    tb_targets.append(('dual-cut', self.get_filename_after_process(TB_dual_path, 'dual-cut', engine)))
+                if config.crop_compare:
+                    tb_targets.append(('crop-compare', self.get_filename_after_process(TB_dual_path, 'crop-compare', engine)))
+                if config.compare and config.dual_mode != 'LR':
+                    tb_targets.append(('compare', self.get_filename_after_process(TB_dual_path, 'compare', engine)))
+            if tb_targets:
+                cancel_registry.add_outputs(task_id, [target for _, target in tb_targets])
+                self.cropper.crop_many(config, TB_dual_path, tb_targets)
+
+            compare_path = None
+            if config.compare and config.dual_mode == 'LR':
+                if not LR_dual_path:
+                    raise ValueError("compare 需要 LR dual 输入，但未能准备该布局。")
+                compare_path = self.get_filename_after_process(LR_dual_path, 'compare', engine)
+                # LR dual 本身就是左右对照布局：硬链接过去即可，不复制字节
+                place_file(LR_dual_path, compare_path)
+
+            # 保持原有的文件顺序：dual-cut, crop-compare, compare
+            for _, target_path in tb_targets:
+                addFileList(fileList, target_path)
+            if compare_path:
+                addFileList(fileList, compare_path)
         else:
             raise ValueError(f"⚠️ [Zotero PDF2zh Server] 输入了不支持的翻译引擎: {engine}, 目前脚本仅支持: pdf2zh/pdf2zh_next")
 
+        cancel_registry.check(task_id)
         existing = [p for p in fileList if os.path.exists(p)]
         missing  = [p for p in fileList if not os.path.exists(p)]
 
@@ -630,6 +1012,12 @@ class PDFTranslator:
             task_manager.complete_task(task_id, 'failed', '操作失败，请查看详细日志。', error='无文件生成')
             return {'status': 'error', 'message': '操作失败，请查看详细日志。'}
 
+        if cache_key:
+            try:
+                self.result_cache.store(cache_key, input_path, existing)
+            except Exception as exc:
+                print(f"⚠️ [Zotero PDF2zh Server] 写入翻译缓存失败, 不影响本次结果: {exc}")
+
         payload = self._success_files_payload(existing)
         task_manager.complete_task(
             task_id,
@@ -643,7 +1031,15 @@ class PDFTranslator:
         return payload
 
     def _handle_exception(self, exc, status_code=500, context=None):
-        return jsonify(self._exception_payload(exc, context=context)), status_code
+        payload = self._exception_payload(exc, context=context)
+        if isinstance(exc, UploadMissingError):
+            # fileSha256 引用的 PDF 已被上传库淘汰：插件据此改为直接上传文件后重试
+            payload['errorType'] = 'UploadMissing'
+            status_code = 410
+        elif isinstance(exc, (UploadTooLargeError, RequestEntityTooLarge)):
+            payload['errorType'] = 'UploadTooLarge'
+            status_code = 413
+        return jsonify(payload), status_code
 
     def _exception_payload(self, exc, context=None):
         if context:
@@ -737,7 +1133,7 @@ class PDFTranslator:
                 # Crop means a crop result, not merely a layout conversion.
                 # Normalize LR -> alternating-page TB internally, then continue
                 # through the normal dual -> dual-cut operation.
-                _, source_path = self.cropper.pdf_dual_mode(input_path, 'LR', 'TB')
+                _, source_path = self.cropper.pdf_dual_mode(input_path, 'LR', 'TB', config.save_profile)
 
             new_type = self.get_filetype_after_crop(input_path)
             if new_type == 'unknown':
@@ -794,10 +1190,17 @@ class PDFTranslator:
             return self._handle_exception(e, context='/crop-compare')
 
     def _execute_crop_compare_job(self, task_id, input_path, config, engine, infile_type):
+        return self._run_metered_job(
+            task_id, config,
+            lambda: self._run_crop_compare_job(task_id, input_path, config, engine, infile_type),
+        )
+
+    def _run_crop_compare_job(self, task_id, input_path, config, engine, infile_type):
         if infile_type == 'origin':
             if engine == pdf2zh or engine != pdf2zh_next:
                 config.engine = 'pdf2zh'
-                fileList = self.translate_pdf(input_path, config, task_id)
+                with usage_tracker.timed('translate'):
+                    fileList = self.translate_pdf(input_path, config, task_id)
                 input_path = fileList[1]
                 if not os.path.exists(input_path):
                     raise FileNotFoundError(f'Dual file not found: {input_path}')
@@ -806,7 +1209,8 @@ class PDFTranslator:
                 config.dual_mode = 'TB'
                 config.no_dual = False
                 config.no_mono = True
-                fileList = self.translate_pdf_next(input_path, config, task_id)
+                with usage_tracker.timed('translate'):
+                    fileList = self.translate_pdf_next(input_path, config, task_id)
                 input_path = fileList[0]
                 if not os.path.exists(input_path):
                     raise FileNotFoundError(f'Dual file not found: {input_path}')
@@ -814,11 +1218,11 @@ class PDFTranslator:
         infile_type = self.get_filetype(input_path)
         if infile_type == 'dual-cut':
             new_path = self.get_filename_after_process(input_path, 'crop-compare', engine)
-            self.cropper.merge_pdf(input_path, new_path)
+            self.cropper.merge_pdf(input_path, new_path, config.save_profile)
         elif infile_type == 'dual':
             source_path = input_path
             if self.get_dual_mode(input_path, config.dual_mode) == 'LR':
-                _, source_path = self.cropper.pdf_dual_mode(input_path, 'LR', 'TB')
+                _, source_path = self.cropper.pdf_dual_mode(input_path, 'LR', 'TB', config.save_profile)
             new_path = self.get_filename_after_process(input_path, 'crop-compare', engine)
             self.cropper.crop_pdf(config, source_path, 'dual', new_path, 'crop-compare')
         else:
@@ -871,10 +1275,17 @@ class PDFTranslator:
             return self._handle_exception(e, context='/compare')
 
     def _execute_compare_job(self, task_id, input_path, config, engine, infile_type):
+        return self._run_metered_job(
+            task_id, config,
+            lambda: self._run_compare_job(task_id, input_path, config, engine, infile_type),
+        )
+
+    def _run_compare_job(self, task_id, input_path, config, engine, infile_type):
         if infile_type == 'origin':
             if engine == pdf2zh or engine != pdf2zh_next:
                 config.engine = 'pdf2zh'
-                fileList = self.translate_pdf(input_path, config, task_id)
+                with usage_tracker.timed('translate'):
+                    fileList = self.translate_pdf(input_path, config, task_id)
                 input_path = fileList[1]
                 if not os.path.exists(input_path):
                     raise FileNotFoundError(f'Dual file not found: {input_path}')
@@ -882,7 +1293,8 @@ class PDFTranslator:
                 config.dual_mode = 'LR'
                 config.no_dual = False
                 config.no_mono = True
-                fileList = self.translate_pdf_next(input_path, config, task_id)
+                with usage_tracker.timed('translate'):
+                    fileList = self.translate_pdf_next(input_path, config, task_id)
                 dual_path = fileList[0]
                 if not os.path.exists(dual_path):
                     raise FileNotFoundError(f'Dual file not found: {dual_path}')
@@ -902,11 +1314,9 @@ class PDFTranslator:
 
         new_path = self.get_filename_after_process(input_path, 'compare', engine)
         if self.get_dual_mode(input_path, config.dual_mode) == 'LR':
-            if os.path.exists(new_path):
-                os.remove(new_path)
-            shutil.copyfile(input_path, new_path)
+            place_file(input_path, new_path)
         else:
-            self.cropper.merge_pdf(input_path, new_path)
+            self.cropper.merge_pdf(input_path, new_path, config.save_profile)
 
         if not os.path.exists(new_path):
             raise RuntimeError(f'Compare failed: {new_path} not found')
@@ -1012,7 +1422,11 @@ class PDFTranslator:
 
     def translate_pdf(self, input_path, config, task_id=None):
         # TODO: 如果翻译失败了, 自动执行跳过字体子集化, 并且显示生成的文件的大小
-        config.update_config_file(config_path[pdf2zh])
+        # 每个任务使用独立的配置文件副本，任务结束后删除；共享的 config.json 只读
+        with config.job_config_file(config_path[pdf2zh]) as job_config_path:
+            return self._run_translate_pdf(input_path, config, task_id, job_config_path)
+
+    def _run_translate_pdf(self, input_path, config, task_id, job_config_path):
         if config.targetLang == 'zh-CN': # TOFIX, pdf2zh 1.x converter没有通过
             config.targetLang = 'zh'
         if config.sourceLang == 'zh-CN': # TOFIX, pdf2zh 1.x converter没有通过
@@ -1025,7 +1439,7 @@ class PDFTranslator:
             '--service', str(config.service),
             '--lang-in', str(config.sourceLang),
             '--lang-out', str(config.targetLang),
-            '--config', str(config_path[pdf2zh]), # 使用默认的config path路径
+            '--config', str(job_config_path), # 本任务独立的config文件
         ]
 
         if config.skip_last_pages and config.skip_last_pages > 0:
@@ -1036,14 +1450,6 @@ class PDFTranslator:
         if config.babeldoc:
             print("🔍 [Zotero PDF2zh Server] 目前不推荐使用pdf2zh 1.x + babeldoc, 如有需要，请直接使用pdf2zh_next")
             cmd.append('--babeldoc')
-        try:
-            # 使用 execute_with_progress 替代原来的 execute_in_env / subprocess.run
-            # 实时解析子进程输出中的进度信息并更新 task_manager
-            execute_with_progress(cmd, task_id, args, self.env_manager if args.enable_venv else None)
-        except subprocess.CalledProcessError as e:
-            print(f"⚠️ 翻译失败, 错误信息: {e}, 尝试跳过字体子集化, 重新渲染\n")
-            cmd.append('--skip-subset-fonts')
-            execute_with_progress(cmd, task_id, args, self.env_manager if args.enable_venv else None)
         fileName = os.path.basename(input_path).replace('.pdf', '')
         if config.babeldoc:
             output_path_mono = os.path.join(output_folder, f"{fileName}.{config.targetLang}.mono.pdf")
@@ -1052,6 +1458,15 @@ class PDFTranslator:
             output_path_mono = os.path.join(output_folder, f"{fileName}-mono.pdf")
             output_path_dual = os.path.join(output_folder, f"{fileName}-dual.pdf")
         output_files = [output_path_mono, output_path_dual]
+        cancel_registry.add_outputs(task_id, output_files)
+        try:
+            # 使用 execute_with_progress 替代原来的 execute_in_env / subprocess.run
+            # 实时解析子进程输出中的进度信息并更新 task_manager
+            execute_with_progress(cmd, task_id, args, self.env_manager if args.enable_venv else None)
+        except subprocess.CalledProcessError as e:
+            print(f"⚠️ 翻译失败, 错误信息: {e}, 尝试跳过字体子集化, 重新渲染\n")
+            cmd.append('--skip-subset-fonts')
+            execute_with_progress(cmd, task_id, args, self.env_manager if args.enable_venv else None)
         for f in output_files: # 显示生成
             if not os.path.exists(f):
                 print(f"⚠️ 未找到期望生成的文件: {f}")
@@ -1071,8 +1486,11 @@ class PDFTranslator:
         }
         if config.service in service_map:
             config.service = service_map[config.service]
-        config.update_config_file(config_path[pdf2zh_next])
+        # 每个任务使用独立的配置文件副本，任务结束后删除；共享的 config.toml 只读
+        with config.job_config_file(config_path[pdf2zh_next]) as job_config_path:
+            return self._run_translate_pdf_next(input_path, config, task_id, job_config_path)
 
+    def _run_translate_pdf_next(self, input_path, config, task_id, job_config_path):
         cmd = [
             pdf2zh_next,
             input_path,
@@ -1081,7 +1499,7 @@ class PDFTranslator:
             '--output', str(output_folder),
             '--lang-in', str(config.sourceLang),
             '--lang-out', str(config.targetLang),
-            '--config-file', str(config_path[pdf2zh_next]), # 使用默认的config path路径
+            '--config-file', str(job_config_path), # 本任务独立的config文件
         ]
         # TODO: 增加术语表的地址
         if config.no_watermark:
@@ -1138,6 +1556,8 @@ class PDFTranslator:
             if not config.no_dual:
                 output_path.append(watermark_dual)
 
+        cancel_registry.add_outputs(task_id, output_path)
+        shard_ranges = self._next_shard_ranges(input_path, config)
         if args.enable_winexe and os.path.exists(args.winexe_path):
             cmd = [f"{args.winexe_path}"] + cmd[1:]  # Windows可执行文件
             # 将所有是路径的字段, 改为os.path.normpath
@@ -1180,14 +1600,15 @@ class PDFTranslator:
                 )
 
                 stderr_lines = []
-                if process.stderr:
-                    for line in process.stderr:
-                        stderr_lines.append(line)
-                        sys.stderr.write(line)
-                        sys.stderr.flush()
-                    process.stderr.close()
-
-                return_code = process.wait()
+                with cancel_registry.process(task_id, process.pid):
+                    if process.stderr:
+                        for line in process.stderr:
+                            stderr_lines.append(line)
+                            sys.stderr.write(line)
+                            sys.stderr.flush()
+                        process.stderr.close()
+                    return_code = process.wait()
+                cancel_registry.check(task_id)
                 if return_code != 0:
                     stderr_text = ''.join(stderr_lines)
                     value_error = self._extract_value_error(stderr_text)
@@ -1200,7 +1621,7 @@ class PDFTranslator:
             else:
                 # 回退模式：静默模式（旧行为）
                 print("🔇 [winexe] mode=silent")
-                r = subprocess.run(
+                process = subprocess.Popen(
                     cmd,
                     shell=False,
                     cwd=exe_dir,
@@ -1210,17 +1631,16 @@ class PDFTranslator:
                     text=True,
                     encoding="utf-8"
                 )
-                if r.returncode != 0:
-                    value_error = self._extract_value_error(r.stderr or '')
+                with cancel_registry.process(task_id, process.pid):
+                    stdout, stderr = process.communicate()
+                cancel_registry.check(task_id)
+                if process.returncode != 0:
+                    value_error = self._extract_value_error(stderr or '')
                     if value_error:
                         raise ValueError(value_error)
-                    raise RuntimeError(f"pdf2zh.exe 退出码 {r.returncode}\nstdout:\n{r.stdout}\nstderr:\n{r.stderr}")
-        elif args.enable_venv:
-            # 使用 execute_with_progress 替代原来的 execute_in_env
-            # 实时解析子进程输出中的进度信息并更新 task_manager
-            execute_with_progress(cmd, task_id, args, self.env_manager)
+                    raise RuntimeError(f"pdf2zh.exe 退出码 {process.returncode}\nstdout:\n{stdout}\nstderr:\n{stderr}")
         else:
-            execute_with_progress(cmd, task_id, args, None)
+            self._run_next_with_retries(cmd, input_path, config, task_id, shard_ranges, output_path)
         existing = [p for p in output_path if os.path.exists(p)]
 
         for f in existing:
@@ -1232,6 +1652,124 @@ class PDFTranslator:
 
         return existing
 
+    def _run_next_with_retries(self, cmd, input_path, config, task_id, shard_ranges, output_path):
+        """运行 pdf2zh_next；因卡住被 job_watchdog 结束时，只把没完成的页码范围拆小后重试。
+
+        分片翻译时已完成的分片保留输出，只有卡住时仍在运行的分片各拆成两半重跑，
+        已经调用过翻译 API 的页不会再付一次费；不分片时卡住则把整份拆成两个分片重跑。
+        上游接口卡在某一批段落上时，拆小后各进程的请求互不阻塞。
+        超过总时长预算、被取消或不能分片时不重试。
+        """
+        retries = job_watchdog.retry_count(config.stall_retries)
+        attempt = 0
+        plan = None
+        try:
+            while True:
+                try:
+                    if plan is None and shard_ranges:
+                        plan = ShardPlan(os.path.join(output_folder, f".shards-{uuid.uuid4().hex}"), shard_ranges)
+                    if plan is not None:
+                        self._run_next_shards(cmd, config, task_id, plan, output_path)
+                    else:
+                        # 实时解析子进程输出中的进度信息并更新 task_manager
+                        execute_with_progress(cmd, task_id, args, self.env_manager if args.enable_venv else None)
+                    return
+                except JobTimeout as e:
+                    if e.kind != 'stall' or attempt >= retries or not self._can_shard_next(config):
+                        raise
+                    attempt += 1
+                    if plan is None:
+                        shard_ranges = page_shards(1, self._next_last_page(input_path, config), 2, min_pages=1)
+                    else:
+                        plan.split_pending()
+                    cancel_registry.clear_breach(task_id, e)
+                    job_watchdog.record_retry()
+                    pending = [shard['range'] for shard in plan.pending()] if plan is not None else shard_ranges
+                    print(f"🔁 [Zotero PDF2zh Server] {e}，第 {attempt}/{retries} 次重试, 只重跑页码 {pending}")
+                    task_manager.report_progress(task_id, {'status': 'running', 'message': f'翻译卡住, 第 {attempt} 次重试'})
+        finally:
+            if plan is not None:
+                shutil.rmtree(plan.root, ignore_errors=True)
+
+    def _can_shard_next(self, config):
+        """Windows 下进度是从共享的控制台缓冲区读取的，分不清各分片的输出；
+        自动提取的术语表按分片各写一份，也没法合并，这两种情况都不分片。
+        """
+        return sys.platform != 'win32' and not config.save_auto_extracted_glossary
+
+    def _next_last_page(self, input_path, config):
+        last_page = len(PdfReader(input_path).pages)
+        if config.skip_last_pages and config.skip_last_pages > 0:
+            last_page -= config.skip_last_pages
+        return last_page
+
+    def _next_shard_ranges(self, input_path, config):
+        """pdf2zh_next 分片翻译的页码范围 [(first, last), ...]；不分片时返回 None。"""
+        if args.next_shards <= 1 or not self._can_shard_next(config):
+            return None
+        ranges = page_shards(1, self._next_last_page(input_path, config), args.next_shards, args.next_shard_min_pages)
+        return ranges if len(ranges) > 1 else None
+
+    def _run_next_shards(self, cmd, config, task_id, plan, output_path):
+        """plan 中每个未完成的页码范围一个 pdf2zh_next 进程并发翻译，再按页序把 mono/dual 拼回 output_path。
+
+        各分片写到自己的临时目录（文件名相同），只输出本分片翻译的页；
+        qps / pool 按本轮运行的分片数平分，合计不超过用户为该服务设置的上限。
+        成功结束的分片标记为完成，之后重试时不再运行。
+        """
+        base_cmd = []
+        skip = False
+        for arg in cmd:
+            if skip:
+                skip = False
+            elif arg in ('--output', '--pages', '--qps', '--pool-max-worker'):
+                skip = True
+            else:
+                base_cmd.append(arg)
+        pending = plan.pending()
+        qps = max(1, int(config.qps) // len(pending))
+        pool_size = config.pool_size // len(pending) if config.pool_size else 0
+
+        ranges = [shard['range'] for shard in plan.shards]
+        print(f"🧩 [Zotero PDF2zh Server] pdf2zh_next 分片翻译: {len(pending)} 个进程, "
+              f"页码 {[shard['range'] for shard in pending]}, 每个进程 qps={qps}")
+        progress = ShardProgress(task_id, ranges, {index for index, shard in enumerate(plan.shards) if shard['done']})
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix='pdf2zh-shard') as pool:
+            futures = []
+            for shard in pending:
+                first, last = shard['range']
+                os.makedirs(shard['dir'], exist_ok=True)
+                shard_cmd = base_cmd + [
+                    '--output', shard['dir'],
+                    '--pages', f'{first}-{last}',
+                    '--only-include-translated-page',
+                    '--qps', str(qps),
+                ]
+                if pool_size > 1:
+                    shard_cmd.extend(['--pool-max-worker', str(pool_size)])
+                futures.append(pool.submit(
+                    execute_with_progress, shard_cmd, task_id, args,
+                    self.env_manager if args.enable_venv else None, progress.reporter(plan.shards.index(shard)),
+                ))
+            # 等所有分片结束再抛错，这样才知道哪些分片已经完成、重试时可以跳过
+            errors = []
+            for shard, future in zip(pending, futures):
+                try:
+                    future.result()
+                    shard['done'] = True
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            # 真正的失败优先于卡住 / 取消：前者不应该触发重试
+            raise next((e for e in errors if not isinstance(e, (JobTimeout, JobCancelled))), errors[0])
+
+        for path in output_path:
+            parts = plan.parts(os.path.basename(path))
+            missing = [part for part in parts if not os.path.exists(part)]
+            if missing:
+                raise RuntimeError(f"分片翻译没有生成文件: {missing}")
+            stitch_pdfs(parts, path)
+
     def run(self, host, port, debug=False):
         print(f"🌐 Server将启动在: http://{host}:{port}")
         print(f"📊 翻译进度监控页面: http://localhost:{port}/")
@@ -1249,6 +1787,8 @@ def prepare_path():
     # Never overwrite an existing user config with the .example template.
     # Migration only adds missing defaults; user/custom values always win.
     prepare_config_files(config_path)
+    # 清理上次异常退出时残留的任务配置副本
+    cleanup_job_config_files(config_folder)
 
 # ================================================================================
 # ######################### 主程序入口 ############################
@@ -1280,6 +1820,29 @@ if __name__ == '__main__':
     parser.add_argument('--winexe_path', type=str, default='./pdf2zh-v2.6.3-BabelDOC-v0.5.7-win64/pdf2zh/pdf2zh.exe', help='Windows可执行文件的路径')
     parser.add_argument('--winexe_attach_console', type=str2bool, default=True, help='Winexe模式是否尝试附着父控制台显示实时日志 (默认True)')
     parser.add_argument('--skip_install', type=str2bool, default=False, help='跳过虚拟环境中的安装')
+    parser.add_argument('--result_cache', type=str2bool, default=True, help='相同 PDF + 相同翻译配置时直接复用之前的翻译结果')
+    parser.add_argument('--result_cache_max_entries', type=int, default=DEFAULT_CACHE_ENTRIES, help='翻译结果缓存最多保留的条目数')
+    parser.add_argument('--result_cache_max_mb', type=int, default=DEFAULT_CACHE_MB, help='翻译结果缓存最多占用的磁盘空间 (MB)')
+    parser.add_argument('--upload_max_mb', type=int, default=DEFAULT_MAX_UPLOAD_MB, help='单个上传 PDF 最大多少 MB (所有上传方式), 超过时中止并返回 413')
+    parser.add_argument('--upload_store_max_mb', type=int, default=DEFAULT_UPLOAD_STORE_MB, help='按哈希去重的上传文件库最多占用的磁盘空间 (MB)')
+    parser.add_argument('--task_store', type=str2bool, default=True, help='把任务状态和历史记录写入磁盘日志, Server 重启后仍可查询已完成任务的结果')
+    parser.add_argument('--task_store_days', type=int, default=DEFAULT_TASK_STORE_DAYS, help='任务日志保留的天数')
+    parser.add_argument('--task_store_max_entries', type=int, default=DEFAULT_TASK_STORE_ENTRIES, help='任务日志最多保留的任务数')
+    parser.add_argument('--task_retention_seconds', type=float, default=DEFAULT_RETENTION_SECONDS, help='任务完成后在进度页面上保留的秒数')
+    parser.add_argument('--progress_hz', type=float, default=DEFAULT_PROGRESS_HZ, help='每个任务的进度每秒最多刷新几次, 期间的更新合并后发布; 0 表示不限制')
+    parser.add_argument('--crop_workers', type=int, default=0, help='裁剪/拆分 PDF 时使用的进程数, 0 表示按 CPU 核数自动选择, 1 表示单进程')
+    parser.add_argument('--crop_parallel_min_pages', type=int, default=DEFAULT_CROP_PARALLEL_MIN_PAGES, help='页数达到该值时才分块并行裁剪')
+    parser.add_argument('--save_profile', type=str, default=DEFAULT_SAVE_PROFILE, choices=sorted(SAVE_PROFILES), help='裁剪/对照输出的保存方式: fast 最快, balanced 默认, compact 文件最小 (会重新压缩高分辨率图片)')
+    parser.add_argument('--crop_engine', type=str, default=DEFAULT_CROP_ENGINE, choices=list(CROP_ENGINES), help='裁剪方式: redact 始终完整擦除框外内容 (默认, 最慢); auto 逐页判断, 没有文字/图片跨在裁剪框边界上时不擦除, 否则只擦除文字和图片 (保留矢量图形)')
+    parser.add_argument('--crop_layout', type=str, default=DEFAULT_CROP_LAYOUT, choices=list(CROP_LAYOUTS), help='裁剪版面: fixed 所有页使用 pdf_w_offset 等参数算出的固定裁剪框 (默认); auto 按文字逐页识别分栏, 按文字/矢量图形/图片确定左右边界, 仍遵守 pdf_w_offset 等边距 (需要 NumPy, 结果按文件哈希缓存)')
+    parser.add_argument('--merge_memory_mb', type=int, default=DEFAULT_MERGE_MEMORY_MB, help='双语对照(compare)合并的内存上限 (MB), 估计超过时按批合并并写出分块文件后拼接; 0 表示不分块')
+    parser.add_argument('--next_shards', type=int, default=DEFAULT_SHARDS, help='pdf2zh_next 长文档按页码拆成的并发进程数, 1 表示不拆分 (qps 按进程数平分)')
+    parser.add_argument('--next_shard_min_pages', type=int, default=DEFAULT_SHARD_MIN_PAGES, help='pdf2zh_next 每个分片至少包含的页数, 页数不够时减少分片')
+    parser.add_argument('--warm_workers', type=int, default=DEFAULT_WARM_WORKERS, help='每个翻译环境常驻的 pdf2zh_next 进程数 (仅 macOS/Linux), 在第一个 pdf2zh_next 任务时启动, 没有空闲进程时仍走命令行; 0 表示关闭')
+    parser.add_argument('--stall_timeout', type=float, default=DEFAULT_STALL_TIMEOUT, help='翻译进程多少秒没有进度变化就视为卡住并结束 (例如上游接口无响应); 只有解析出的进度才算活动, 请设得比首次下载模型等没有进度的阶段更长; 0 表示不检查 (默认)')
+    parser.add_argument('--job_timeout', type=float, default=DEFAULT_JOB_TIMEOUT, help='单个翻译任务最多运行的秒数 (含重试), 超过后结束并标记失败; 0 表示不限制')
+    parser.add_argument('--stall_retries', type=int, default=DEFAULT_STALL_RETRIES, help='pdf2zh_next 卡住后重试的次数: 已完成的分片保留, 只把未完成的页码范围拆小重跑; 0 表示不重试')
+    parser.add_argument('--max_concurrent_jobs', type=int, default=DEFAULT_MAX_CONCURRENT_JOBS, help='同时运行的翻译任务数, 其余任务按提交顺序排队')
     args = parser.parse_args()
     # 2. 打印提示信息
     print("\n===== 💡提示💡 =====")
@@ -1441,5 +2004,10 @@ if __name__ == '__main__':
     # 7. 配置迁移 + 正常启动。VirtualEnvManager 会在这里对已有用户
     #    每个 Server 版本最多询问一次是否安全更新翻译环境。
     prepare_path()
+    job_scheduler.set_max_workers(args.max_concurrent_jobs)
+    task_manager.set_retention(args.task_retention_seconds)
+    task_manager.set_progress_rate(args.progress_hz)
+    warm_pool.configure(args.warm_workers)
+    job_watchdog.configure(args.stall_timeout, args.job_timeout, args.stall_retries)
     translator = PDFTranslator(args)
     translator.run(args.host, args.port, debug=args.debug)
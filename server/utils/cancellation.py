@@ -0,0 +1,188 @@
+import atexit
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# 先发 SIGTERM，这么多秒后进程组仍在就 SIGKILL
+KILL_GRACE_SECONDS = 5
+
+
+class JobCancelled(Exception):
+    """Raised inside a job once its task has been cancelled."""
+
+
+class JobTimeout(Exception):
+    """Raised inside a job whose processes the watchdog terminated.
+
+    ``kind`` is ``'stall'`` (no progress for too long) or ``'budget'``
+    (total runtime exceeded).
+    """
+
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+def _kill_tree(pid, force=False):
+    try:
+        if sys.platform == 'win32':
+            subprocess.run(['taskkill', '/T', '/F', '/PID', str(pid)], capture_output=True, timeout=30)
+        else:
+            # 子进程都以 start_new_session / setsid 启动，pid 即进程组号
+            os.killpg(pid, signal.SIGKILL if force else signal.SIGTERM)
+    except (OSError, subprocess.SubprocessError):
+        pass
+
+
+class _Job:
+    def __init__(self):
+        self.started = time.time()
+        self.pids = set()
+        self.outputs = set()
+        self.cancelled = False
+        self.breach = None  # JobTimeout，由 terminate() 设置
+
+
+class CancelRegistry:
+    """Processes and output files of running jobs, so a task can be cancelled.
+
+    ``execute_with_progress`` and the winexe path register every translator
+    process (a process-group leader on POSIX); jobs register the files they
+    are about to write. ``cancel`` kills the process trees right away, and
+    ``finish`` removes the registered outputs this job created or modified.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}  # task_id -> _Job
+        atexit.register(self.kill_all)
+
+    def begin(self, task_id):
+        with self.lock:
+            self.jobs[task_id] = _Job()
+
+    def finish(self, task_id):
+        """任务线程结束时调用；已取消的任务删除本次写出的文件，返回删除的路径。"""
+        with self.lock:
+            job = self.jobs.pop(task_id, None)
+        if job is None or not job.cancelled:
+            return []
+        removed = []
+        for path in job.outputs:
+            try:
+                # 只删本任务开始之后写过的文件：同名的旧结果（可能被缓存引用）保留
+                if os.path.isfile(path) and os.path.getmtime(path) >= job.started:
+                    os.remove(path)
+                    removed.append(path)
+            except OSError as e:
+                print(f"⚠️ [Zotero PDF2zh Server] 清理取消任务的输出失败: {path}: {e}")
+        return removed
+
+    def is_cancelled(self, task_id):
+        with self.lock:
+            job = self.jobs.get(task_id)
+            return job is not None and job.cancelled
+
+    def check(self, task_id):
+        if task_id is None:
+            return
+        with self.lock:
+            job = self.jobs.get(task_id)
+            breach = job.breach if job is not None else None
+            cancelled = job is not None and job.cancelled
+        if cancelled:
+            raise JobCancelled(f"任务 {task_id} 已取消")
+        if breach is not None:
+            raise breach
+
+    def clear_breach(self, task_id, breach):
+        """重试前调用：之后启动的进程不再受这次超时影响（期间又发生的其他超时保留）。"""
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if job is not None and job.breach is breach:
+                job.breach = None
+
+    def add_outputs(self, task_id, paths):
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if job is not None:
+                job.outputs.update(os.path.abspath(path) for path in paths)
+
+    def add_process(self, task_id, pid):
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if job is None:
+                return
+            job.pids.add(pid)
+            cancelled = job.cancelled or job.breach is not None
+        if cancelled:  # 取消与启动撞在一起：刚启动的进程也不能留下
+            _kill_tree(pid, force=True)
+
+    def remove_process(self, task_id, pid):
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if job is not None:
+                job.pids.discard(pid)
+
+    @contextmanager
+    def process(self, task_id, pid):
+        self.add_process(task_id, pid)
+        try:
+            yield
+        finally:
+            self.remove_process(task_id, pid)
+
+    def cancel(self, task_id):
+        """标记取消并结束该任务的所有进程树；任务不在运行时返回 False。"""
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if job is None:
+                return False
+            job.cancelled = True
+            pids = list(job.pids)
+        self._kill(pids)
+        return True
+
+    def terminate(self, task_id, breach):
+        """结束该任务当前的所有进程树（不算取消），之后 check() 抛出 breach。"""
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if job is None:
+                return False
+            job.breach = breach
+            pids = list(job.pids)
+        self._kill(pids)
+        return True
+
+    def _kill(self, pids):
+        for pid in pids:
+            _kill_tree(pid)
+        if pids and sys.platform != 'win32':
+            timer = threading.Timer(KILL_GRACE_SECONDS, self._force_kill, (pids,))
+            timer.daemon = True
+            timer.start()
+
+    def _force_kill(self, pids):
+        # 进程由启动它的线程 wait() 回收之后才会 remove_process；已不在登记表里的 pid
+        # 说明进程已退出并被回收，该 pid 可能已被系统重新分配，不能再对它发信号
+        with self.lock:
+            registered = {pid for job in self.jobs.values() for pid in job.pids}
+        for pid in pids:
+            if pid in registered:
+                _kill_tree(pid, force=True)
+
+    def kill_all(self):
+        """Server 退出时结束所有仍在运行的翻译进程。"""
+        with self.lock:
+            pids = [pid for job in self.jobs.values() for pid in job.pids]
+        for pid in pids:
+            _kill_tree(pid, force=True)
+
+
+# global singleton
+cancel_registry = CancelRegistry()
@@ -0,0 +1,322 @@
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+import fitz
+
+try:
+    import numpy as np
+except ImportError:  # NumPy 是可选依赖：没有时 auto 布局退回固定裁剪框
+    np = None
+
+from utils.result_cache import file_sha256
+
+
+LAYOUT_DIRNAME = '.layouts'
+# 分析算法或参数变化时加一，旧的缓存结果自动失效
+LAYOUT_VERSION = 2
+# 版面方式：
+#   fixed - 所有页使用由 pdf_w_offset / pdf_h_offset / pdf_offset_ratio 算出的同一对裁剪框（默认）
+#   auto  - 按文字的位置逐页找栏间空白，按文字、矢量图形和图片找左右内容边界，单栏页整页裁剪
+CROP_LAYOUTS = ('auto', 'fixed')
+DEFAULT_CROP_LAYOUT = 'fixed'
+
+BINS = 400                # 页宽方向按页宽归一化后的分辨率
+GUTTER_BAND = (0.3, 0.7)  # 只在页面中部寻找栏间空白
+MIN_GUTTER = 0.015        # 栏间空白至少占页宽的比例（Letter 纸约 9pt），比词间距宽得多
+GUTTER_TOLERANCE = 0.04   # 栏间允许被这么高比例（相对页高）的文字压到，例如通栏标题、居中的小图注
+MIN_COLUMN_SHARE = 0.15   # 两栏各自至少要有这么多比例的文字面积，才算双栏
+CONTENT_PAD = 6           # 内容框外额外保留的边距 (pt)
+MEMORY_ENTRIES = 32
+# .layouts/ 目录最多保留的文档数，超过时按最近使用时间淘汰
+DISK_ENTRIES = 500
+
+
+def normalize_crop_layout(layout, default=DEFAULT_CROP_LAYOUT):
+    layout = str(layout or '').strip().lower()
+    return layout if layout in CROP_LAYOUTS else default
+
+
+class PageClips:
+    """每页要裁出的矩形列表：双栏页是 (左栏, 右栏)，单栏页只有一个内容框。
+
+    pages 中没有的页（fixed 布局、无文字的扫描页）使用 default。
+    实例可以直接当作 ``page_num -> rects`` 的函数使用。
+    """
+
+    def __init__(self, default, pages=None):
+        self.default = tuple(fitz.Rect(rect) for rect in default)
+        self.pages = {int(page_num): tuple(fitz.Rect(rect) for rect in rects)
+                      for page_num, rects in (pages or {}).items()}
+
+    def __call__(self, page_num):
+        return self.pages.get(page_num, self.default)
+
+    def to_values(self):
+        """可以 pickle 的形式，传给进程池 worker 后用 from_values 还原。"""
+        return (
+            tuple(tuple(rect) for rect in self.default),
+            {page_num: tuple(tuple(rect) for rect in rects) for page_num, rects in self.pages.items()},
+        )
+
+    @classmethod
+    def from_values(cls, values):
+        return cls(*values)
+
+
+def _normalize_boxes(rows, sizes):
+    boxes = np.array(rows, dtype=float).reshape(-1, 5)
+    page_idx = boxes[:, 0].astype(int)
+    boxes[:, [1, 3]] /= sizes[page_idx, 0:1]
+    boxes[:, [2, 4]] /= sizes[page_idx, 1:2]
+    boxes[:, 1:] = np.clip(boxes[:, 1:], 0, 1)
+    return boxes
+
+
+def _collect_boxes(src_doc):
+    """所有页的单词框和图形框 (页码, x0, y0, x1, y1)，以及页面尺寸；框按页宽 / 页高归一化。
+
+    用单词而不是文本块：按行交错写入两栏的 PDF 会被合并成横跨栏间的文本块。
+    图形框（矢量图形、图片）只用来确定内容边界，不参与找栏间空白。
+    """
+    words, graphics = [], []
+    sizes = np.empty((len(src_doc), 2))
+    for page_num, page in enumerate(src_doc):
+        rect = page.rect
+        sizes[page_num] = rect.width, rect.height
+        words.extend((page_num, *word[:4]) for word in page.get_text('words'))
+        shapes = [drawing['rect'] for drawing in page.get_drawings()]
+        shapes += [info['bbox'] for info in page.get_image_info()]
+        for shape in shapes:
+            shape = fitz.Rect(shape) & rect
+            if not shape.is_empty:
+                graphics.append((page_num, *shape))
+    return _normalize_boxes(words, sizes), _normalize_boxes(graphics, sizes), sizes
+
+
+def analyze_layout(src_doc, group=1):
+    """找出每页的栏间空白和内容边界，返回 ``{page_num: (rect, ...)}``。
+
+    每页的结果是 ``{'rect': 内容框, 'gutter': 栏间 x 坐标或 None, 'size': (宽, 高)}``，
+    与用户的边距设置无关（可以缓存），由 ``layout_clips`` 换算成裁剪框。
+    group=2 时 TB 双语 PDF 的译文页和原文页合并分析，两页得到相同的裁剪框。
+    没有文字的页不出现在结果中，由调用方使用固定裁剪框。
+    """
+    words, graphics, sizes = _collect_boxes(src_doc)
+    n_groups = -(-len(src_doc) // group)
+    if len(words) == 0:
+        return {}
+    gid = words[:, 0].astype(int) // group
+    x0, y0, x1, y1 = words[:, 1], words[:, 2], words[:, 3], words[:, 4]
+
+    # 1. 内容边界：所有单词、矢量图形和图片的外接框
+    content = np.empty((n_groups, 4))
+    content[:, :2] = np.inf
+    content[:, 2:] = -np.inf
+    for boxes in (words, graphics):
+        box_gid = boxes[:, 0].astype(int) // group
+        np.minimum.at(content[:, 0], box_gid, boxes[:, 1])
+        np.minimum.at(content[:, 1], box_gid, boxes[:, 2])
+        np.maximum.at(content[:, 2], box_gid, boxes[:, 3])
+        np.maximum.at(content[:, 3], box_gid, boxes[:, 4])
+    has_text = np.bincount(gid, minlength=n_groups) > 0
+
+    # 2. 文字沿页宽方向的覆盖高度（差分数组 + 累加）
+    b0 = np.floor(x0 * BINS).astype(int)
+    b1 = np.minimum(np.ceil(x1 * BINS).astype(int), BINS)
+    diff = np.zeros((n_groups, BINS + 1))
+    np.add.at(diff, (gid, b0), y1 - y0)
+    np.add.at(diff, (gid, b1), -(y1 - y0))
+    coverage = np.cumsum(diff, axis=1)[:, :BINS] / group
+
+    # 3. 页面中部最长的一段空白即栏间
+    lo, hi = int(GUTTER_BAND[0] * BINS), int(GUTTER_BAND[1] * BINS)
+    blank = coverage[:, lo:hi] <= GUTTER_TOLERANCE
+    idx = np.arange(hi - lo)
+    last_filled = np.maximum.accumulate(np.where(blank, -1, idx), axis=1)
+    run = np.where(blank, idx - last_filled, 0)
+    run_end = run.argmax(axis=1)
+    run_len = run.max(axis=1)
+    gutter = (lo + run_end + 1 - run_len / 2) / BINS
+
+    # 4. 栏间两侧都要有足够的文字，才算双栏
+    area = (x1 - x0) * (y1 - y0)
+    left = ((x0 + x1) / 2 < gutter[gid]).astype(float)
+    left_area = np.bincount(gid, weights=area * left, minlength=n_groups)
+    total_area = np.bincount(gid, weights=area, minlength=n_groups)
+    share = np.minimum(left_area, total_area - left_area) / np.maximum(total_area, 1e-9)
+    double = has_text & (run_len >= MIN_GUTTER * BINS) & (share >= MIN_COLUMN_SHARE)
+
+    pages = {}
+    for page_num in range(len(src_doc)):
+        g = page_num // group
+        if not has_text[g]:
+            continue
+        w, h = sizes[page_num]
+        rect = fitz.Rect(
+            max(0.0, content[g, 0] * w - CONTENT_PAD),
+            max(0.0, content[g, 1] * h - CONTENT_PAD),
+            min(w, content[g, 2] * w + CONTENT_PAD),
+            min(h, content[g, 3] * h + CONTENT_PAD),
+        )
+        pages[page_num] = {
+            'rect': tuple(rect),
+            'gutter': float(gutter[g] * w) if double[g] else None,
+            'size': (float(w), float(h)),
+        }
+    return pages
+
+
+def layout_clips(analysis, w_offset, h_offset, ratio):
+    """按用户的边距设置把 ``analyze_layout`` 的结果换算成每页的裁剪框 ``{page_num: (rect, ...)}``。
+
+    纵向保留整页高度（只去掉 pdf_h_offset），图表、公式不会因为上下没有文字被裁掉；
+    横向取内容边界，但不超出 pdf_w_offset 留出的边距；双栏页的左右两栏与固定裁剪框一样
+    在栏间各多留 pdf_w_offset / pdf_offset_ratio。
+    """
+    overlap = w_offset / ratio if ratio else 0
+    pages = {}
+    for page_num, page in analysis.items():
+        x0, _, x1, _ = page['rect']
+        w, h = page['size']
+        left, right = max(x0, w_offset), min(x1, w - w_offset)
+        top, bottom = h_offset, h - h_offset
+        if right <= left or bottom <= top:
+            continue
+        gutter = page['gutter']
+        if gutter is not None and left < gutter < right:
+            pages[page_num] = (
+                fitz.Rect(left, top, min(right, gutter + overlap), bottom),
+                fitz.Rect(max(left, gutter - overlap), top, right, bottom),
+            )
+        else:
+            pages[page_num] = (fitz.Rect(left, top, right, bottom),)
+    return pages
+
+
+class LayoutCache:
+    """Per-document cache of ``analyze_layout`` results, keyed by SHA-256.
+
+    Results are kept in memory and in ``.layouts/<sha256>.json`` next to the
+    PDF, so cropping the same document again (another mode, another request)
+    skips the analysis. The folder keeps at most ``max_disk_entries``
+    documents; the least recently used are removed first.
+    """
+
+    def __init__(self, max_entries=MEMORY_ENTRIES, max_disk_entries=DISK_ENTRIES):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.lock = threading.Lock()
+        self.file_lock = threading.Lock()  # 串行化 .layouts 文件的读-改-写和淘汰
+        self.entries = OrderedDict()  # (sha256, group) -> pages
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _path(input_pdf, sha256):
+        folder = os.path.join(os.path.dirname(os.path.abspath(input_pdf)), LAYOUT_DIRNAME)
+        return os.path.join(folder, sha256 + '.json')
+
+    def _load(self, path, group):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != LAYOUT_VERSION:
+            return None
+        pages = data.get('groups', {}).get(str(group))
+        if pages is None:
+            return None
+        try:
+            os.utime(path)  # 记录最近使用时间，淘汰时按它排序（缓存文件只属于本目录）
+        except OSError:
+            pass
+        return {int(page_num): page for page_num, page in pages.items()}
+
+    def _save(self, path, group, pages):
+        with self.file_lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('version') != LAYOUT_VERSION:
+                    data = {}
+            except (OSError, ValueError):
+                data = {}
+            data['version'] = LAYOUT_VERSION
+            data.setdefault('groups', {})[str(group)] = {str(page_num): page for page_num, page in pages.items()}
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._prune(os.path.dirname(path))
+
+    def _prune(self, folder):
+        # 调用方已持有 self.file_lock
+        entries = []
+        for name in os.listdir(folder):
+            if not name.endswith('.json'):
+                continue
+            full = os.path.join(folder, name)
+            try:
+                entries.append((os.stat(full).st_mtime, full))
+            except OSError:
+                continue
+        entries.sort()
+        for _, full in entries[:max(0, len(entries) - self.max_disk_entries)]:
+            try:
+                os.remove(full)
+            except OSError:
+                pass
+
+    def get(self, input_pdf, src_doc, group=1):
+        """返回 ``analyze_layout`` 的结果；NumPy 不可用时返回 None。"""
+        if np is None:
+            print("⚠️ [Cropper] 未安装 NumPy，无法自动识别分栏，使用固定裁剪框")
+            return None
+        sha256 = file_sha256(input_pdf)
+        key = (sha256, group)
+        path = self._path(input_pdf, sha256)
+        with self.lock:
+            pages = self.entries.get(key)
+            if pages is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return pages
+        pages = self._load(path, group)
+        cached = pages is not None
+        if not cached:
+            pages = analyze_layout(src_doc, group)
+            try:
+                self._save(path, group, pages)
+            except OSError as e:
+                print(f"⚠️ [Cropper] 版面分析结果写入失败: {e}")
+        with self.lock:
+            if cached:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self.entries[key] = pages
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        double = sum(1 for page in pages.values() if page['gutter'] is not None)
+        print(f"📐 [Cropper] 版面分析{'(缓存)' if cached else ''}: 双栏 {double} 页, "
+              f"单栏 {len(pages) - double} 页, 无文字(固定裁剪) {len(src_doc) - len(pages)} 页")
+        return pages
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# global singleton
+layout_cache = LayoutCache()
@@ -2,7 +2,12 @@
 # guaguastandup
 # zotero-pdf2zh
 import json, toml
+import copy
+import hashlib
 import os
+import tempfile
+import threading
+from contextlib import contextmanager
 
 from utils.config_map import pdf2zh_config_map, pdf2zh_next_config_map
 from utils.deepseek_thinking import (
@@ -25,6 +30,82 @@ def _safe_log_value(key, value):
     return value
 
 
+# 每个翻译任务使用独立的配置文件副本，放在基础配置所在目录的 jobs/ 子目录中。
+# 基础 config.json / config.toml 只读，不再在每次请求时被改写。
+JOB_CONFIG_DIRNAME = 'jobs'
+
+_base_config_cache = {}
+_base_config_digests = {}
+_base_config_lock = threading.Lock()
+
+
+def _load_base_config(config_file, loader):
+    """Parse the shared base config once per on-disk version and hand out copies."""
+    stat = os.stat(config_file)
+    key = os.path.abspath(config_file)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _base_config_lock:
+        cached = _base_config_cache.get(key)
+        if cached is None or cached[0] != stamp:
+            with open(config_file, 'r', encoding='utf-8') as f:
+                cached = (stamp, loader(f))
+            _base_config_cache[key] = cached
+        return copy.deepcopy(cached[1])
+
+
+def base_config_digest(config_file):
+    """SHA-256 of the base config's bytes, recomputed only when the file changes.
+
+    Every job config is materialized from this file, so anything set there
+    (model, prompts, babeldoc options...) can change the translated output.
+    """
+    try:
+        stat = os.stat(config_file)
+    except OSError:
+        return ''
+    key = os.path.abspath(config_file)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    with _base_config_lock:
+        cached = _base_config_digests.get(key)
+        if cached is None or cached[0] != stamp:
+            with open(config_file, 'rb') as f:
+                cached = (stamp, hashlib.sha256(f.read()).hexdigest())
+            _base_config_digests[key] = cached
+        return cached[1]
+
+
+def cleanup_job_config_files(config_folder):
+    """Remove per-job config copies left behind by an interrupted Server."""
+    job_dir = os.path.join(config_folder, JOB_CONFIG_DIRNAME)
+    if not os.path.isdir(job_dir):
+        return
+    for name in os.listdir(job_dir):
+        try:
+            os.remove(os.path.join(job_dir, name))
+        except OSError:
+            pass
+
+
+def _write_job_config(config_file, data, suffix, dump):
+    job_dir = os.path.join(os.path.dirname(os.path.abspath(config_file)), JOB_CONFIG_DIRNAME)
+    os.makedirs(job_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(config_file))[0]
+    # mkstemp 创建的文件权限为 0600，避免 API key 被其他用户读取
+    fd, path = tempfile.mkstemp(prefix=f'{stem}-', suffix=suffix, dir=job_dir)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        dump(data, f)
+    return path
+
+
+def _optional_number(value, kind):
+    if value is None or value == '':
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        return None
+
+
 def stringToBoolean(value):
     if value == 'true' or value == 'True' or value == True or value == 1:
         return True
@@ -99,6 +180,12 @@ class Config:
         self.pdf_h_offset = int(request_data.get('pdf_h_offset', 20))
         self.pdf_offset_ratio = float(request_data.get('pdf_offset_ratio', 5))
         self.pdf_white_margin = int(request_data.get('pdf_white_margin', 0))
+        # 裁剪 / 对照输出的保存方式 fast / balanced / compact；为空时使用 Server 的 --save_profile
+        self.save_profile = request_data.get('saveProfile') or None
+        # 裁剪方式 auto / redact；为空时使用 Server 的 --crop_engine
+        self.crop_engine = request_data.get('cropEngine') or None
+        # 版面方式 fixed / auto；auto 时按文字识别分栏、按文字和图形确定左右边界，为空时使用 Server 的 --crop_layout
+        self.crop_layout = request_data.get('cropLayout') or None
 
         self.mono = stringToBoolean(request_data.get('mono', True))
         self.dual = stringToBoolean(request_data.get('dual', True))
@@ -126,6 +213,14 @@ class Config:
         self.disable_rich_text_translate = stringToBoolean(request_data.get('disableRichTextTranslate', False))
         self.translate_table_text = stringToBoolean(request_data.get('translateTableText', False))
         self.only_include_translated_page = stringToBoolean(request_data.get('onlyIncludeTranslatedPage', False))
+        # 卡住 / 总时长预算（秒）和卡住后的重试次数；为空时使用 Server 的 --stall_timeout 等参数
+        self.stall_timeout = _optional_number(request_data.get('stallTimeout'), float)
+        self.job_timeout = _optional_number(request_data.get('jobTimeout'), float)
+        self.stall_retries = _optional_number(request_data.get('stallRetries'), int)
+        # 为 False 时跳过翻译结果缓存，强制重新翻译
+        self.use_cache = stringToBoolean(request_data.get('useCache', True))
+        # 上传时边写盘边计算的 PDF SHA-256，由 server.py 填写
+        self.input_sha256 = None
 
         print("\n🔍 Config without llm_api: ", self.__dict__)
 
@@ -137,7 +232,61 @@ class Config:
             'extraData': request_data.get('llm_api', {}).get('extraData', {})
         }
 
-    def update_config_file(self, config_file):
+    # 只影响运行速度、不影响输出内容的字段不参与缓存键
+    _CACHE_IGNORED_FIELDS = {'thread_num', 'qps', 'pool_size', 'use_cache', 'input_sha256', 'llm_api',
+                             'stall_timeout', 'job_timeout', 'stall_retries'}
+
+    def cache_digest(self, base_config_file=None, resolved=None):
+        """Canonical digest of every field that can change the translated output.
+
+        ``base_config_file`` is the shared config.json / config.toml the job
+        config is materialized from; its content is part of the digest too.
+        ``resolved`` maps fields the request may leave empty to the values the
+        Server will actually use, so changing a Server default changes the key.
+        """
+        fields = {
+            key: value for key, value in self.__dict__.items()
+            if key not in self._CACHE_IGNORED_FIELDS
+        }
+        fields.update(resolved or {})
+        if base_config_file:
+            fields['base_config'] = base_config_digest(base_config_file)
+        extra_data = self.llm_api.get('extraData') or {}
+        fields['llm_api'] = {
+            'apiUrl': self.llm_api.get('apiUrl', ''),
+            'model': self.llm_api.get('model', ''),
+            # API key 等凭据不进入缓存键，也不会落盘到缓存索引
+            'extraData': {
+                key: value for key, value in extra_data.items()
+                if not any(token in str(key).lower() for token in ('key', 'token', 'secret', 'password', 'auth'))
+            } if isinstance(extra_data, dict) else {},
+        }
+        canonical = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+    @contextmanager
+    def job_config_file(self, config_file):
+        """Yield a config path private to this job, removed again afterwards.
+
+        The shared ``config_file`` is only read. Concurrent jobs with different
+        services or keys each get their own materialized copy, so no job can
+        observe another job's half-written file.
+        """
+        job_path = self.write_job_config_file(config_file)
+        try:
+            yield job_path
+        finally:
+            if job_path != config_file:
+                try:
+                    os.remove(job_path)
+                except OSError:
+                    pass
+
+    def write_job_config_file(self, config_file):
+        """Materialize this request's config from ``config_file`` and return its path.
+
+        Returns ``config_file`` itself when the service needs no mapping.
+        """
         service = self.service
         engine = self.engine
         if engine == pdf2zh:
@@ -145,12 +294,9 @@ class Config:
             config_map = pdf2zh_config_map.get(service, {})
             if not config_map: # 无需映射, 直接跳过
                 print(f"🔍 No config_map found for service: {service}, 如果是新的服务, 请联系开发者更新config_map, 如果不是请忽略")
-                return
+                return config_file
 
-            with open(config_file, 'r', encoding='utf-8') as f:
-                old_config = json.load(f)
-
-            new_config = old_config.copy()
+            new_config = _load_base_config(config_file, json.load)
 
             # 更新字体
             if os.path.exists(self.font_file):
@@ -209,22 +355,24 @@ class Config:
                     del translator['envs'][key]
                     print(f"✏️ 删除旧 {key}")
 
-            with open(config_file, 'w', encoding='utf-8') as f:
-                json.dump(new_config, f, indent=4, ensure_ascii=False)
-                print(f"✏️ 更新 config file: {config_file}")
-            
+            job_path = _write_job_config(
+                config_file, new_config, '.json',
+                lambda data, f: json.dump(data, f, indent=4, ensure_ascii=False),
+            )
+            print(f"✏️ 生成本次任务的 config file: {job_path}")
+            return job_path
+
         elif engine == pdf2zh_next: # toml文件, 格式参考server/config/config.toml.example
             config_map = pdf2zh_next_config_map.get(service, {})
             if not config_map:
                 print(f"✏️ No config_map found for service: {service}, 如果是新的服务, 请联系开发者更新config_map")
-                return
+                return config_file
 
-            with open(config_file, 'r', encoding='utf-8') as f:
-                old_config = toml.load(f)
+            old_config = _load_base_config(config_file, toml.load)
 
             # A previous DeepSeek V4 attempt may have written 2.9-only fields.
             # For every non-DeepSeek request, scrub those fields before an older
-            # runtime gets a chance to parse the shared config.toml.
+            # runtime gets a chance to parse this job's config.toml.
             if service != 'deepseek':
                 old_deepseek_detail = old_config.get('deepseek_detail')
                 if isinstance(old_deepseek_detail, dict):
@@ -257,7 +405,7 @@ class Config:
                         extra_data.pop("deepseek_reasoning_effort", None)
                         self.llm_api["extraData"] = extra_data
 
-            new_config = old_config.copy() # 我们假设config.toml文件的格式没有问题
+            new_config = old_config # 已是基础配置的独立副本, 我们假设config.toml文件的格式没有问题
 
             # Keep request-scoped pdf2zh_next options in config.toml so they work
             # even when there is no dedicated CLI wiring in server.py.
@@ -315,12 +463,13 @@ class Config:
                     del translator[key]
                     print(f"✏️ 删除旧 {key}")
 
-            with open(config_file, 'w', encoding='utf-8') as f:
-                toml.dump(new_config, f)
-                print(f"✏️ 更新 config file: {config_file}")
+            job_path = _write_job_config(config_file, new_config, '.toml', toml.dump)
+            print(f"✏️ 生成本次任务的 config file: {job_path}")
 
             # server.py in older releases uses a legacy singular pool flag.
             # The worker count is already persisted above, so suppress that CLI path.
             self.pool_size = 0
+            return job_path
         else:
             print(f"✏️ 不支持的引擎类型: {engine}")
+            return config_file
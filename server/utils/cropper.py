@@ -1,12 +1,131 @@
 import fitz
+import multiprocessing
 import os
+import tempfile
+import threading
+import time
 import traceback
 import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+from utils.column_layout import PageClips, layout_cache, layout_clips, normalize_crop_layout, DEFAULT_CROP_LAYOUT, LAYOUT_VERSION
+from utils.dual_variants import VariantManifest
+from utils.upload_store import place_file
+# 翻译任务里的裁剪 / 合并耗时记到任务的 usage.timings 上（单独的 /crop 等请求不记录）
+from utils.resource_usage import usage_tracker
+
+# 并行裁剪：页数达到 PARALLEL_MIN_PAGES 时把页码区间切块，交给进程池处理后按顺序拼接
+PARALLEL_MIN_PAGES = 40
+# 每块至少这么多页，块太小时进程间传递和拼接的开销会超过收益
+MIN_CHUNK_PAGES = 8
+# 成对处理的模式（dual-cut / crop-compare）块边界必须落在偶数页上
+_PAIRED_MODES = {'dual-cut', 'crop-compare'}
+_CROP_MODES = ('mono-cut', 'dual-cut', 'crop-compare', 'origin-cut')
+# 裁剪时每批准备的源页数（须为偶数，成对模式按批切分时不会拆开一对）
+CLIP_BATCH_PAGES = 32
+# merge_pdf 的内存上限 (MB)：估计超过时按批合并、写出分块文件后再拼接；0 表示不限制
+DEFAULT_MERGE_MEMORY_MB = 1024
+# 粗略估计：合并时源文档和输出文档合计占用的内存约为源文件大小的这么多倍
+MERGE_MEMORY_FACTOR = 4
+MIN_MERGE_CHUNK_PAGES = 16
+
+# 输出 PDF 的保存方式：
+#   fast     - 只删除未引用对象，不清理内容流，保存最快、文件稍大
+#   balanced - 合并重复对象（含重复的字体、图片流）、清理内容流并压缩，与之前的保存方式一致（默认）
+#   compact  - 完整垃圾回收 + 清理内容流 + 对象流 + 高分辨率图片重新压缩，最慢、文件最小
+SAVE_PROFILES = {
+    'fast': {'garbage': 1, 'deflate': True},
+    'balanced': {'garbage': 4, 'deflate': True, 'clean': True},
+    'compact': {'garbage': 4, 'deflate': True, 'clean': True, 'use_objstms': 1},
+}
+DEFAULT_SAVE_PROFILE = 'balanced'
+# compact 模式下把高于该 DPI 的图片重新压缩到 COMPACT_IMAGE_DPI
+COMPACT_IMAGE_DPI_THRESHOLD = 300
+COMPACT_IMAGE_DPI = 200
+COMPACT_IMAGE_QUALITY = 85
+
+
+# 裁剪方式：
+#   auto   - 逐页判断：没有文字/图片跨在裁剪框边界上时不做 Redaction；否则只擦除文字和图片
+#   redact - 始终完整 Redaction（连同被裁剪框切到的矢量图形一起删除），最慢（默认，与之前的输出一致）
+CROP_ENGINES = ('auto', 'redact')
+DEFAULT_CROP_ENGINE = 'redact'
+
+
+def normalize_save_profile(profile, default=DEFAULT_SAVE_PROFILE):
+    profile = str(profile or '').strip().lower()
+    return profile if profile in SAVE_PROFILES else default
+
 
 # --- 辅助函数 ---
-def _apply_redactions_outside_clip(page, clip_rect):
+def _save_atomic(doc, path, profile=DEFAULT_SAVE_PROFILE):
+    """按保存方式 profile 写出 doc：先写临时文件再 os.replace 到 path。
+
+    LR/TB 布局和 compare 文件之间可能是硬链接，直接覆盖写会把另一个文件一起改坏。
+    每次保存都记录耗时和文件大小，便于按文档类型选择 profile。
+    """
+    profile = normalize_save_profile(profile)
+    options = dict(SAVE_PROFILES[profile])
+    started = time.time()
+    if profile == 'compact' and hasattr(doc, 'rewrite_images'):
+        doc.rewrite_images(
+            dpi_threshold=COMPACT_IMAGE_DPI_THRESHOLD,
+            dpi_target=COMPACT_IMAGE_DPI,
+            quality=COMPACT_IMAGE_QUALITY,
+        )
+    tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        try:
+            doc.save(tmp_path, **options)
+        except TypeError:
+            # 旧版 PyMuPDF 不支持 use_objstms
+            options.pop('use_objstms', None)
+            doc.save(tmp_path, **options)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(f"💾 [Cropper] 保存 {os.path.basename(str(path))} (profile={profile}): "
+          f"{time.time() - started:.2f}s, {os.path.getsize(path) / 1024.0 / 1024.0:.2f} MB")
+
+
+def normalize_crop_engine(engine, default=DEFAULT_CROP_ENGINE):
+    engine = str(engine or '').strip().lower()
+    return engine if engine in CROP_ENGINES else default
+
+
+def _choose_crop_method(page, clip_rect):
+    """auto 模式下为一个 (页, 裁剪框) 选择裁剪方式。
+
+    完全在裁剪框外的内容（例如双栏页的另一栏）本来就被 show_pdf_page 的 clip
+    隐藏，不影响结果；只有跨在裁剪框边界上、从框里能看到一部分的文字或图片才需要擦除。
+
+    clip - 没有跨边界的文字和图片：不做 Redaction，只靠 clip 隐藏；
+    text - 有跨边界的文字或图片：只擦除框外的文字和图片像素，矢量图形保留
+           （同样被 clip 隐藏），避开最慢的 LINE_ART_REMOVE_IF_TOUCHED。
+    """
+    clip = fitz.Rect(clip_rect)
+    box = clip + (-0.5, -0.5, 0.5, 0.5)
+
+    def straddles(rect):
+        return rect.intersects(clip) and not box.contains(rect)
+
+    for word in page.get_text('words'):
+        if straddles(fitz.Rect(word[:4])):
+            return 'text'
+    for info in page.get_image_info():
+        if straddles(fitz.Rect(info['bbox'])):
+            return 'text'
+    return 'clip'
+
+
+def _apply_redactions_outside_clip(page, clip_rect, graphics=fitz.PDF_REDACT_LINE_ART_REMOVE_IF_TOUCHED):
     """
     物理删除 clip_rect 之外的内容 (Redaction)
+    graphics=PDF_REDACT_LINE_ART_NONE 时保留矢量图形，只删除文字和图片像素
     """
     page_rect = page.rect
     redact_rects = []
@@ -25,25 +144,110 @@ def _apply_redactions_outside_clip(page, clip_rect):
         page.add_redact_annot(r_rect, fill=None)
 
     page.apply_redactions(
-        graphics=fitz.PDF_REDACT_LINE_ART_REMOVE_IF_TOUCHED,
+        graphics=graphics,
         text=fitz.PDF_REDACT_TEXT_REMOVE
     )
 
-def _paste_clipped_page(target_doc, src_doc, page_num, clip_rect, target_rect=None):
+class _ClipSource:
+    """同一次裁剪中共用的暂存文档：每个 (源页, 裁剪框) 只复制并物理裁剪一次。
+
+    show_pdf_page 按源文档记录已复制到目标里的对象，因此同一批页面的字体、
+    图片等共享资源在输出里只出现一份，而不是每个裁剪框各带一份。
+    该记录在第一次粘贴后就固定了大小，暂存文档之后不能再追加页面，
+    所以按 CLIP_BATCH_PAGES 页一批整体准备好再粘贴；每批一个暂存文档。
+    已准备的页在整次裁剪内都有效（到 close() 为止）：批外或未预先准备的页
+    另开一个暂存文档补上，不会让前面的批作废、重新裁剪。
+    """
+
+    def __init__(self, src_doc, engine=DEFAULT_CROP_ENGINE):
+        self.src_doc = src_doc
+        self.engine = normalize_crop_engine(engine)
+        self.docs = []
+        self.pages = {}  # (page_num, clip) -> (暂存文档, 页码)
+
+    @staticmethod
+    def _key(page_num, clip_rect):
+        return page_num, tuple(round(v, 2) for v in clip_rect)
+
+    def prepare(self, page_nums, clip_rects):
+        """把还没准备过的 (页, 裁剪框) 复制进一个新的暂存文档并物理裁剪。"""
+        doc = None
+        for page_num in page_nums:
+            methods = []
+            for clip_rect in (clip_rects(page_num) if callable(clip_rects) else clip_rects):
+                key = self._key(page_num, clip_rect)
+                if key in self.pages:
+                    continue
+                if doc is None:
+                    doc = fitz.open()
+                    self.docs.append(doc)
+                doc.insert_pdf(self.src_doc, from_page=page_num, to_page=page_num)
+                self.pages[key] = (doc, len(doc) - 1)
+                page = doc[-1]
+                method = _choose_crop_method(page, clip_rect) if self.engine == 'auto' else 'redact'
+                if method == 'redact':
+                    _apply_redactions_outside_clip(page, clip_rect)
+                elif method == 'text':
+                    _apply_redactions_outside_clip(page, clip_rect, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+                methods.append(method)
+            if methods:
+                print(f"✂️ [Cropper] 第 {page_num + 1} 页裁剪方式: {', '.join(methods)}")
+
+    def batches(self, start, stop, clip_rects, step=1):
+        """按批准备页面，依次产出每批要处理的页码 range。"""
+        for batch_start in range(start, stop, CLIP_BATCH_PAGES):
+            batch = range(batch_start, min(batch_start + CLIP_BATCH_PAGES, stop))
+            self.prepare(batch, clip_rects)
+            yield range(batch.start, batch.stop, step)
+
+    def page_for(self, page_num, clip_rect):
+        """返回 (暂存文档, 页码)；未预先准备时（单独调用 _paste_clipped_page 等）只补这一页。"""
+        key = self._key(page_num, clip_rect)
+        if key not in self.pages:
+            self.prepare([page_num], [clip_rect])
+        return self.pages[key]
+
+    def close(self):
+        for doc in self.docs:
+            doc.close()
+        self.docs = []
+        self.pages = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _clip_batches(src_doc, clips, start, stop, clip_rects, step=1, engine=DEFAULT_CROP_ENGINE):
+    """产出 (页码 range, _ClipSource)。
+
+    clips 为 None 时自建 _ClipSource 并按批准备；否则调用方已为 [start, stop)
+    准备好暂存页（多种输出共用同一批裁剪结果），整段一次产出。
+    """
+    if clips is not None:
+        yield range(start, stop, step), clips
+        return
+    with _ClipSource(src_doc, engine) as own:
+        for batch in own.batches(start, stop, clip_rects, step):
+            yield batch, own
+
+
+def _paste_clipped_page(target_doc, src_doc, page_num, clip_rect, target_rect=None, clip_source=None):
     """
     从源文档提取指定页面的 clip_rect 区域，并粘贴到目标文档。
     如果 target_rect 为 None，则创建新页面；
     如果 target_rect 有值，则绘制到目标文档最后一页的指定位置。
+    clip_source 为同一次裁剪共用的 _ClipSource；不传时临时创建一个。
     """
-    # 1. 临时文档处理原页，防止污染
-    temp_doc = fitz.open()
-    temp_doc.insert_pdf(src_doc, from_page=page_num, to_page=page_num)
-    temp_page = temp_doc[0]
-
-    # 2. 物理裁剪
-    _apply_redactions_outside_clip(temp_page, clip_rect)
+    # 1. 在暂存文档中处理原页（已物理裁剪过的直接复用），防止污染源文档
+    own_source = clip_source is None
+    if own_source:
+        clip_source = _ClipSource(src_doc)
+    temp_doc, temp_index = clip_source.page_for(page_num, clip_rect)
 
-    # 3. 确定目标页面和位置
+    # 2. 确定目标页面和位置
     if target_rect is None:
         # 创建新页面，大小等于裁剪框
         new_page = target_doc.new_page(width=clip_rect.width, height=clip_rect.height)
@@ -53,22 +257,95 @@ def _paste_clipped_page(target_doc, src_doc, page_num, clip_rect, target_rect=No
         new_page = target_doc[-1]
         dest_rect = target_rect
 
-    # 4. 绘制 (show_pdf_page 会自动缩放内容以适应 dest_rect)
-    new_page.show_pdf_page(dest_rect, temp_doc, 0, clip=clip_rect)
+    # 3. 绘制 (show_pdf_page 会自动缩放内容以适应 dest_rect)
+    new_page.show_pdf_page(dest_rect, temp_doc, temp_index, clip=clip_rect)
 
     if target_rect is None:
         new_page.clean_contents()
 
-    temp_doc.close()
+    if own_source:
+        clip_source.close()
+
+
+def _page_chunks(total, chunk_count, align=1):
+    """把 [0, total) 切成最多 chunk_count 个连续区间，区间起点按 align 对齐。"""
+    chunk_count = max(1, min(chunk_count, total // max(MIN_CHUNK_PAGES, align)))
+    size = -(-total // chunk_count)
+    size += (-size) % align
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def _crop_chunk(input_pdf, outfile_type, start, end, clip_values, chunk_path, crop_engine=DEFAULT_CROP_ENGINE):
+    """进程池 worker：独立打开源 PDF，只处理 [start, end) 页，写出分块 PDF。
+
+    返回 (分块路径, 本块消耗的 CPU 秒数)，CPU 由父进程计入任务的资源用量。
+    """
+    cpu_started = time.process_time()
+    cropper = Cropper(workers=1, crop_engine=crop_engine)
+    if clip_values is None:  # LR-to-TB 不需要栏裁剪参数
+        layout = w = h = config = None
+    else:
+        layout_values, w, h, offsets = clip_values
+        layout = PageClips.from_values(layout_values)
+        config = SimpleNamespace(**offsets)
+    with fitz.open(input_pdf) as src_doc, fitz.open() as new_doc:
+        cropper._process_range(src_doc, new_doc, outfile_type, layout, w, h, config, start, end)
+        new_doc.save(chunk_path, garbage=1, deflate=True)
+    return chunk_path, time.process_time() - cpu_started
 
 # --- 主类 ---
 
 class Cropper():
-    def __init__(self):
-        pass
+    _pool = None
+    _pool_workers = 0
+    _pool_lock = threading.Lock()
+
+    def __init__(self, workers=0, parallel_min_pages=PARALLEL_MIN_PAGES, save_profile=DEFAULT_SAVE_PROFILE, crop_engine=DEFAULT_CROP_ENGINE,
+                 crop_layout=DEFAULT_CROP_LAYOUT, merge_memory_mb=DEFAULT_MERGE_MEMORY_MB):
+        # workers: 0 表示按 CPU 核数自动选择；1 表示始终单进程顺序处理
+        self.workers = int(workers) if workers else (os.cpu_count() or 1)
+        self.parallel_min_pages = max(1, int(parallel_min_pages))
+        # 服务器默认的保存方式；单个请求可以通过 save_profile 参数覆盖
+        self.save_profile = normalize_save_profile(save_profile)
+        # 服务器默认的裁剪方式（auto / redact）；单个请求可以通过 config.crop_engine 覆盖
+        self.crop_engine = normalize_crop_engine(crop_engine)
+        # 服务器默认的版面方式（auto / fixed）；单个请求可以通过 config.crop_layout 覆盖
+        self.crop_layout = normalize_crop_layout(crop_layout)
+        self.merge_memory_bytes = max(0, int(merge_memory_mb or 0)) * 1024 * 1024
+
+    def _profile(self, save_profile):
+        return normalize_save_profile(save_profile, self.save_profile)
+
+    def effective_settings(self, config):
+        """请求未指定时实际使用的保存 / 裁剪 / 版面方式（含版面分析算法版本），用于翻译缓存键。"""
+        return {
+            'save_profile': self._profile(getattr(config, 'save_profile', None)),
+            'crop_engine': normalize_crop_engine(getattr(config, 'crop_engine', None), self.crop_engine),
+            'crop_layout': normalize_crop_layout(getattr(config, 'crop_layout', None), self.crop_layout),
+            'layout_version': LAYOUT_VERSION,
+        }
+
+    @classmethod
+    def _get_pool(cls, workers):
+        # 所有请求共用一个进程池，并发的裁剪任务合计也不会超过 workers 个进程。
+        # 用 spawn 而不是 fork：Flask 是多线程的，fork 可能复制到被其他线程持有的锁。
+        with cls._pool_lock:
+            if cls._pool is None or cls._pool_workers != workers:
+                if cls._pool is not None:
+                    cls._pool.shutdown(wait=False)
+                cls._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                cls._pool_workers = workers
+            return cls._pool
+
+    @classmethod
+    def _reset_pool(cls):
+        with cls._pool_lock:
+            if cls._pool is not None:
+                cls._pool.shutdown(wait=False)
+            cls._pool = None
 
     def _get_clips(self, page, config):
-        """计算左栏和右栏的裁剪矩形"""
+        """计算固定的左栏和右栏裁剪矩形（fixed 布局，以及 auto 布局下没有文字的页）"""
         mediabox = page.mediabox
         w, h = mediabox.width, mediabox.height
         half_w = w / 2
@@ -84,37 +361,155 @@ class Cropper():
         return left_clip, right_clip, w, h
 
     def crop_pdf(self, config, input_pdf, infile_type, output_pdf, outfile_type):
-        print(f"🐲 [Cropper] 开始裁剪PDF: {input_pdf} -> {output_pdf} (模式: {outfile_type})")
+        if outfile_type not in _CROP_MODES:
+            raise ValueError(f"未知的裁剪模式: {outfile_type}")
+        self.crop_many(config, input_pdf, [(outfile_type, output_pdf)])
+
+    @usage_tracker.timed('crop')
+    def crop_many(self, config, input_pdf, targets):
+        """一次打开 input_pdf，生成 targets 中的全部输出 [(outfile_type, output_pdf), ...]。
+
+        outfile_type 可以是任一裁剪模式或 'compare'。顺序处理时，多个裁剪模式按批
+        共用同一份物理裁剪结果（dual-cut 和 crop-compare 用的是同样的页和裁剪框），
+        compare 也直接从已打开的文档生成。compare 失败与 merge_pdf 一样只记录日志；
+        裁剪失败会抛出异常。返回成功写出的文件路径。
+        """
+        crop_targets = [(t, path) for t, path in targets if t != 'compare']
+        compare_targets = [path for t, path in targets if t == 'compare']
+        for outfile_type, output_pdf in crop_targets:
+            if outfile_type not in _CROP_MODES:
+                raise ValueError(f"未知的裁剪模式: {outfile_type}")
+            print(f"🐲 [Cropper] 开始裁剪PDF: {input_pdf} -> {output_pdf} (模式: {outfile_type})")
+
+        written = []
         try:
-            with fitz.open(input_pdf) as src_doc, fitz.open() as new_doc:
+            with fitz.open(input_pdf) as src_doc:
                 if len(src_doc) == 0:
                     raise ValueError("输入 PDF 没有页面")
 
-                left_clip, right_clip, w, h = self._get_clips(src_doc[0], config)
-
-                if outfile_type == 'mono-cut':
-                    self._process_mono_cut(src_doc, new_doc, left_clip, right_clip)
-                elif outfile_type == 'dual-cut':
-                    self._process_dual_cut(src_doc, new_doc, left_clip, right_clip, config)
-                elif outfile_type == 'crop-compare':
-                    self._process_crop_compare(src_doc, new_doc, left_clip, right_clip, w, h, config)
-                elif outfile_type == 'origin-cut':
-                    self._process_mono_cut(src_doc, new_doc, left_clip, right_clip)
-                else:
-                    raise ValueError(f"未知的裁剪模式: {outfile_type}")
-
-                if len(new_doc) == 0:
-                    raise ValueError(f"PDF 处理没有生成页面: {outfile_type}")
-                new_doc.save(output_pdf, garbage=4, deflate=True, clean=True)
-                print(f"✅ 处理完成: {output_pdf}")
+                if crop_targets:
+                    written += self._crop_targets(config, input_pdf, src_doc, crop_targets)
+
+                for output_path in compare_targets:
+                    if self._merge_chunk_pages(input_pdf, len(src_doc)):
+                        # 大文件不复用已打开的文档，交给 merge_pdf 分块合并
+                        if self.merge_pdf(input_pdf, output_path, getattr(config, 'save_profile', None)):
+                            written.append(output_path)
+                        continue
+                    print(f"🐲 开始合并(Compare): {input_pdf} -> {output_path}")
+                    try:
+                        with fitz.open() as output_doc:
+                            self._merge_into(src_doc, output_doc)
+                            _save_atomic(output_doc, output_path, self._profile(getattr(config, 'save_profile', None)))
+                        print(f"✅ 合并成功: {output_path}")
+                        written.append(output_path)
+                    except Exception:
+                        traceback.print_exc()
         except Exception:
             traceback.print_exc()
             raise
+        return written
+
+    def _crop_targets(self, config, input_pdf, src_doc, crop_targets):
+        left_clip, right_clip, w, h = self._get_clips(src_doc[0], config)
+        layout = PageClips((left_clip, right_clip))
+        if normalize_crop_layout(getattr(config, 'crop_layout', None), self.crop_layout) == 'auto':
+            # TB 双语 PDF 的译文页和原文页按对分析，两页用同一组裁剪框
+            group = 2 if any(t in _PAIRED_MODES for t, _ in crop_targets) else 1
+            analysis = layout_cache.get(input_pdf, src_doc, group) or {}
+            layout.pages = layout_clips(analysis, config.pdf_w_offset, config.pdf_h_offset, config.pdf_offset_ratio)
+        offsets = {
+            'pdf_w_offset': config.pdf_w_offset,
+            'pdf_h_offset': config.pdf_h_offset,
+            'pdf_offset_ratio': config.pdf_offset_ratio,
+        }
+        clip_values = (layout.to_values(), w, h, offsets)
+        engine = normalize_crop_engine(getattr(config, 'crop_engine', None), self.crop_engine)
+
+        new_docs = [fitz.open() for _ in crop_targets]
+        try:
+            sequential = []
+            for (outfile_type, output_pdf), new_doc in zip(crop_targets, new_docs):
+                if not self._process_parallel(input_pdf, len(src_doc), new_doc, outfile_type, clip_values, output_pdf, engine):
+                    sequential.append((outfile_type, new_doc))
+
+            # 顺序处理的各模式按批共用暂存页：每批源页只复制、物理裁剪一次
+            if sequential:
+                with _ClipSource(src_doc, engine) as clips:
+                    for batch in clips.batches(0, len(src_doc), layout):
+                        for outfile_type, new_doc in sequential:
+                            self._process_range(src_doc, new_doc, outfile_type, layout,
+                                                w, h, config, batch.start, batch.stop, clips)
+
+            written = []
+            for (outfile_type, output_pdf), new_doc in zip(crop_targets, new_docs):
+                if len(new_doc) == 0:
+                    raise ValueError(f"PDF 处理没有生成页面: {outfile_type}")
+                _save_atomic(new_doc, output_pdf, self._profile(getattr(config, 'save_profile', None)))
+                print(f"✅ 处理完成: {output_pdf}")
+                written.append(output_pdf)
+            return written
+        finally:
+            for new_doc in new_docs:
+                new_doc.close()
+
+    def _process_range(self, src_doc, new_doc, outfile_type, layout, w, h, config, start=0, end=None, clips=None):
+        if outfile_type in ('mono-cut', 'origin-cut'):
+            self._process_mono_cut(src_doc, new_doc, layout, start, end, clips)
+        elif outfile_type == 'dual-cut':
+            self._process_dual_cut(src_doc, new_doc, layout, config, start, end, clips)
+        elif outfile_type == 'crop-compare':
+            self._process_crop_compare(src_doc, new_doc, layout, w, h, config, start, end, clips)
+        elif outfile_type == 'LR-to-TB':
+            self._process_LR_to_TB(src_doc, new_doc, start, end, clips)
+        else:
+            raise ValueError(f"未知的裁剪模式: {outfile_type}")
+
+    def _process_parallel(self, input_pdf, total_pages, new_doc, outfile_type, clip_values, output_pdf, crop_engine=None):
+        """按页码分块在进程池中处理，再按顺序拼接进 new_doc。
+
+        返回 False 表示没有并行处理（页数太少、只允许单进程或进程池不可用），
+        调用方应改为顺序处理。
+        """
+        if self.workers <= 1 or total_pages < self.parallel_min_pages:
+            return False
+        align = 2 if outfile_type in _PAIRED_MODES else 1
+        chunks = _page_chunks(total_pages, self.workers * 2, align)
+        if len(chunks) <= 1:
+            return False
+
+        started = time.time()
+        chunk_dir = tempfile.mkdtemp(prefix='.crop-', dir=os.path.dirname(os.path.abspath(output_pdf)))
+        try:
+            pool = self._get_pool(self.workers)
+            futures = [
+                pool.submit(_crop_chunk, str(input_pdf), outfile_type, start, end, clip_values,
+                            os.path.join(chunk_dir, f'{index:04d}.pdf'), crop_engine or self.crop_engine)
+                for index, (start, end) in enumerate(chunks)
+            ]
+            chunk_paths = []
+            for future in futures:
+                chunk_path, cpu_seconds = future.result()
+                usage_tracker.add_worker_cpu(cpu_seconds)
+                chunk_paths.append(chunk_path)
+            for chunk_path in chunk_paths:
+                with fitz.open(chunk_path) as chunk_doc:
+                    new_doc.insert_pdf(chunk_doc)
+        except (BrokenProcessPool, OSError) as e:
+            print(f"⚠️ [Cropper] 并行裁剪不可用，改为单进程处理: {e}")
+            self._reset_pool()
+            if len(new_doc):
+                new_doc.delete_pages(0, len(new_doc) - 1)
+            return False
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+        print(f"🐲 [Cropper] 并行裁剪 {total_pages} 页: {len(chunks)} 块 / {self.workers} 进程, 用时 {time.time() - started:.1f}s")
+        return True
 
     # Mode: LR -> TB (将宽页拆分成两张窄页)
     # 输入: LR_dual (P1 = [Trans | Origin])
     # 输出: TB_dual (P1 = Trans, P2 = Origin)
-    def _process_LR_to_TB(self, src_doc, new_doc):
+    def _process_LR_to_TB(self, src_doc, new_doc, start=0, end=None, clips=None):
         # 获取页面尺寸
         page = src_doc[0]
         w, h = page.rect.width, page.rect.height
@@ -124,135 +519,177 @@ class Cropper():
         rect_l = fitz.Rect(0, 0, half_w, h)
         rect_r = fitz.Rect(half_w, 0, w, h)
 
-        for page_num in range(len(src_doc)):
-            # 1. 提取左半边 (Trans) -> 新的一页
-            _paste_clipped_page(new_doc, src_doc, page_num, rect_l)
+        stop = len(src_doc) if end is None else end
+        for batch, clips in _clip_batches(src_doc, clips, start, stop, (rect_l, rect_r), engine=self.crop_engine):
+            for page_num in batch:
+                # 1. 提取左半边 (Trans) -> 新的一页
+                _paste_clipped_page(new_doc, src_doc, page_num, rect_l, clip_source=clips)
 
-            # 2. 提取右半边 (Origin) -> 新的一页
-            _paste_clipped_page(new_doc, src_doc, page_num, rect_r)
+                # 2. 提取右半边 (Origin) -> 新的一页
+                _paste_clipped_page(new_doc, src_doc, page_num, rect_r, clip_source=clips)
 
     # Mode 1: mono-cut (一分为二，拼成长条)
-    # Page 1 -> [P1-L, P1-R]
-    def _process_mono_cut(self, src_doc, new_doc, left_clip, right_clip):
-        for page_num in range(len(src_doc)):
-            # 先左后右
-            _paste_clipped_page(new_doc, src_doc, page_num, left_clip)
-            _paste_clipped_page(new_doc, src_doc, page_num, right_clip)
+    # Page 1 -> [P1-L, P1-R]；单栏页 -> [P1]
+    def _process_mono_cut(self, src_doc, new_doc, layout, start=0, end=None, clips=None):
+        stop = len(src_doc) if end is None else end
+        for batch, clips in _clip_batches(src_doc, clips, start, stop, layout, engine=self.crop_engine):
+            for page_num in batch:
+                # 先左后右
+                for clip_rect in layout(page_num):
+                    _paste_clipped_page(new_doc, src_doc, page_num, clip_rect, clip_source=clips)
 
     # Mode 2: dual-cut (双语交叉切割)
     # 输入: Dual PDF (TB模式，P1=Trans, P2=Origin)
-    # 输出: [P1-L, P2-L, P1-R, P2-R] (左栏对照，右栏对照)
-    def _process_dual_cut(self, src_doc, new_doc, left_clip, right_clip, config):
-        if len(src_doc) % 2 != 0:
+    # 输出: [P1-L, P2-L, P1-R, P2-R] (左栏对照，右栏对照)；单栏页对 -> [P1, P2]
+    def _process_dual_cut(self, src_doc, new_doc, layout, config, start=0, end=None, clips=None):
+        if len(src_doc) % 2 != 0 and start == 0:
             print("⚠️ [Warning] dual-cut 模式输入页数不是偶数，最后一张可能被忽略。")
 
-        for i in range(0, len(src_doc) // 2 * 2, 2):
-            p_trans = i
-            p_orig = i + 1
+        stop = min(len(src_doc) if end is None else end, len(src_doc) // 2 * 2)
+        for batch, clips in _clip_batches(src_doc, clips, start, stop, layout, step=2, engine=self.crop_engine):
+            for i in batch:
+                p_trans = i
+                p_orig = i + 1
 
-            # 1. Trans-Left
-            _paste_clipped_page(new_doc, src_doc, p_trans, left_clip)
-            # 2. Origin-Left
-            _paste_clipped_page(new_doc, src_doc, p_orig, left_clip)
-            # 3. Trans-Right
-            _paste_clipped_page(new_doc, src_doc, p_trans, right_clip)
-            # 4. Origin-Right
-            _paste_clipped_page(new_doc, src_doc, p_orig, right_clip)
+                # 依次 Trans-Left, Origin-Left, Trans-Right, Origin-Right
+                for clip_rect in layout(p_trans):
+                    _paste_clipped_page(new_doc, src_doc, p_trans, clip_rect, clip_source=clips)
+                    _paste_clipped_page(new_doc, src_doc, p_orig, clip_rect, clip_source=clips)
 
     # Mode 3: crop-compare (裁剪后拼接)
     # 输入: Dual PDF (TB模式, P1=Trans, P2=Origin)
     # 输出: 宽页
-    def _process_crop_compare(self, src_doc, new_doc, left_clip, right_clip, w, h, config):
-        h_offset = config.pdf_h_offset
-
-        # 为了简单，我们创建一个原宽度的页面
-        final_w = w
-        final_h = left_clip.height
-
-        for i in range(0, len(src_doc) // 2 * 2, 2):
-            p_trans = i
-            p_orig = i + 1
-
-            # --- 新页 1: 左栏对照 (Trans-L + Orig-L) ---
-            new_page_1 = new_doc.new_page(width=final_w, height=final_h)
-            rect_left_half = fitz.Rect(0, 0, final_w/2, final_h)
-            rect_right_half = fitz.Rect(final_w/2, 0, final_w, final_h)
-
-            _paste_clipped_page(new_doc, src_doc, p_trans, left_clip, rect_left_half)
-            _paste_clipped_page(new_doc, src_doc, p_orig, left_clip, rect_right_half)
-            new_page_1.clean_contents()
-
-            # --- 新页 2: 右栏对照 (Trans-R + Orig-R) ---
-            new_page_2 = new_doc.new_page(width=final_w, height=final_h)
-
-            _paste_clipped_page(new_doc, src_doc, p_trans, right_clip, rect_left_half)
-            _paste_clipped_page(new_doc, src_doc, p_orig, right_clip, rect_right_half)
-            new_page_2.clean_contents()
+    def _process_crop_compare(self, src_doc, new_doc, layout, w, h, config, start=0, end=None, clips=None):
+        stop = min(len(src_doc) if end is None else end, len(src_doc) // 2 * 2)
+        for batch, clips in _clip_batches(src_doc, clips, start, stop, layout, step=2, engine=self.crop_engine):
+            for i in batch:
+                p_trans = i
+                p_orig = i + 1
+
+                # 每个裁剪框一张新页: 左栏对照 (Trans-L + Orig-L)，再右栏对照 (Trans-R + Orig-R)
+                page_clips = layout(p_trans)
+                for clip_rect in page_clips:
+                    # 双栏时创建一个原宽度的页面；单栏页并排放两个整页内容框
+                    final_w = w if len(page_clips) > 1 else clip_rect.width * 2
+                    final_h = clip_rect.height
+                    rect_left_half = fitz.Rect(0, 0, final_w/2, final_h)
+                    rect_right_half = fitz.Rect(final_w/2, 0, final_w, final_h)
+
+                    new_page = new_doc.new_page(width=final_w, height=final_h)
+                    _paste_clipped_page(new_doc, src_doc, p_trans, clip_rect, rect_left_half, clips)
+                    _paste_clipped_page(new_doc, src_doc, p_orig, clip_rect, rect_right_half, clips)
+                    new_page.clean_contents()
 
     # -----------------------------------------------------------
     # Merge / Compare (TB -> LR)
     # -----------------------------------------------------------
-    def merge_pdf(self, input_path, output_path):
+    @usage_tracker.timed('compare')
+    def merge_pdf(self, input_path, output_path, save_profile=None):
         """
         实现 'compare' 模式：将 TB_dual 转换为 LR_dual
         修复：奇数页时，最后一页单独放在左侧，右侧留白
         """
         print(f"🐲 开始合并(Compare): {input_path} -> {output_path}")
         try:
-            dual_pdf = fitz.open(input_path)
-            output_pdf = fitz.open()
-
-            total_pages = len(dual_pdf)
-
-            # 修改循环范围，确保能取到最后一页 (如果总数是5，range就是 0, 2, 4)
-            for i in range(0, total_pages, 2):
-                p_trans_idx = i
-                p_orig_idx = i + 1
-
-                page_trans = dual_pdf[p_trans_idx]
-                rect_trans = page_trans.rect
-
-                # --- 情况 1: 存在右侧页 (成对) ---
-                if p_orig_idx < total_pages:
-                    page_orig = dual_pdf[p_orig_idx]
-                    rect_orig = page_orig.rect
-
-                    new_w = rect_trans.width + rect_orig.width
-                    new_h = max(rect_trans.height, rect_orig.height)
-
-                    new_page = output_pdf.new_page(width=new_w, height=new_h)
-
-                    rect_left = fitz.Rect(0, 0, rect_trans.width, rect_trans.height)
-                    # 右侧矩形从左侧宽度结束处开始
-                    rect_right = fitz.Rect(rect_trans.width, 0, new_w, rect_orig.height)
-
-                    new_page.show_pdf_page(rect_left, dual_pdf, p_trans_idx)
-                    new_page.show_pdf_page(rect_right, dual_pdf, p_orig_idx)
-
-                # --- 情况 2: 最后一页落单 (奇数页) ---
-                else:
-                    # 策略：为了阅读体验一致，依然创建双倍宽度的画布
-                    # 左侧放内容，右侧留白
-                    new_w = rect_trans.width * 2
-                    new_h = rect_trans.height
-
-                    new_page = output_pdf.new_page(width=new_w, height=new_h)
-
-                    rect_left = fitz.Rect(0, 0, rect_trans.width, rect_trans.height)
-
-                    new_page.show_pdf_page(rect_left, dual_pdf, p_trans_idx)
-                    # print(f"ℹ️ 处理奇数尾页: 第 {p_trans_idx + 1} 页")
-
-            output_pdf.save(output_path, garbage=4, deflate=True)
+            with fitz.open(input_path) as dual_pdf:
+                total_pages = len(dual_pdf)
+                chunk_pages = self._merge_chunk_pages(input_path, total_pages)
+                if chunk_pages is None:
+                    with fitz.open() as output_pdf:
+                        self._merge_into(dual_pdf, output_pdf)
+                        _save_atomic(output_pdf, output_path, self._profile(save_profile))
+            if chunk_pages is not None:
+                self._merge_chunked(input_path, output_path, total_pages, chunk_pages, self._profile(save_profile))
             print(f"✅ 合并成功: {output_path}")
-
-            output_pdf.close()
-            dual_pdf.close()
             return output_path
         except Exception as e:
             traceback.print_exc()
             return None
 
+    def _merge_chunk_pages(self, input_path, total_pages):
+        """估算的内存超过 merge_memory_bytes 时返回每批合并的页数（偶数），否则返回 None。"""
+        if not self.merge_memory_bytes or total_pages <= MIN_MERGE_CHUNK_PAGES:
+            return None
+        estimated = os.path.getsize(input_path) * MERGE_MEMORY_FACTOR
+        if estimated <= self.merge_memory_bytes:
+            return None
+        chunk_pages = max(MIN_MERGE_CHUNK_PAGES, int(total_pages * self.merge_memory_bytes / estimated))
+        return chunk_pages - chunk_pages % 2
+
+    def _merge_chunked(self, input_path, output_path, total_pages, chunk_pages, save_profile):
+        """每批 chunk_pages 页：重新打开源文件、合并、按 save_profile 写出分块文件后关闭。
+
+        拼接时以第一块为底，其余分块逐块 insert_pdf 后增量保存 (saveIncr)：
+        已写入的页不再读回内存，峰值内存只和一块的大小有关，而不是整份文档。
+        分块之间共用的字体等对象不会再去重，文件会比一次合并略大。
+        """
+        started = time.time()
+        chunk_dir = tempfile.mkdtemp(prefix='.merge-', dir=os.path.dirname(os.path.abspath(output_path)))
+        try:
+            chunk_paths = []
+            for index, start in enumerate(range(0, total_pages, chunk_pages)):
+                chunk_path = os.path.join(chunk_dir, f'{index:04d}.pdf')
+                with fitz.open(input_path) as dual_pdf, fitz.open() as chunk_doc:
+                    self._merge_into(dual_pdf, chunk_doc, start, min(start + chunk_pages, total_pages))
+                    _save_atomic(chunk_doc, chunk_path, save_profile)
+                chunk_paths.append(chunk_path)
+
+            joined_path = os.path.join(chunk_dir, 'joined.pdf')
+            os.replace(chunk_paths[0], joined_path)
+            for chunk_path in chunk_paths[1:]:
+                with fitz.open(joined_path) as output_pdf, fitz.open(chunk_path) as chunk_doc:
+                    output_pdf.insert_pdf(chunk_doc)
+                    output_pdf.saveIncr()
+                os.remove(chunk_path)
+            os.replace(joined_path, output_path)
+        finally:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+        print(f"🐲 [Cropper] 分块合并 {total_pages} 页: {len(chunk_paths)} 块 / 每块 {chunk_pages} 页, "
+              f"用时 {time.time() - started:.1f}s")
+
+    def _merge_into(self, dual_pdf, output_pdf, start=0, end=None):
+        total_pages = len(dual_pdf)
+        stop = total_pages if end is None else end
+
+        # 修改循环范围，确保能取到最后一页 (如果总数是5，range就是 0, 2, 4)
+        for i in range(start, stop, 2):
+            p_trans_idx = i
+            p_orig_idx = i + 1
+
+            page_trans = dual_pdf[p_trans_idx]
+            rect_trans = page_trans.rect
+
+            # --- 情况 1: 存在右侧页 (成对) ---
+            if p_orig_idx < total_pages:
+                page_orig = dual_pdf[p_orig_idx]
+                rect_orig = page_orig.rect
+
+                new_w = rect_trans.width + rect_orig.width
+                new_h = max(rect_trans.height, rect_orig.height)
+
+                new_page = output_pdf.new_page(width=new_w, height=new_h)
+
+                rect_left = fitz.Rect(0, 0, rect_trans.width, rect_trans.height)
+                # 右侧矩形从左侧宽度结束处开始
+                rect_right = fitz.Rect(rect_trans.width, 0, new_w, rect_orig.height)
+
+                new_page.show_pdf_page(rect_left, dual_pdf, p_trans_idx)
+                new_page.show_pdf_page(rect_right, dual_pdf, p_orig_idx)
+
+            # --- 情况 2: 最后一页落单 (奇数页) ---
+            else:
+                # 策略：为了阅读体验一致，依然创建双倍宽度的画布
+                # 左侧放内容，右侧留白
+                new_w = rect_trans.width * 2
+                new_h = rect_trans.height
+
+                new_page = output_pdf.new_page(width=new_w, height=new_h)
+
+                rect_left = fitz.Rect(0, 0, rect_trans.width, rect_trans.height)
+
+                new_page.show_pdf_page(rect_left, dual_pdf, p_trans_idx)
+                # print(f"ℹ️ 处理奇数尾页: 第 {p_trans_idx + 1} 页")
+
     # -----------------------------------------------------------
     # Split / Convert (LR <-> TB)
     # -----------------------------------------------------------
@@ -267,56 +704,54 @@ class Cropper():
             base, _ = os.path.splitext(path)
         return base + '.LR_dual.pdf', base + '.TB_dual.pdf'
 
-    def pdf_dual_mode(self, dual_path, from_mode, to_mode):
-        """Convert a pdf2zh_next dual file between LR and alternating-page TB.
+    @usage_tracker.timed('dualMode')
+    def pdf_dual_mode(self, dual_path, from_mode, to_mode, save_profile=None):
+        """Make the ``to_mode`` layout of a pdf2zh_next dual file available.
 
         The input may already use the canonical ``.LR_dual.pdf`` or
         ``.TB_dual.pdf`` suffix.  Do not derive paths with a blind string
         replacement because that previously produced names such as
         ``.LR_LR_dual.pdf``.
+
+        Only the requested layout is built, and only when the sidecar
+        manifest (see ``VariantManifest``) shows no up-to-date copy. Putting
+        the input under its canonical name uses a hard link, not a byte copy.
+        Returns ``(LR_dual_path, TB_dual_path)``; the one that was not asked
+        for may not exist.
         """
         from_mode = str(from_mode or '').upper()
         to_mode = str(to_mode or '').upper()
         LR_dual_path, TB_dual_path = self._dual_variant_paths(dual_path)
-
+        paths = {'LR': LR_dual_path, 'TB': TB_dual_path}
+        if from_mode not in paths or to_mode not in paths:
+            raise ValueError(f"不支持的 dual 布局转换: {from_mode} -> {to_mode}")
+
+        source = paths[from_mode]
+        if os.path.abspath(str(dual_path)) != os.path.abspath(source):
+            if os.path.exists(dual_path):
+                place_file(dual_path, source)
+            elif not os.path.exists(source):
+                raise FileNotFoundError(f"{from_mode} dual 输入不存在: {dual_path}")
         if from_mode == to_mode:
-            target = LR_dual_path if to_mode == 'LR' else TB_dual_path
-            if os.path.abspath(str(dual_path)) != os.path.abspath(target):
-                if os.path.exists(target):
-                    os.remove(target)
-                shutil.copyfile(dual_path, target)
             return LR_dual_path, TB_dual_path
 
-        if from_mode == 'TB' and to_mode == 'LR':
-            source = str(dual_path) if str(dual_path).endswith('.TB_dual.pdf') else TB_dual_path
-            if not os.path.exists(source):
-                if not os.path.exists(dual_path):
-                    raise FileNotFoundError(f"TB dual 输入不存在: {dual_path}")
-                if os.path.abspath(str(dual_path)) != os.path.abspath(TB_dual_path):
-                    shutil.copyfile(dual_path, TB_dual_path)
-                source = TB_dual_path
-            self.merge_pdf(source, LR_dual_path)
+        target = paths[to_mode]
+        manifest = VariantManifest(LR_dual_path[:-len('.LR_dual.pdf')])
+        if manifest.is_fresh(to_mode, target, source):
+            print(f"♻️ [Cropper] 复用已生成的 {to_mode} 布局: {target}")
             return LR_dual_path, TB_dual_path
 
-        if from_mode == 'LR' and to_mode == 'TB':
-            source = str(dual_path) if str(dual_path).endswith('.LR_dual.pdf') else LR_dual_path
-            if not os.path.exists(source):
-                if not os.path.exists(dual_path):
-                    raise FileNotFoundError(f"LR dual 输入不存在: {dual_path}")
-                if os.path.abspath(str(dual_path)) != os.path.abspath(LR_dual_path):
-                    shutil.copyfile(dual_path, LR_dual_path)
-                source = LR_dual_path
-
-            print(f"🐲 开始拆分(LR->TB): {source} -> {TB_dual_path}")
+        if to_mode == 'LR':
+            if self.merge_pdf(source, target, save_profile) is None:
+                raise ValueError(f"TB -> LR 转换失败: {source}")
+        else:
+            print(f"🐲 开始拆分(LR->TB): {source} -> {target}")
             with fitz.open(source) as src_doc, fitz.open() as new_doc:
-                self._process_LR_to_TB(src_doc, new_doc)
+                if not self._process_parallel(source, len(src_doc), new_doc, 'LR-to-TB', None, target):
+                    self._process_LR_to_TB(src_doc, new_doc)
                 if len(new_doc) == 0:
                     raise ValueError("LR -> TB 没有生成页面")
-                if os.path.exists(TB_dual_path):
-                    os.remove(TB_dual_path)
-                new_doc.save(TB_dual_path, garbage=4, deflate=True)
-            print(f"✅ 拆分成功: {TB_dual_path}")
-            return LR_dual_path, TB_dual_path
-
-        raise ValueError(f"不支持的 dual 布局转换: {from_mode} -> {to_mode}")
-
+                _save_atomic(new_doc, target, self._profile(save_profile))
+            print(f"✅ 拆分成功: {target}")
+        manifest.record(to_mode, target, source, from_mode)
+        return LR_dual_path, TB_dual_path
@@ -0,0 +1,74 @@
+import json
+import os
+import time
+import uuid
+
+from utils.result_cache import file_sha256
+
+
+MANIFEST_DIRNAME = '.variants'
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {'mtimeNs': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+class VariantManifest:
+    """Sidecar record of which LR/TB layouts have been built for one dual PDF.
+
+    Stored as ``.variants/<base>.json`` next to the PDFs. A variant is reused
+    while its own file is unchanged and the file it was built from still has
+    the recorded mtime/size, or, when only the mtime moved, the same SHA-256.
+    """
+
+    def __init__(self, base):
+        folder = os.path.join(os.path.dirname(os.path.abspath(base)), MANIFEST_DIRNAME)
+        self.path = os.path.join(folder, os.path.basename(base) + '.json')
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+        self.data.setdefault('variants', {})
+
+    def save(self):
+        # 清单只是省去重复转换的优化：写失败只记日志，不影响任务本身
+        tmp_path = f"{self.path}.{uuid.uuid4().hex}.part"
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ [Cropper] LR/TB 布局清单写入失败: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def is_fresh(self, mode, target, source):
+        entry = self.data['variants'].get(mode)
+        if not entry or not os.path.exists(target) or not os.path.exists(source):
+            return False
+        if _fingerprint(target) != entry.get('target'):
+            return False
+        current = _fingerprint(source)
+        if current == entry.get('source'):
+            return True
+        # mtime 变了但内容可能没变（例如同一文件被重新上传）：大小相同时再比对哈希
+        if current['size'] != entry.get('source', {}).get('size'):
+            return False
+        if file_sha256(source) != entry.get('sourceSha256'):
+            return False
+        entry['source'] = current
+        self.save()
+        return True
+
+    def record(self, mode, target, source, from_mode):
+        self.data['variants'][mode] = {
+            'from': from_mode,
+            'source': _fingerprint(source),
+            'sourceSha256': file_sha256(source),
+            'target': _fingerprint(target),
+            'created': time.time(),
+        }
+        self.save()
@@ -4,10 +4,16 @@ import select
 import subprocess
 import sys
 import threading
+import time
 from datetime import datetime
 
 from utils.deepseek_thinking import prepare_deepseek_runtime_command
 from utils.task_manager import task_manager
+from utils.warm_pool import warm_pool, split_command
+from utils.progress_channel import ProgressChannel, hooked_command
+from utils.cancellation import cancel_registry
+from utils.watchdog import job_watchdog
+from utils.resource_usage import ChildUsage, usage_from_raw, usage_tracker
 
 # Match lines like: "translate ... 10/100"
 # MAIN_PROGRESS_RE = re.compile(r"\btranslate\b[^\r\n]*?(\d+)/(\d+)\b", re.IGNORECASE)
@@ -150,7 +156,7 @@ def _decode_pty_utf8(data, leftover):
         return complete, buf[exc.start :]
 
 
-def _write_pty_chunk(data, leftover, task_id):
+def _write_pty_chunk(data, leftover, report):
     try:
         sys.stdout.buffer.write(data)
         sys.stdout.buffer.flush()
@@ -158,15 +164,28 @@ def _write_pty_chunk(data, leftover, task_id):
         text, leftover = _decode_pty_utf8(data, leftover)
         sys.stdout.write(text)
         sys.stdout.flush()
-        _parse_progress(text, task_id)
+        _parse_progress(text, report)
         return leftover
     text, leftover = _decode_pty_utf8(data, leftover)
-    _parse_progress(text, task_id)
+    _parse_progress(text, report)
     return leftover
 
 
-def execute_with_progress(cmd, task_id, args, env_manager):
-    """Execute translation command and update task progress in real time."""
+def _progress_reporter(task_id, on_progress):
+    """进度更新的去处：on_progress 回调（例如分片进度汇总），否则直接写 task_manager。"""
+    if on_progress is not None:
+        return on_progress
+    if task_id is None:
+        return None
+    return lambda updates: task_manager.report_progress(task_id, updates)
+
+
+def execute_with_progress(cmd, task_id, args, env_manager, on_progress=None):
+    """Execute translation command and update task progress in real time.
+
+    ``on_progress(updates)`` receives the parsed progress instead of
+    ``task_manager`` when given, so several processes can feed one task.
+    """
     final_cmd = cmd
     final_env = os.environ.copy()
     final_env["PYTHONUNBUFFERED"] = "1"
@@ -194,14 +213,43 @@ def execute_with_progress(cmd, task_id, args, env_manager):
 
     print(f"[execute_with_progress] {' '.join(final_cmd)}\n")
 
-    if sys.platform != "win32":
-        _execute_with_pty(final_cmd, final_env, task_id, child_cols, child_rows)
-    else:
-        _execute_with_inherit(final_cmd, final_env, task_id, cols)
+    cancel_registry.check(task_id)
+    report = _progress_reporter(task_id, on_progress)
+    # 进度有变化才算活动；长时间没有进度时 job_watchdog 会结束进程（见 utils/watchdog.py）
+    with job_watchdog.watch(task_id) as watch:
+        if report is not None:
+            report = watch.reporting(report)
+        try:
+            if sys.platform != "win32":
+                _execute_posix(final_cmd, final_env, report, child_cols, child_rows, task_id)
+            else:
+                _execute_with_inherit(final_cmd, final_env, report, cols, task_id)
+        except subprocess.CalledProcessError:
+            # 被取消 / 超时时进程是我们结束的：抛出 JobCancelled / JobTimeout 而不是翻译失败
+            cancel_registry.check(task_id)
+            raise
 
-def _parse_progress(text, task_id):
-    """Parse progress info from text and update task_manager."""
-    if task_id is None:
+
+def _execute_posix(final_cmd, final_env, report, cols, rows, task_id):
+    # pdf2zh_next 通过单独的管道上报 JSON 进度事件；正则解析终端输出只作为兜底
+    channel = ProgressChannel(report) if report is not None and split_command(final_cmd) else None
+    try:
+        if channel is not None:
+            report = channel.fallback
+        if warm_pool.enabled and _execute_with_warm_worker(final_cmd, final_env, report, channel, task_id):
+            return
+        cancel_registry.check(task_id)
+        if channel is not None:
+            final_cmd = hooked_command(final_cmd)
+            final_env = channel.child_env(final_env)
+        _execute_with_pty(final_cmd, final_env, report, cols, rows, channel, task_id)
+    finally:
+        if channel is not None:
+            channel.close()
+
+def _parse_progress(text, report):
+    """Parse progress info from text and pass it to ``report``."""
+    if report is None:
         return
 
     clean = ANSI_ESCAPE.sub("", text)
@@ -216,7 +264,7 @@ def _parse_progress(text, task_id):
         curr, total = int(match.group(1)), int(match.group(2))
         if total > 0:
             pct = int((curr / total) * 100)
-            task_manager.update_task(task_id, {
+            report({
                 "progress": pct,
                 "status": "running",
                 "message": f"translate {curr}/{total}",
@@ -229,7 +277,7 @@ def _parse_progress(text, task_id):
     match = STEP_PROGRESS_RE.search(clean)
     if match:
         step_name = match.group(1).strip()
-        task_manager.update_task(task_id, {
+        report({
             "status": "running",
             "message": step_name,
         })
@@ -242,7 +290,7 @@ def _parse_progress(text, task_id):
     if tqdm_matches:
         curr, total = int(tqdm_matches[-1][0]), int(tqdm_matches[-1][1])
         if total > 0:
-            task_manager.update_task(task_id, {
+            report({
                 "progress": int((curr / total) * 100),
                 "status": "running",
                 "message": f"translate {curr}/{total}",
@@ -254,7 +302,7 @@ def _parse_progress(text, task_id):
         curr, total = int(match.group(1)), int(match.group(2))
         if total > 0:
             pct = int((curr / total) * 100)
-            task_manager.update_task(task_id, {
+            report({
                 "progress": pct,
                 "status": "running",
             })
@@ -305,7 +353,40 @@ def _parse_progress(text, task_id):
 #             })
 
 
-def _execute_with_pty(final_cmd, final_env, task_id, cols, rows):
+def _execute_with_warm_worker(final_cmd, final_env, report, channel=None, task_id=None):
+    """在常驻 pdf2zh_next 进程里执行；没有可用的常驻进程时返回 False，由调用方走 PTY。"""
+    leftover = b""
+
+    def on_output(data):
+        nonlocal leftover
+        leftover = _write_pty_chunk(data, leftover, report)
+
+    progress_fd = channel.write_fd if channel is not None else None
+    started = []
+    begin = time.monotonic()
+
+    def on_start(pid):
+        started.append(pid)
+        cancel_registry.add_process(task_id, pid)
+
+    def on_exit(raw_usage):
+        usage_tracker.add_process(task_id, usage_from_raw(raw_usage, time.monotonic() - begin))
+
+    try:
+        return_code = warm_pool.run(final_cmd, final_env, on_output, progress_fd, on_start, on_exit)
+    finally:
+        for pid in started:
+            cancel_registry.remove_process(task_id, pid)
+    if return_code is None:
+        return False
+    # 非零退出码（包括执行中途连接中断的 LOST_EXIT_CODE）都是任务失败；
+    # 被取消 / 超时的情况由 _execute_posix 的调用方转成 JobCancelled / JobTimeout
+    if return_code != 0:
+        raise subprocess.CalledProcessError(return_code, final_cmd)
+    return True
+
+
+def _execute_with_pty(final_cmd, final_env, report, cols, rows, channel=None, task_id=None):
     """macOS/Linux: run command in PTY and parse progress from stream."""
     import pty
 
@@ -328,9 +409,15 @@ def _execute_with_pty(final_cmd, final_env, task_id, cols, rows):
         env=final_env,
         bufsize=0,
         close_fds=True,
+        pass_fds=(channel.write_fd,) if channel is not None else (),
+        # 独立进程组：取消任务时连同 pdf2zh 启动的子进程一起结束
+        start_new_session=True,
     )
     os.close(slave_fd)
     leftover = b""
+    # 用 wait4 回收子进程才能拿到它的 CPU / 内存 / I/O 用量，不能调用 process.poll()
+    child = ChildUsage(process)
+    cancel_registry.add_process(task_id, process.pid)
 
     try:
         while True:
@@ -340,11 +427,11 @@ def _execute_with_pty(final_cmd, final_env, task_id, cols, rows):
                     data = os.read(master_fd, 4096)
                     if not data:
                         break
-                    leftover = _write_pty_chunk(data, leftover, task_id)
+                    leftover = _write_pty_chunk(data, leftover, report)
                 except OSError:
                     break
 
-            if process.poll() is not None:
+            if child.poll() is not None:
                 try:
                     import fcntl as _fcntl
 
@@ -354,33 +441,37 @@ def _execute_with_pty(final_cmd, final_env, task_id, cols, rows):
                         data = os.read(master_fd, 4096)
                         if not data:
                             break
-                        leftover = _write_pty_chunk(data, leftover, task_id)
+                        leftover = _write_pty_chunk(data, leftover, report)
                 except Exception:
                     pass
                 break
 
         os.close(master_fd)
-        return_code = process.wait()
+        return_code = child.wait()
         if return_code != 0:
             raise subprocess.CalledProcessError(return_code, final_cmd)
 
     except Exception:
-        if process.poll() is None:
+        if child.poll() is None:
             process.kill()
         try:
             os.close(master_fd)
         except Exception:
             pass
         raise
+    finally:
+        cancel_registry.remove_process(task_id, process.pid)
+        if child.ended is not None:
+            usage_tracker.add_process(task_id, child.usage())
 
 
-def _monitor_windows_console_translate_progress(task_id, stop_event):
+def _monitor_windows_console_translate_progress(report, stop_event):
     """
     Windows-only monitor:
     Read console buffer and parse only "translate ... x/y".
     This keeps native progress bars untouched while enabling SSE updates.
     """
-    if task_id is None:
+    if report is None:
         return
 
     try:
@@ -536,7 +627,7 @@ def _monitor_windows_console_translate_progress(task_id, stop_event):
                         last_curr = curr
                         # Keep 100% for final completion update only.
                         pct = 99 if curr >= total else int((curr / total) * 100)
-                        task_manager.update_task(task_id, {
+                        report({
                             "progress": pct,
                             "status": "running",
                             "message": f"translate {curr}/{total}",
@@ -565,7 +656,7 @@ def _monitor_windows_console_translate_progress(task_id, stop_event):
 
             if latest_step and latest_step != last_step:
                 last_step = latest_step
-                task_manager.update_task(task_id, {
+                report({
                     "status": "running",
                     "message": latest_step,
                 })
@@ -673,7 +764,7 @@ def _guard_windows_console_min_width(stop_event, min_cols):
         stop_event.wait(0.08)
 
 
-def _execute_with_inherit(final_cmd, final_env, task_id, cols):
+def _execute_with_inherit(final_cmd, final_env, report, cols, task_id=None):
     """
     Windows: inherit stdout/stderr so terminal keeps native multi-progress UI.
     Progress parsing is done by a side monitor reading console buffer.
@@ -692,7 +783,7 @@ def _execute_with_inherit(final_cmd, final_env, task_id, cols):
     stop_event = threading.Event()
     monitor_thread = threading.Thread(
         target=_monitor_windows_console_translate_progress,
-        args=(task_id, stop_event),
+        args=(report, stop_event),
         daemon=True,
     )
     monitor_thread.start()
@@ -705,12 +796,16 @@ def _execute_with_inherit(final_cmd, final_env, task_id, cols):
     width_guard_thread.start()
 
     return_code = None
+    child = ChildUsage(process)
     try:
-        return_code = process.wait()
+        with cancel_registry.process(task_id, process.pid):
+            return_code = child.wait()
     finally:
         stop_event.set()
         monitor_thread.join(timeout=1.5)
         width_guard_thread.join(timeout=1.0)
+        if child.ended is not None:
+            usage_tracker.add_process(task_id, child.usage())
 
     # _debug_progress_log("EXECUTE_END", task_id=task_id, return_code=return_code)
 
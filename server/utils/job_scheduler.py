@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from utils.cancellation import cancel_registry
+from utils.task_manager import task_manager
+
+
+DEFAULT_MAX_CONCURRENT_JOBS = 2
+# 还没有任何完成记录时，用这个值估算排队等待时间（秒）
+DEFAULT_JOB_SECONDS = 300
+# 只用最近若干个任务的耗时估算 ETA，避免很久以前的大文件一直拉高估计
+DURATION_WINDOW = 20
+
+
+class JobScheduler:
+    """Run translation jobs in a fixed number of slots, first come first served.
+
+    Every accepted ``/translate``, ``/compare`` and ``/crop-compare`` job is
+    queued here instead of getting its own thread. At most ``max_workers``
+    jobs run at once; the rest wait in FIFO order and their queue position /
+    ETA are published through ``task_manager`` so the web page and the plugin
+    can show them.
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_CONCURRENT_JOBS):
+        self.max_workers = max(1, int(max_workers or 1))
+        self.cond = threading.Condition()
+        self.queue = deque()     # (task_id, worker, future)
+        self.running = {}        # task_id -> start timestamp
+        self.threads = {}        # task_id -> 执行该任务的工作线程
+        self.cancelling = set()  # 已取消、但工作线程还没有返回的任务
+        self.durations = deque(maxlen=DURATION_WINDOW)
+        self.workers = []
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def _ensure_workers(self):
+        # 调用方已持有 self.cond
+        self.workers = [t for t in self.workers if t.is_alive()]
+        while len(self.workers) < self.max_workers:
+            t = threading.Thread(
+                target=self._worker_loop,
+                name=f"pdf2zh-job-{len(self.workers) + 1}",
+                daemon=True,
+            )
+            t.start()
+            self.workers.append(t)
+
+    def set_max_workers(self, max_workers):
+        with self.cond:
+            self.max_workers = max(1, int(max_workers or 1))
+            self._ensure_workers()
+            self.cond.notify_all()
+
+    def submit(self, task_id, worker):
+        """Queue ``worker`` for ``task_id`` and return a ``Future`` for its result."""
+        future = Future()
+        with self.cond:
+            self._ensure_workers()
+            self.queue.append((task_id, worker, future))
+            self._publish_queue_positions()
+            self.cond.notify()
+        return future
+
+    def _estimate_job_seconds(self):
+        if not self.durations:
+            return DEFAULT_JOB_SECONDS
+        return sum(self.durations) / len(self.durations)
+
+    def _publish_queue_positions(self):
+        # 调用方已持有 self.cond
+        avg = self._estimate_job_seconds()
+        now = time.time()
+        # 正在运行的任务还需多久空出槽位：用平均耗时减去已运行时间粗略估计
+        remaining = sorted(max(0.0, avg - (now - started)) for started in self.running.values())
+        free_slots = max(0, self.max_workers - len(self.running))
+        for index, (task_id, _, _) in enumerate(self.queue):
+            position = index + 1
+            if index < free_slots:
+                eta = 0
+            else:
+                ahead = index - free_slots
+                rounds, slot = divmod(ahead, self.max_workers)
+                first_free = remaining[slot] if slot < len(remaining) else 0.0
+                eta = int(first_free + rounds * avg)
+            task_manager.update_task(task_id, {
+                "status": "排队中",
+                "queuePosition": position,
+                "etaSeconds": eta,
+                "message": f"排队中：第 {position} 位，预计 {eta} 秒后开始",
+            })
+
+    def _worker_loop(self):
+        while True:
+            with self.cond:
+                while not self.queue or len(self.running) >= self.max_workers:
+                    self.cond.wait()
+                task_id, worker, future = self.queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    self._publish_queue_positions()
+                    continue
+                started = time.time()
+                self.running[task_id] = started
+                self.threads[task_id] = threading.current_thread()
+                cancel_registry.begin(task_id)
+                self._publish_queue_positions()
+
+            task_manager.update_task(task_id, {
+                "status": "running",
+                "queuePosition": 0,
+                "etaSeconds": None,
+                "message": "正在初始化...",
+            })
+            try:
+                result = worker()
+            except BaseException as exc:
+                future.set_exception(exc)
+                ok = False
+            else:
+                future.set_result(result)
+                ok = not (isinstance(result, dict) and result.get("status") == "error")
+
+            removed = cancel_registry.finish(task_id)
+            if removed:
+                print(f"🧹 [Zotero PDF2zh Server] 已删除取消任务的部分输出: {removed}")
+
+            with self.cond:
+                self.threads.pop(task_id, None)
+                self.running.pop(task_id, None)
+                if task_id in self.cancelling:
+                    # 被取消的任务在 cancel() 里已计数，不计入平均耗时
+                    self.cancelling.discard(task_id)
+                else:
+                    self.durations.append(time.time() - started)
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+                self._publish_queue_positions()
+                self.cond.notify_all()
+                if threading.current_thread() not in self.workers:
+                    return
+
+    def cancel(self, task_id):
+        """Cancel a queued or running job; return ``'queued'``, ``'running'`` or None.
+
+        A queued job is simply dropped. A running job has its translator
+        processes killed; its slot is freed only when its worker thread
+        returns, because work in the Server itself (cropping, merging) cannot
+        be interrupted and would otherwise run beside ``max_workers`` others.
+        """
+        with self.cond:
+            for entry in self.queue:
+                if entry[0] == task_id:
+                    self.queue.remove(entry)
+                    entry[2].cancel()
+                    self.cancelled += 1
+                    self._publish_queue_positions()
+                    return 'queued'
+            if task_id not in self.running:
+                return None
+            if task_id not in self.cancelling:
+                self.cancelling.add(task_id)
+                self.cancelled += 1
+        cancel_registry.cancel(task_id)
+        return 'running'
+
+    def stats(self):
+        with self.cond:
+            return {
+                "maxConcurrentJobs": self.max_workers,
+                "running": len(self.running),
+                "queued": len(self.queue),
+                "queuedTaskIds": [entry[0] for entry in self.queue],
+                "runningTaskIds": list(self.running.keys()),
+                "cancellingTaskIds": list(self.cancelling),
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "avgJobSeconds": round(self._estimate_job_seconds(), 1),
+            }
+
+
+# global singleton
+job_scheduler = JobScheduler()
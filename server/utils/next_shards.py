@@ -0,0 +1,107 @@
+import os
+import threading
+import uuid
+
+import fitz
+
+from utils.task_manager import task_manager
+
+
+DEFAULT_SHARDS = 1
+# 每个分片至少这么多页；页数不够时减少分片数，短文档不拆分
+DEFAULT_SHARD_MIN_PAGES = 20
+
+
+def page_shards(first_page, last_page, shards, min_pages=DEFAULT_SHARD_MIN_PAGES):
+    """把 [first_page, last_page]（从 1 开始，含两端）切成最多 shards 段连续页码。"""
+    total = last_page - first_page + 1
+    count = max(1, min(int(shards), total // max(1, int(min_pages))))
+    size, extra = divmod(total, count)
+    ranges = []
+    start = first_page
+    for index in range(count):
+        end = start + size - 1 + (1 if index < extra else 0)
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+class ShardPlan:
+    """Page-range shards of one pdf2zh_next job and which of them finished.
+
+    Every shard translates into its own folder under ``root``. After a
+    stall, ``split_pending`` halves each shard that has not finished, so the
+    retry only translates those pages again; finished shards keep their
+    output and are stitched in page order with the rest.
+    """
+
+    def __init__(self, root, ranges):
+        self.root = root
+        self.shards = [self._new(page_range) for page_range in ranges]
+
+    def _new(self, page_range):
+        return {'range': page_range, 'dir': os.path.join(self.root, uuid.uuid4().hex[:8]), 'done': False}
+
+    def pending(self):
+        return [shard for shard in self.shards if not shard['done']]
+
+    def split_pending(self):
+        shards = []
+        for shard in self.shards:
+            if shard['done']:
+                shards.append(shard)
+            else:
+                first, last = shard['range']
+                shards.extend(self._new(page_range) for page_range in page_shards(first, last, 2, min_pages=1))
+        self.shards = shards
+
+    def parts(self, file_name):
+        return [os.path.join(shard['dir'], file_name) for shard in self.shards]
+
+
+class ShardProgress:
+    """Combine the progress of page-range shards into one task.
+
+    Each shard reports through ``reporter(index)``; the task shows the
+    page-weighted mean of the shard percentages and the latest message.
+    Shards listed in ``finished`` (kept from an earlier attempt) count as done.
+    """
+
+    def __init__(self, task_id, ranges, finished=()):
+        self.task_id = task_id
+        self.weights = [end - start + 1 for start, end in ranges]
+        self.progress = [100 if index in finished else 0 for index in range(len(ranges))]
+        self.lock = threading.Lock()
+
+    def reporter(self, index):
+        return lambda updates: self._update(index, updates)
+
+    def _update(self, index, updates):
+        if self.task_id is None:
+            return
+        with self.lock:
+            if 'progress' in updates:
+                self.progress[index] = updates['progress']
+            total = sum(p * w for p, w in zip(self.progress, self.weights)) / sum(self.weights)
+        fields = {'status': 'running', 'progress': min(99, int(total))}
+        if updates.get('message'):
+            fields['message'] = f"分片 {index + 1}/{len(self.weights)}: {updates['message']}"
+        task_manager.report_progress(self.task_id, fields)
+
+
+def stitch_pdfs(paths, output_path):
+    """按顺序拼接 paths 到 output_path（先写临时文件再替换）。
+
+    各分片嵌入的是同一批字体，garbage=4 会把重复的对象合并掉。
+    """
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.part"
+    try:
+        with fitz.open() as doc:
+            for path in paths:
+                with fitz.open(path) as part:
+                    doc.insert_pdf(part)
+            doc.save(tmp_path, garbage=4, deflate=True)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
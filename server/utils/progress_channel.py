@@ -0,0 +1,113 @@
+import json
+import os
+import threading
+import time
+
+from utils.progress_hook import PROGRESS_FD_ENV
+from utils.warm_pool import split_command
+
+
+HOOK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'progress_hook.py')
+READ_SIZE = 65536
+CLOSE_TIMEOUT = 5
+
+
+def hooked_command(cmd):
+    """把 pdf2zh_next 命令改成经由 progress_hook.py 启动；其他命令返回 None。"""
+    split = split_command(cmd)
+    if split is None:
+        return None
+    python_path, argv = split
+    return [python_path, '-u', HOOK_SCRIPT, *argv]
+
+
+class ProgressChannel:
+    """JSON-lines progress events from pdf2zh_next on a dedicated pipe.
+
+    The child writes one event per line to ``write_fd`` (see
+    progress_hook.py); a reader thread turns them into task updates with
+    stage, counters and an ETA. Once the first event arrives, progress
+    parsed from the terminal stream is ignored, so the PTY output is purely
+    cosmetic. Until then (older pdf2zh_next, pdf2zh 1.x) the regex parser
+    stays in charge through ``fallback``.
+    """
+
+    def __init__(self, report):
+        self.report = report
+        self.active = False
+        self.started = time.monotonic()
+        self.read_fd, self.write_fd = os.pipe()
+        self.thread = threading.Thread(target=self._read_loop, daemon=True)
+        self.thread.start()
+
+    def child_env(self, env):
+        env = dict(env)
+        env[PROGRESS_FD_ENV] = str(self.write_fd)
+        return env
+
+    def fallback(self, updates):
+        if not self.active:
+            self.report(updates)
+
+    def close_write(self):
+        """子进程已经拿到写端后，关闭自己这一份，子进程退出时读端才能读到 EOF。"""
+        if self.write_fd is not None:
+            os.close(self.write_fd)
+            self.write_fd = None
+
+    def close(self):
+        self.close_write()
+        self.thread.join(CLOSE_TIMEOUT)
+        if not self.thread.is_alive():
+            os.close(self.read_fd)
+
+    def _read_loop(self):
+        pending = b''
+        while True:
+            try:
+                data = os.read(self.read_fd, READ_SIZE)
+            except OSError:
+                return
+            if not data:
+                return
+            pending += data
+            *lines, pending = pending.split(b'\n')
+            for line in lines:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(event, dict):
+                    self._handle(event)
+
+    def _handle(self, event):
+        kind = event.get('type')
+        if kind == 'error':
+            self.active = True
+            self.report({'status': 'running', 'message': f"错误: {event.get('error', '')}"})
+            return
+        if kind not in ('progress_start', 'progress_update', 'progress_end'):
+            return
+        self.active = True
+        updates = {'status': 'running', 'progressSource': 'events'}
+        stage = event.get('stage')
+        current, total = event.get('stage_current'), event.get('stage_total')
+        if stage:
+            updates['stage'] = stage
+            updates['message'] = f"{stage} {current}/{total}" if total else stage
+        if total:
+            updates['stageCurrent'] = current
+            updates['stageTotal'] = total
+        if event.get('total_parts'):
+            updates['part'] = event.get('part_index')
+            updates['totalParts'] = event['total_parts']
+        tokens = {key: value for key, value in event.items() if 'token' in key and isinstance(value, (int, float))}
+        if tokens:
+            updates['tokens'] = tokens
+        overall = event.get('overall_progress')
+        if isinstance(overall, (int, float)):
+            updates['progress'] = min(99, int(overall))
+            if overall > 0:
+                elapsed = time.monotonic() - self.started
+                updates['etaSeconds'] = round(elapsed * (100 - overall) / overall)
+        self.report(updates)
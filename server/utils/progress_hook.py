@@ -0,0 +1,89 @@
+"""Run pdf2zh_next with its progress events mirrored to a dedicated fd.
+
+Started as ``python -u progress_hook.py <pdf2zh_next args>`` with the
+Python of the translation environment (and imported by warm_worker.py), so
+it only uses the standard library. When ``PDF2ZH_PROGRESS_FD`` is set, every
+event of ``pdf2zh_next.high_level.do_translate_async_stream`` is written to
+that fd as one JSON line; the terminal output is left untouched. Without
+the variable, or with a pdf2zh_next that has no such stream, it behaves
+exactly like the ``pdf2zh_next`` command.
+"""
+import json
+import os
+import sys
+
+# 不能让 server/utils 出现在 sys.path 上：这里的 config.py / venv.py 会遮住同名模块
+if sys.path and os.path.abspath(sys.path[0] or '.') == os.path.dirname(os.path.abspath(__file__)):
+    del sys.path[0]
+
+PROGRESS_FD_ENV = 'PDF2ZH_PROGRESS_FD'
+# 只转发这些简单类型的字段（translate_result 等对象不转发）
+SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+def load_entry():
+    from importlib.metadata import entry_points
+    eps = entry_points()
+    scripts = eps.select(group='console_scripts') if hasattr(eps, 'select') else eps.get('console_scripts', [])
+    for ep in scripts:
+        if ep.name == 'pdf2zh_next':
+            return ep.load()
+    from pdf2zh_next.main import main
+    return main
+
+
+def _writer(fd):
+    stream = os.fdopen(fd, 'w', buffering=1, encoding='utf-8', closefd=False)
+
+    def write(event):
+        fields = {key: value for key, value in event.items() if isinstance(value, SCALAR_TYPES)}
+        if isinstance(event.get('error'), BaseException):
+            fields['error'] = str(event['error'])
+        try:
+            stream.write(json.dumps(fields, ensure_ascii=False) + '\n')
+        except (OSError, ValueError):
+            pass  # Server 不再读取时不影响翻译本身
+    return write
+
+
+def install(fd):
+    """包装 do_translate_async_stream；pdf2zh_next 没有该接口时返回 False。"""
+    try:
+        from pdf2zh_next import high_level
+    except Exception:
+        return False
+    original = getattr(high_level, 'do_translate_async_stream', None)
+    if original is None:
+        return False
+    write = _writer(fd)
+
+    async def do_translate_async_stream(*args, **kwargs):
+        async for event in original(*args, **kwargs):
+            if isinstance(event, dict):
+                write(event)
+            yield event
+
+    high_level.do_translate_async_stream = do_translate_async_stream
+    return True
+
+
+def install_from_env():
+    fd = os.environ.get(PROGRESS_FD_ENV)
+    if not fd:
+        return False
+    try:
+        return install(int(fd))
+    except ValueError:
+        return False
+
+
+def main():
+    install_from_env()
+    entry = load_entry()
+    sys.argv = ['pdf2zh_next', *sys.argv[1:]]
+    result = entry()
+    return result if isinstance(result, int) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
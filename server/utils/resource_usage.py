@@ -0,0 +1,224 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils.task_manager import task_manager
+
+
+# Linux 的 ru_maxrss 单位是 KB，macOS 是字节；ru_inblock / ru_oublock 按 512 字节的块计
+RSS_UNIT = 1 if sys.platform == 'darwin' else 1024
+BLOCK_SIZE = 512
+USAGE_FIELDS = ('cpuUserSeconds', 'cpuSystemSeconds', 'readBytes', 'writeBytes', 'wallSeconds')
+
+
+def raw_rusage(ru):
+    """struct rusage -> 可 JSON 序列化的原始字段（warm_worker.py 用同样的格式回传）。"""
+    return {
+        'utime': ru.ru_utime,
+        'stime': ru.ru_stime,
+        'maxrss': ru.ru_maxrss,
+        'inblock': ru.ru_inblock,
+        'oublock': ru.ru_oublock,
+    }
+
+
+def usage_from_raw(raw, wall_seconds):
+    usage = {'wallSeconds': round(wall_seconds, 3)}
+    if raw:
+        usage.update({
+            'cpuUserSeconds': round(raw.get('utime', 0), 3),
+            'cpuSystemSeconds': round(raw.get('stime', 0), 3),
+            'maxRssMb': round(raw.get('maxrss', 0) * RSS_UNIT / 1048576, 1),
+            'readBytes': int(raw.get('inblock', 0)) * BLOCK_SIZE,
+            'writeBytes': int(raw.get('oublock', 0)) * BLOCK_SIZE,
+        })
+    return usage
+
+
+class ChildUsage:
+    """Reap a ``Popen`` child with ``wait4`` to get its resource usage.
+
+    Use ``poll``/``wait`` instead of the ``Popen`` methods: once ``Popen``
+    has reaped the child its rusage is gone. The usage covers the child and
+    every descendant it waited for (BabelDOC's worker processes). Without
+    ``wait4`` (Windows) only the wall time is measured.
+    """
+
+    def __init__(self, process):
+        self.process = process
+        self.started = time.monotonic()
+        self.ended = None
+        self.raw = None
+
+    def poll(self):
+        return self._reap(os.WNOHANG) if hasattr(os, 'wait4') else self._done(self.process.poll())
+
+    def wait(self):
+        return self._reap(0) if hasattr(os, 'wait4') else self._done(self.process.wait())
+
+    def _reap(self, options):
+        if self.process.returncode is not None:
+            return self.process.returncode
+        try:
+            pid, status, ru = os.wait4(self.process.pid, options)
+        except ChildProcessError:
+            # 已被别处回收（Popen 内部），拿不到资源用量
+            return self._done(self.process.poll())
+        if pid == 0:
+            return None
+        self.process.returncode = os.waitstatus_to_exitcode(status)
+        self.raw = raw_rusage(ru)
+        return self._done(self.process.returncode)
+
+    def _done(self, code):
+        if code is not None and self.ended is None:
+            self.ended = time.monotonic()
+        return code
+
+    def usage(self):
+        return usage_from_raw(self.raw, (self.ended or time.monotonic()) - self.started)
+
+
+class UsageTracker:
+    """What each running job consumed, published as ``usage`` on its task.
+
+    Translator processes add their rusage with ``add_process`` (CPU and I/O
+    are summed, ``maxRssMb`` is the largest single process). Work done in
+    the server itself is timed with ``timed``, which records wall and thread
+    CPU seconds for the job bound to the current thread by ``collect``.
+    Thread CPU does not see the crop process pool, so its workers report
+    their CPU back with each chunk and ``add_worker_cpu`` adds it to the
+    enclosing timing.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.jobs = {}  # task_id -> usage
+        self.local = threading.local()
+
+    @contextmanager
+    def collect(self, task_id):
+        with self.lock:
+            self.jobs[task_id] = {'processes': 0, 'timings': {}}
+        self.local.task_id = task_id
+        try:
+            yield
+        finally:
+            self.local.task_id = None
+            with self.lock:
+                self.jobs.pop(task_id, None)
+
+    def add_process(self, task_id, usage):
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if job is None:
+                return
+            job['processes'] += 1
+            for field in USAGE_FIELDS:
+                if field in usage:
+                    job[field] = round(job.get(field, 0) + usage[field], 3)
+            if 'maxRssMb' in usage:
+                job['maxRssMb'] = max(job.get('maxRssMb', 0), usage['maxRssMb'])
+            snapshot = dict(job, timings=dict(job['timings']))
+        task_manager.update_task(task_id, {'usage': snapshot})
+
+    @contextmanager
+    def timed(self, name):
+        """给当前线程绑定的任务记一段耗时；嵌套时只记最外层，没有绑定任务时什么都不做。"""
+        task_id = getattr(self.local, 'task_id', None)
+        if task_id is None or getattr(self.local, 'timing', False):
+            yield
+            return
+        self.local.timing = True
+        self.local.worker_cpu = 0
+        started, cpu_started = time.monotonic(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.local.timing = False
+            cpu_seconds = time.thread_time() - cpu_started + self.local.worker_cpu
+            self._add_timing(task_id, name, time.monotonic() - started, cpu_seconds)
+
+    def add_worker_cpu(self, seconds):
+        """把进程池 worker 替当前计时段消耗的 CPU 秒数计入该段（不在计时段内时忽略）。"""
+        if getattr(self.local, 'timing', False):
+            self.local.worker_cpu += seconds
+
+    def _add_timing(self, task_id, name, seconds, cpu_seconds):
+        with self.lock:
+            job = self.jobs.get(task_id)
+            if job is None:
+                return
+            timing = job['timings'].get(name, {'calls': 0, 'seconds': 0, 'cpuSeconds': 0})
+            job['timings'][name] = {
+                'calls': timing['calls'] + 1,
+                'seconds': round(timing['seconds'] + seconds, 3),
+                'cpuSeconds': round(timing['cpuSeconds'] + cpu_seconds, 3),
+            }
+            snapshot = dict(job, timings=dict(job['timings']))
+        task_manager.update_task(task_id, {'usage': snapshot})
+
+
+def _job_seconds(item):
+    try:
+        return (datetime.fromisoformat(item['endTime']) - datetime.fromisoformat(item['startTime'])).total_seconds()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def summarize(items):
+    """按 engine / service 汇总已完成任务的资源用量（/api/usage）。"""
+    groups = {}
+    for item in items:
+        key = (item.get('engine') or '', item.get('service') or '')
+        group = groups.setdefault(key, {
+            'engine': key[0],
+            'service': key[1],
+            'jobs': 0,
+            'byStatus': {},
+            'measured': 0,
+            'totals': {'jobSeconds': 0, 'cpuSeconds': 0, 'readBytes': 0, 'writeBytes': 0},
+            'peakRssMb': 0,
+            'stageSeconds': {},
+        })
+        group['jobs'] += 1
+        status = item.get('status') or 'unknown'
+        group['byStatus'][status] = group['byStatus'].get(status, 0) + 1
+        job_seconds = _job_seconds(item)
+        if job_seconds is not None:
+            group['totals']['jobSeconds'] += job_seconds
+        usage = item.get('usage')
+        if not usage:
+            continue
+        group['measured'] += 1
+        totals = group['totals']
+        totals['cpuSeconds'] += usage.get('cpuUserSeconds', 0) + usage.get('cpuSystemSeconds', 0)
+        totals['readBytes'] += usage.get('readBytes', 0)
+        totals['writeBytes'] += usage.get('writeBytes', 0)
+        group['peakRssMb'] = max(group['peakRssMb'], usage.get('maxRssMb', 0))
+        for name, timing in (usage.get('timings') or {}).items():
+            group['stageSeconds'][name] = group['stageSeconds'].get(name, 0) + timing.get('seconds', 0)
+
+    summary = []
+    for group in groups.values():
+        totals = group['totals']
+        measured = group['measured']
+        stage_seconds = group.pop('stageSeconds')
+        group['averages'] = {
+            'jobSeconds': round(totals['jobSeconds'] / group['jobs'], 1),
+            'cpuSeconds': round(totals['cpuSeconds'] / measured, 1) if measured else None,
+            # 每个有用量记录的任务在各阶段（translate / crop / ...）平均花的秒数
+            'stageSeconds': {name: round(seconds / measured, 2) for name, seconds in stage_seconds.items()} if measured else {},
+        }
+        for field in ('jobSeconds', 'cpuSeconds'):
+            totals[field] = round(totals[field], 1)
+        summary.append(group)
+    summary.sort(key=lambda group: group['jobs'], reverse=True)
+    return summary
+
+
+# global singleton
+usage_tracker = UsageTracker()
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+
+
+CACHE_DIRNAME = '.cache'
+INDEX_FILENAME = 'index.json'
+DEFAULT_MAX_ENTRIES = 200
+DEFAULT_MAX_MB = 2048
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """SHA-256 of a file, read in chunks so big PDFs are never fully in memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stem(path):
+    name = os.path.basename(str(path))
+    return name[:-4] if name.lower().endswith('.pdf') else name
+
+
+class ResultCache:
+    """Content-addressed cache of finished ``/translate`` outputs.
+
+    The key is the SHA-256 of the uploaded PDF plus ``Config.cache_digest()``,
+    which also covers the content of the engine's base config file.
+    Outputs are copied under ``translated/.cache/<key>/`` and stored by their
+    suffix after the input file stem, so a hit for the same paper uploaded
+    under another name produces correctly named files again. Copies, not hard
+    links: translators and Cropper rewrite output files in place, which would
+    corrupt a linked cache entry. Entries are evicted in LRU order
+    once either the entry count or the total size limit is exceeded.
+    """
+
+    def __init__(self, output_folder, max_entries=DEFAULT_MAX_ENTRIES, max_mb=DEFAULT_MAX_MB):
+        self.cache_dir = os.path.join(output_folder, CACHE_DIRNAME)
+        self.index_path = os.path.join(self.cache_dir, INDEX_FILENAME)
+        self.max_entries = max(1, int(max_entries))
+        self.max_bytes = max(1, int(max_mb)) * 1024 * 1024
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> entry, 最近使用的在末尾
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.enabled = True
+        self._load_index()
+
+    def configure(self, enabled=True, max_entries=None, max_mb=None):
+        with self.lock:
+            self.enabled = bool(enabled)
+            if max_entries is not None:
+                self.max_entries = max(1, int(max_entries))
+            if max_mb is not None:
+                self.max_bytes = max(1, int(max_mb)) * 1024 * 1024
+            self._evict()
+            self._save_index()
+
+    @staticmethod
+    def make_key(input_path, config, file_hash=None, base_config_file=None, resolved=None):
+        return f"{file_hash or file_sha256(input_path)}-{config.cache_digest(base_config_file, resolved)}"
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        entries = sorted(data.get('entries', {}).items(), key=lambda kv: kv[1].get('lastUsed', 0))
+        for key, entry in entries:
+            self.entries[key] = entry
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _drop(self, key):
+        self.entries.pop(key, None)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def _evict(self):
+        total = sum(entry.get('size', 0) for entry in self.entries.values())
+        while self.entries and (len(self.entries) > self.max_entries or total > self.max_bytes):
+            key, entry = next(iter(self.entries.items()))
+            total -= entry.get('size', 0)
+            self._drop(key)
+            self.evictions += 1
+
+    def lookup(self, key, input_path, output_folder):
+        """Return output paths for ``input_path`` on a hit, otherwise ``None``."""
+        with self.lock:
+            if not self.enabled:
+                return None
+            entry = self.entries.get(key)
+            entry_dir = self._entry_dir(key)
+            if entry is None or not all(
+                os.path.exists(os.path.join(entry_dir, str(index))) for index in range(len(entry['suffixes']))
+            ):
+                if entry is not None:
+                    self._drop(key)
+                    self._save_index()
+                self.misses += 1
+                return None
+
+            stem = _stem(input_path)
+            outputs = []
+            for index, suffix in enumerate(entry['suffixes']):
+                cached = os.path.join(entry_dir, str(index))
+                target = os.path.join(output_folder, stem + suffix)
+                if os.path.exists(target):
+                    os.remove(target)
+                shutil.copyfile(cached, target)
+                outputs.append(target)
+
+            entry['hits'] = entry.get('hits', 0) + 1
+            entry['lastUsed'] = time.time()
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self._save_index()
+            return outputs
+
+    def store(self, key, input_path, output_paths):
+        stem = _stem(input_path)
+        suffixes = []
+        sources = []
+        for path in output_paths:
+            name = os.path.basename(path)
+            if not name.startswith(stem) or not os.path.exists(path):
+                continue
+            suffixes.append(name[len(stem):])
+            sources.append(path)
+        if not sources:
+            return
+
+        with self.lock:
+            if not self.enabled:
+                return
+            entry_dir = self._entry_dir(key)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.makedirs(entry_dir, exist_ok=True)
+            size = 0
+            for index, path in enumerate(sources):
+                cached = os.path.join(entry_dir, str(index))
+                shutil.copyfile(path, cached)
+                size += os.path.getsize(cached)
+            now = time.time()
+            self.entries.pop(key, None)
+            self.entries[key] = {
+                'suffixes': suffixes,
+                'size': size,
+                'created': now,
+                'lastUsed': now,
+                'hits': 0,
+            }
+            self._evict()
+            self._save_index()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self.entries),
+                'maxEntries': self.max_entries,
+                'sizeBytes': sum(entry.get('size', 0) for entry in self.entries.values()),
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': round(self.hits / lookups, 3) if lookups else 0,
+                'evictions': self.evictions,
+            }
@@ -1,7 +1,9 @@
+import heapq
 import json
 import os
 import threading
 import time
+from collections import deque
 from datetime import datetime
 
 
@@ -29,11 +31,68 @@ from datetime import datetime
 #         pass
 
 
+HISTORY_LIMIT = 200
+_MISSING = object()
+# 任务完成后在活动列表里保留多少秒（供前端显示"完成"状态），之后由回收线程移除
+DEFAULT_RETENTION_SECONDS = 30
+# 每个任务的进度每秒最多发布几次；期间的更新合并后再发布
+DEFAULT_PROGRESS_HZ = 4
+# complete_task 的结果 -> 活动列表里显示的状态
+TASK_STATUS_LABELS = {"success": "完成", "failed": "失败", "cancelled": "已取消"}
+
+
+class _ProgressBuffer:
+    """One task's progress updates waiting to be published (guarded by ``lock``)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.published = {}
+        self.last_publish = 0.0
+        self.timer = None
+        self.closed = False
+
+
 class TaskManager:
+    """Active tasks, history and change notification for the progress UI.
+
+    Task dicts are copy-on-write: every change stores a new dict, so readers
+    only hold ``lock`` long enough to take references and never copy or see
+    a half-applied update. Frequent progress reports go through
+    ``report_progress``, which merges them per task (with a per-task lock)
+    and publishes at most ``progress_hz`` times per second.
+    """
+
     def __init__(self):
         self.active_tasks = {}
         self.lock = threading.Lock()
-        self.progress_history = []
+        # 每次任务变化 version +1 并唤醒等待者；/events 和长轮询靠它推送，无需定时轮询
+        self.changed = threading.Condition(self.lock)
+        self.version = 0
+        # 历史记录：最新的在左侧；history_index 按 taskId 直接定位，查询不必遍历
+        self.progress_history = deque()
+        self.history_index = {}
+        # 可选的磁盘日志 (utils/task_store.TaskStore)，重启后仍能查到已完成任务的结果
+        self.store = None
+        # 已完成任务的到期时间堆 (expires_at, task_id)，由单个回收线程处理
+        self.retention_seconds = DEFAULT_RETENTION_SECONDS
+        self.expiry_heap = []
+        self.expiry_cond = threading.Condition(self.lock)
+        self.reaper = None
+        self.evictions = 0
+        # 进度合并：task_id -> _ProgressBuffer，buffers_lock 只保护这个字典
+        self.progress_interval = 1.0 / DEFAULT_PROGRESS_HZ
+        self.progress_buffers = {}
+        self.buffers_lock = threading.Lock()
+        self.progress_received = 0
+        self.progress_published = 0
+
+    def _bump_version(self, task=None):
+        # 调用方已持有 self.lock
+        self.version += 1
+        if task is not None:
+            task["version"] = self.version
+        self.changed.notify_all()
 
     @staticmethod
     def _task_snapshot(task_id, task):
@@ -49,33 +108,154 @@ class TaskManager:
         }
         return json.dumps(snapshot, ensure_ascii=False, sort_keys=True)
 
+    def attach_store(self, store):
+        """Journal task transitions to ``store`` and replay its recent history.
+
+        Tasks that were still queued or running when the server stopped are
+        recorded as failed, so clients waiting on them get an answer.
+        """
+        interrupted = []
+        with self.lock:
+            self.store = store
+            for item in reversed(store.query(finished=True, limit=HISTORY_LIMIT)):
+                self._add_history(item)
+            for item in store.query(finished=False, limit=HISTORY_LIMIT):
+                if item.get("taskId") in self.active_tasks:
+                    continue
+                item.update({
+                    "active": False,
+                    "finished": True,
+                    "status": "failed",
+                    "error": "服务器重启，任务已中断",
+                    "endTime": datetime.now().isoformat(),
+                })
+                self._add_history(item)
+                interrupted.append(item)
+            # 版本号接着日志里的最大值继续递增，长轮询客户端的 since 不会倒退
+            self.version = max([self.version] + [int(item.get("version") or 0) for item in self.progress_history])
+        for item in interrupted:
+            self._journal(item)
+        return len(self.progress_history)
+
+    def _journal(self, snapshot):
+        # 在 self.lock 之外调用：写盘失败只打印，不影响翻译流程
+        if self.store is None or snapshot is None:
+            return
+        try:
+            self.store.record(snapshot)
+        except Exception as e:
+            print(f"⚠️ [Zotero PDF2zh Server] 写入任务日志失败: {e}")
+
     def add_task(self, task_id, info):
+        info = dict(info)
         with self.lock:
             self.active_tasks[task_id] = info
+            self._bump_version(info)
+            snapshot = dict(info, taskId=task_id)
             # _debug_progress_log("TASK_ADD", task=self._task_snapshot(task_id, self.active_tasks[task_id]))
+        self._journal(snapshot)
 
     def update_task(self, task_id, updates):
+        self._apply_updates(task_id, updates)
+
+    def _apply_updates(self, task_id, updates, running_only=False):
+        snapshot = None
         with self.lock:
-            if task_id in self.active_tasks:
-                self.active_tasks[task_id].update(updates)
-                # _debug_progress_log(
-                #     "TASK_UPDATE",
-                #     updates=json.dumps(updates, ensure_ascii=False, sort_keys=True),
-                #     task=self._task_snapshot(task_id, self.active_tasks[task_id]),
-                # )
+            current = self.active_tasks.get(task_id)
+            if current is None or (running_only and current.get("finished")):
+                return
+            status_changed = "status" in updates and updates["status"] != current.get("status")
+            task = dict(current, **updates)
+            self._bump_version(task)
+            self.active_tasks[task_id] = task
+            # 只记录状态切换（排队中 -> running 等），进度刷新不写盘
+            if status_changed:
+                snapshot = dict(task, taskId=task_id)
+        self._journal(snapshot)
+
+    def set_progress_rate(self, hz):
+        self.progress_interval = 1.0 / hz if hz and hz > 0 else 0.0
+
+    def report_progress(self, task_id, updates):
+        """Merge a progress report into the task's buffer and publish it rate-limited.
+
+        Unchanged fields are dropped; a report that changes nothing is not
+        published at all. Status changes are published immediately, the rest
+        at most ``progress_hz`` times per second, with a timer flushing the
+        last merged state. Reports for finished tasks are ignored.
+        """
+        with self.buffers_lock:
+            buffer = self.progress_buffers.get(task_id)
+            if buffer is None:
+                buffer = self.progress_buffers[task_id] = _ProgressBuffer()
+            self.progress_received += 1
+        with buffer.lock:
+            if buffer.closed:
+                return
+            for key, value in updates.items():
+                if buffer.published.get(key, _MISSING) != value or key in buffer.pending:
+                    buffer.pending[key] = value
+            if not buffer.pending:
+                return
+            wait = buffer.last_publish + self.progress_interval - time.monotonic()
+            if wait > 0 and "status" not in buffer.pending:
+                if buffer.timer is None:
+                    buffer.timer = threading.Timer(wait, self._flush_progress, (task_id, buffer))
+                    buffer.timer.daemon = True
+                    buffer.timer.start()
+                return
+            self._publish_progress(task_id, buffer)
+
+    def _flush_progress(self, task_id, buffer):
+        with buffer.lock:
+            buffer.timer = None
+            if not buffer.closed and buffer.pending:
+                self._publish_progress(task_id, buffer)
+
+    def _publish_progress(self, task_id, buffer):
+        # 调用方已持有 buffer.lock（锁顺序：buffer.lock -> self.lock）
+        fields, buffer.pending = buffer.pending, {}
+        buffer.published.update(fields)
+        buffer.last_publish = time.monotonic()
+        if buffer.timer is not None:
+            buffer.timer.cancel()
+            buffer.timer = None
+        with self.buffers_lock:
+            self.progress_published += 1
+        self._apply_updates(task_id, fields, running_only=True)
+
+    def _close_progress(self, task_id):
+        with self.buffers_lock:
+            buffer = self.progress_buffers.pop(task_id, None)
+        if buffer is None:
+            return
+        with buffer.lock:
+            buffer.closed = True
+            buffer.pending = {}
+            if buffer.timer is not None:
+                buffer.timer.cancel()
+                buffer.timer = None
 
     def complete_task(self, task_id, status, message=None, file_list=None, error=None, file_paths=None, output_dir=None, result=None):
+        # 丢弃还没发布的进度，避免完成之后又被改回 running
+        self._close_progress(task_id)
+        history_item = self._complete_task(task_id, status, message, file_list, error, file_paths, output_dir, result)
+        self._journal(history_item)
+
+    def _complete_task(self, task_id, status, message, file_list, error, file_paths, output_dir, result):
         with self.lock:
             if task_id not in self.active_tasks:
-                return
+                return None
             task = self.active_tasks[task_id]
             # Client disconnect after a successful translate can raise while
             # returning HTTP; do not overwrite a completed success as failure.
-            if task.get("active") is False and task.get("status") == "完成":
-                return
+            # A cancelled task stays cancelled even if its job ends afterwards.
+            if task.get("active") is False and task.get("status") in ("完成", "已取消"):
+                return None
+            task = self.active_tasks[task_id] = dict(task)
             task["active"] = False
             task["finished"] = True
-            task["status"] = "完成" if status == "success" else "失败"
+            task["status"] = TASK_STATUS_LABELS.get(status, "失败")
             task["progress"] = 100 if status == "success" else task.get("progress", 0)
             if message:
                 task["message"] = message
@@ -90,11 +270,12 @@ class TaskManager:
                 task["result"] = result
             if error:
                 task["error"] = str(error)
+            self._bump_version(task)
 
             history_item = {
                 "taskId": task_id,
                 "fileName": task.get("fileName"),
-                "status": "success" if status == "success" else "failed",
+                "status": status if status in TASK_STATUS_LABELS else "failed",
                 "finished": True,
                 "active": False,
                 "engine": task.get("engine"),
@@ -102,6 +283,7 @@ class TaskManager:
                 "startTime": task.get("startTime"),
                 "endTime": task.get("endTime"),
                 "config": task.get("config"),
+                "version": task.get("version"),
             }
             if file_list:
                 history_item["fileList"] = list(file_list)
@@ -113,29 +295,131 @@ class TaskManager:
                 history_item["result"] = result
             if error:
                 history_item["error"] = str(error)
+            if task.get("usage"):
+                history_item["usage"] = task["usage"]
+
+            self._add_history(history_item)
 
-            self.progress_history.insert(0, history_item)
-            if len(self.progress_history) > 200:
-                self.progress_history = self.progress_history[:200]
+            self._schedule_removal(task_id)
+            return dict(history_item)
 
-            threading.Thread(target=self._delayed_remove, args=(task_id,), daemon=True).start()
+    def _add_history(self, item):
+        # 调用方已持有 self.lock
+        previous = self.history_index.pop(item["taskId"], None)
+        if previous is not None:
+            self.progress_history.remove(previous)
+        self.progress_history.appendleft(item)
+        self.history_index[item["taskId"]] = item
+        while len(self.progress_history) > HISTORY_LIMIT:
+            dropped = self.progress_history.pop()
+            if self.history_index.get(dropped["taskId"]) is dropped:
+                del self.history_index[dropped["taskId"]]
 
     def get_active_tasks_list(self):
         with self.lock:
-            tasks = list(self.active_tasks.values())
-            return tasks
+            # 任务字典写时复制、不会再被修改，直接返回引用即可
+            return list(self.active_tasks.values())
 
     def get_history(self):
         with self.lock:
             return list(self.progress_history)
 
-    def _delayed_remove(self, task_id):
-        time.sleep(30)
+    def query_history(self, task_id=None, status=None, since=None, until=None, limit=HISTORY_LIMIT):
+        """Filter finished tasks; uses the on-disk journal when one is attached."""
+        if self.store is not None:
+            return self.store.query(task_id=task_id, status=status, since=since, until=until, finished=True, limit=limit)
+        with self.lock:
+            items = [
+                item for item in self.progress_history
+                if (not task_id or item.get("taskId") == task_id)
+                and (not status or item.get("status") == status)
+                and (not since or (item.get("startTime") or "") >= since)
+                and (not until or (item.get("startTime") or "") < until)
+            ]
+        return items[:max(1, int(limit))]
+
+    def _find_task(self, task_id):
+        # 调用方已持有 self.lock
+        task = self.active_tasks.get(task_id)
+        if task is not None:
+            return task
+        return self.history_index.get(task_id)
+
+    def get_task(self, task_id):
+        with self.lock:
+            task = self._find_task(task_id)
+            if task is not None:
+                return dict(task)
+        # 内存里的历史记录已淘汰时再查磁盘日志
+        return self.store.get(task_id) if self.store is not None else None
+
+    def wait_for_change(self, since, timeout):
+        """Block until any task changes after version ``since``; return the current version."""
         with self.lock:
-            if task_id in self.active_tasks:
-                # _debug_progress_log("TASK_REMOVE", task_id=task_id)
-                del self.active_tasks[task_id]
+            self.changed.wait_for(lambda: self.version > since, timeout)
+            return self.version
 
+    def wait_for_task(self, task_id, since, timeout):
+        """Long-poll one task: return it once its version is newer than ``since``.
+
+        Returns the task as-is when ``timeout`` expires, or ``None`` if the
+        task is unknown.
+        """
+        def ready():
+            task = self._find_task(task_id)
+            return task is None or task.get("version", 0) > since
+
+        with self.lock:
+            self.changed.wait_for(ready, timeout)
+            task = self._find_task(task_id)
+            if task is not None:
+                return dict(task)
+        return self.store.get(task_id) if self.store is not None else None
+
+    def set_retention(self, seconds):
+        with self.lock:
+            self.retention_seconds = max(0, float(seconds))
+            self.expiry_cond.notify()
+
+    def _schedule_removal(self, task_id):
+        # 调用方已持有 self.lock
+        heapq.heappush(self.expiry_heap, (time.time() + self.retention_seconds, task_id))
+        if self.reaper is None or not self.reaper.is_alive():
+            self.reaper = threading.Thread(target=self._reap_expired, name="pdf2zh-task-reaper", daemon=True)
+            self.reaper.start()
+        self.expiry_cond.notify()
+
+    def _reap_expired(self):
+        with self.lock:
+            while True:
+                now = time.time()
+                removed = False
+                while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                    _, task_id = heapq.heappop(self.expiry_heap)
+                    task = self.active_tasks.get(task_id)
+                    if task is not None and task.get("finished"):
+                        # _debug_progress_log("TASK_REMOVE", task_id=task_id)
+                        del self.active_tasks[task_id]
+                        self.evictions += 1
+                        removed = True
+                if removed:
+                    self._bump_version()
+                timeout = self.expiry_heap[0][0] - now if self.expiry_heap else None
+                self.expiry_cond.wait(timeout)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "active": len(self.active_tasks),
+                "history": len(self.progress_history),
+                "pendingEviction": len(self.expiry_heap),
+                "evictions": self.evictions,
+                "retentionSeconds": self.retention_seconds,
+                "version": self.version,
+                "progressReports": self.progress_received,
+                "progressPublished": self.progress_published,
+                "progressHz": round(1.0 / self.progress_interval, 2) if self.progress_interval else None,
+            }
 
 # global singleton
 task_manager = TaskManager()
@@ -0,0 +1,147 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+TASK_STORE_DIRNAME = '.tasks'
+TASK_STORE_FILENAME = 'tasks.sqlite3'
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_MAX_ENTRIES = 5000
+# 每写入这么多次检查一次保留期限，避免每次写入都做删除
+PRUNE_EVERY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id    TEXT PRIMARY KEY,
+    version    INTEGER NOT NULL DEFAULT 0,
+    status     TEXT,
+    finished   INTEGER NOT NULL DEFAULT 0,
+    start_time TEXT,
+    end_time   TEXT,
+    updated_at REAL NOT NULL,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, updated_at);
+"""
+
+
+class TaskStore:
+    """SQLite (WAL) journal of task state transitions under ``translated/.tasks/``.
+
+    ``TaskManager`` writes a row whenever a task is added, changes status or
+    finishes, so the result of an async job can still be found after the
+    in-memory entry is gone or the server restarted. Rows older than
+    ``retention_days`` or beyond ``max_entries`` are pruned.
+    """
+
+    def __init__(self, output_folder, retention_days=DEFAULT_RETENTION_DAYS, max_entries=DEFAULT_MAX_ENTRIES):
+        folder = os.path.join(output_folder, TASK_STORE_DIRNAME)
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, TASK_STORE_FILENAME)
+        self.retention_days = max(1, int(retention_days))
+        self.max_entries = max(1, int(max_entries))
+        self.lock = threading.Lock()
+        self.writes = 0
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(_SCHEMA)
+        self.prune()
+
+    def record(self, task):
+        """Upsert one task snapshot; older versions never overwrite newer ones."""
+        data = json.dumps(task, ensure_ascii=False, default=str)
+        with self.lock:
+            self.conn.execute(
+                """
+                INSERT INTO tasks (task_id, version, status, finished, start_time, end_time, updated_at, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(task_id) DO UPDATE SET
+                    version = excluded.version,
+                    status = excluded.status,
+                    finished = excluded.finished,
+                    start_time = excluded.start_time,
+                    end_time = excluded.end_time,
+                    updated_at = excluded.updated_at,
+                    data = excluded.data
+                WHERE excluded.version >= tasks.version
+                """,
+                (
+                    task['taskId'],
+                    int(task.get('version') or 0),
+                    task.get('status'),
+                    1 if task.get('finished') else 0,
+                    task.get('startTime'),
+                    task.get('endTime'),
+                    time.time(),
+                    data,
+                ),
+            )
+            self.conn.commit()
+            self.writes += 1
+            due = self.writes % PRUNE_EVERY == 0
+        if due:
+            self.prune()
+
+    def get(self, task_id):
+        with self.lock:
+            row = self.conn.execute('SELECT data FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def query(self, task_id=None, status=None, since=None, until=None, finished=None, limit=200):
+        """Newest first. ``since`` / ``until`` are ISO dates or datetimes compared with startTime."""
+        clauses, params = [], []
+        if task_id:
+            clauses.append('task_id = ?')
+            params.append(task_id)
+        if status:
+            clauses.append('status = ?')
+            params.append(status)
+        if since:
+            clauses.append('start_time >= ?')
+            params.append(since)
+        if until:
+            clauses.append('start_time < ?')
+            params.append(until)
+        if finished is not None:
+            clauses.append('finished = ?')
+            params.append(1 if finished else 0)
+        sql = 'SELECT data FROM tasks'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY updated_at DESC LIMIT ?'
+        params.append(max(1, int(limit)))
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def prune(self):
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).timestamp()
+        with self.lock:
+            self.conn.execute('DELETE FROM tasks WHERE updated_at < ?', (cutoff,))
+            self.conn.execute(
+                """
+                DELETE FROM tasks WHERE task_id IN (
+                    SELECT task_id FROM tasks ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT status, COUNT(*) AS n FROM tasks GROUP BY status').fetchall()
+        counts = {row['status']: row['n'] for row in rows}
+        return {
+            'path': self.path,
+            'entries': sum(counts.values()),
+            'byStatus': counts,
+            'retentionDays': self.retention_days,
+            'maxEntries': self.max_entries,
+        }
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+
+
+UPLOAD_DIRNAME = '.uploads'
+# 最近使用时间记在这里，而不是改 blob 的 mtime：blob 会被硬链接到翻译目录，
+# 改 mtime 会连用户看到的文件一起改掉
+INDEX_FILENAME = 'index.json'
+# 只用于查询 / 引用的最近使用时间先记在内存里，最多隔这么多秒写一次索引；写入和淘汰 blob 时立即写
+INDEX_FLUSH_SECONDS = 60
+DEFAULT_MAX_MB = 4096
+# 单个上传最大的字节数 (MB)；PUT 超过时中止并返回 413
+DEFAULT_MAX_UPLOAD_MB = 512
+CHUNK_SIZE = 1024 * 1024
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadMissingError(FileNotFoundError):
+    """The request referenced a blob by hash that the store does not have."""
+
+
+class UploadTooLargeError(ValueError):
+    """An upload exceeded the store's per-blob size limit."""
+
+
+def normalize_sha256(value):
+    """Return a lower-case hex digest, or raise ValueError for anything else."""
+    digest = str(value or '').strip().lower()
+    if not _SHA256_RE.match(digest):
+        raise ValueError("Invalid SHA-256 digest")
+    return digest
+
+
+def place_file(src, dst):
+    """Put a copy of ``src`` at ``dst`` without ever exposing a half-written ``dst``.
+
+    Hard links are used when possible; ``dst`` is always swapped in with
+    ``os.replace`` so an existing inode shared with ``src`` is never truncated.
+    """
+    tmp_path = f"{dst}.{uuid.uuid4().hex}.part"
+    try:
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class UploadStore:
+    """Content-addressed store of uploaded PDFs, named by their SHA-256.
+
+    The plugin asks ``HEAD /api/uploads/<sha256>`` before sending a PDF. Only
+    missing blobs are transferred; ``/translate``, ``/crop``, ``/compare`` and
+    ``/crop-compare`` then reference the blob by ``fileSha256``. The oldest
+    blobs (by last use) are removed once the store exceeds its size limit.
+    """
+
+    def __init__(self, output_folder, max_mb=DEFAULT_MAX_MB, max_upload_mb=DEFAULT_MAX_UPLOAD_MB):
+        self.folder = os.path.join(output_folder, UPLOAD_DIRNAME)
+        self.max_bytes = max(1, int(max_mb)) * 1024 * 1024
+        self.max_upload_bytes = min(self.max_bytes, max(1, int(max_upload_mb)) * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.folder, exist_ok=True)
+        self.index_path = os.path.join(self.folder, INDEX_FILENAME)
+        self.last_used = self._load_index()  # sha256 -> 最近使用时间
+        self.index_dirty = False
+        self.index_saved = time.monotonic()
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {key: float(value) for key, value in data.items() if isinstance(value, (int, float))}
+
+    def _touch(self, sha256):
+        # 调用方已持有 self.lock
+        self.last_used[sha256] = time.time()
+        self.index_dirty = True
+        if time.monotonic() - self.index_saved >= INDEX_FLUSH_SECONDS:
+            self._save_index()
+
+    def _save_index(self):
+        # 调用方已持有 self.lock；写失败只影响淘汰顺序
+        self.index_dirty = False
+        self.index_saved = time.monotonic()
+        tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.last_used, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def path(self, sha256):
+        return os.path.join(self.folder, normalize_sha256(sha256) + '.pdf')
+
+    def has(self, sha256):
+        sha256 = normalize_sha256(sha256)
+        path = self.path(sha256)
+        with self.lock:
+            if os.path.exists(path):
+                self.hits += 1
+                self._touch(sha256)  # 记录最近使用时间，淘汰时按它排序
+                return True
+            self.misses += 1
+            return False
+
+    def size(self, sha256):
+        return os.path.getsize(self.path(sha256))
+
+    def put_stream(self, stream, expected_sha256, content_length=None):
+        """Stream a blob into the store, verifying it matches ``expected_sha256``.
+
+        Uploads larger than ``max_upload_bytes`` raise UploadTooLargeError:
+        right away when ``content_length`` says so, otherwise as soon as the
+        limit is crossed, before more than one extra chunk reaches the disk.
+        """
+        expected = normalize_sha256(expected_sha256)
+        if content_length is not None and content_length > self.max_upload_bytes:
+            raise UploadTooLargeError(self._too_large_message())
+        digest = hashlib.sha256()
+        received = 0
+        part_path = os.path.join(self.folder, f"{expected}.{uuid.uuid4().hex}.part")
+        try:
+            with open(part_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    received += len(chunk)
+                    if received > self.max_upload_bytes:
+                        raise UploadTooLargeError(self._too_large_message())
+                    digest.update(chunk)
+                    f.write(chunk)
+            if digest.hexdigest() != expected:
+                raise ValueError("Uploaded content does not match its SHA-256")
+            os.replace(part_path, self.path(expected))
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        with self.lock:
+            self._touch(expected)
+        self._prune()
+        return expected
+
+    def _too_large_message(self):
+        return f"Upload exceeds the limit of {self.max_upload_bytes // (1024 * 1024)} MB"
+
+    def put_file(self, path, sha256):
+        """Remember an already written upload so later requests can skip sending it."""
+        sha256 = normalize_sha256(sha256)
+        target = self.path(sha256)
+        if os.path.getsize(path) > self.max_upload_bytes:
+            return
+        if not os.path.exists(target):
+            place_file(path, target)
+        with self.lock:
+            self._touch(sha256)
+        self._prune()
+
+    def materialize(self, sha256, target):
+        """Place the stored blob at ``target``. Raises UploadMissingError if missing."""
+        sha256 = normalize_sha256(sha256)
+        source = self.path(sha256)
+        try:
+            place_file(source, target)
+        except FileNotFoundError:
+            # HEAD 之后被淘汰：调用方返回 410，插件改为直接上传文件
+            raise UploadMissingError(f"Upload {sha256} is not stored on the server") from None
+        with self.lock:
+            self._touch(sha256)
+
+    def _prune(self):
+        with self.lock:
+            blobs = []
+            for name in os.listdir(self.folder):
+                if not name.endswith('.pdf'):
+                    continue
+                full = os.path.join(self.folder, name)
+                try:
+                    stat = os.stat(full)
+                except OSError:
+                    continue
+                sha256 = name[:-len('.pdf')]
+                # 索引里没有的（旧版本留下的 blob）按写入时间算
+                blobs.append((self.last_used.get(sha256, stat.st_mtime), stat.st_size, full, sha256))
+            total = sum(size for _, size, _, _ in blobs)
+            for _, size, full, sha256 in sorted(blobs):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(full)
+                    total -= size
+                except OSError:
+                    pass
+            present = {sha256 for _, _, full, sha256 in blobs if os.path.exists(full)}
+            if set(self.last_used) - present:
+                self.last_used = {key: value for key, value in self.last_used.items() if key in present}
+                self.index_dirty = True
+            if self.index_dirty:
+                self._save_index()
+
+    def stats(self):
+        with self.lock:
+            sizes = [
+                os.path.getsize(os.path.join(self.folder, name))
+                for name in os.listdir(self.folder) if name.endswith('.pdf')
+            ]
+            return {
+                'blobs': len(sizes),
+                'sizeBytes': sum(sizes),
+                'maxBytes': self.max_bytes,
+                'maxUploadBytes': self.max_upload_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -7,6 +7,7 @@ import platform
 import shutil
 import subprocess
 import sys
+import threading
 import traceback
 from collections import defaultdict
 from pathlib import Path
@@ -19,11 +20,26 @@ from utils.environment_lifecycle import load_requirements
 from utils.environment_lifecycle import maybe_prompt_existing_user_update
 from utils.environment_lifecycle import resolve_environment_python
 from utils.environment_lifecycle import transactional_install_or_update
+from utils.warm_pool import warm_pool
 
 DEFAULT_MIRROR_SOURCE = "https://mirrors.ustc.edu.cn/pypi/simple"
 PYPI_SOURCE = "https://pypi.org/simple"
 
 
+def site_packages_dirs(env_dir: Path) -> list[Path]:
+    """site-packages folders of a uv/conda environment (Windows: Lib/site-packages)."""
+    env_dir = Path(env_dir)
+    candidates = [env_dir / "Lib" / "site-packages", *sorted(env_dir.glob("lib/python*/site-packages"))]
+    return [path for path in candidates if path.is_dir()]
+
+
+def _mtime_ns(path) -> int | None:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
 def normalize_pkg_name(name: str) -> str:
     return name.lower().replace("_", "-").replace(".", "-").split("=")[0]
 
@@ -85,6 +101,13 @@ class VirtualEnvManager:
         self.curr_env_path = None
         self.conda_env_path = defaultdict(lambda: None)
         self.ensured_env = defaultdict(lambda: None)
+        # engine -> resolved launch data (python, bin dir, PATH, versions), see _resolve().
+        # Reused until the env's site-packages / bin folders change or an update runs.
+        self.resolved = {}
+        self.validated_versions = {}  # str(python_path) -> {package: version}
+        # 多个任务线程同时取命令时，解析、安装和失效都要串行：上面这些状态一起变化。
+        # 可重入：ensure_env -> install_packages 等路径会嵌套调用带锁的方法
+        self.lock = threading.RLock()
 
         # Respect the user's selected manager when checking the existing env.
         # Only explicit `auto` may discover either uv or conda.
@@ -175,12 +198,14 @@ class VirtualEnvManager:
             _, required_packages = load_requirements(engine, env_tool, self.config_path)
             if required_packages:
                 code = (
+                    "import json; "
                     "from packaging.requirements import Requirement; "
                     "from importlib.metadata import version; "
-                    f"reqs={required_packages!r}; "
+                    f"reqs={required_packages!r}; out={{}}; "
                     "\nfor raw in reqs:\n"
                     "    req=Requirement(raw)\n"
-                    "    version(req.name)\n"
+                    "    out[req.name]=version(req.name)\n"
+                    "print(json.dumps(out))"
                 )
                 result = subprocess.run(
                     [str(python_path), "-c", code],
@@ -194,6 +219,10 @@ class VirtualEnvManager:
                         + (result.stderr or result.stdout or "unknown error").strip()
                     )
                     return False
+                try:
+                    self.validated_versions[str(python_path)] = json.loads(result.stdout.strip().splitlines()[-1])
+                except (ValueError, IndexError):
+                    pass
 
             # Package presence is sufficient for an existing environment health
             # check.  Never launch ``pdf2zh_next --help`` here: pdf2zh_next 2.9
@@ -246,6 +275,8 @@ class VirtualEnvManager:
             preferred_index=self._preferred_index(),
             require_deepseek_thinking=(engine == "pdf2zh_next"),
         )
+        # 显式安装/更新后必须重新解析，哪怕 site-packages 的时间戳碰巧没变
+        self.invalidate(engine)
         if success and selected_tool and final_dir:
             self._remember_environment(engine, selected_tool, final_dir)
         return success
@@ -253,7 +284,70 @@ class VirtualEnvManager:
     def create_env(self, engine, envtool):
         return self.install_packages(engine, envtool)
 
+    def _fingerprint(self, resolved) -> tuple:
+        watched = [resolved["python_path"], resolved["bin_dir"], *resolved["site_packages"]]
+        return tuple(_mtime_ns(path) for path in watched)
+
+    def _resolve(self, engine: str) -> dict:
+        """Probe the selected environment once and keep what launching a job needs."""
+        existing = self._existing(engine, self.curr_envtool)
+        if not existing:
+            raise RuntimeError(f"已选择的 {engine} 翻译环境在执行前不可用。")
+        env_tool, env_dir, python_path = existing
+        bin_dir = env_dir / ("Scripts" if self.is_windows else "bin")
+        suffix = ".exe" if self.is_windows else ""
+        executables = {}
+        for name in ("pdf2zh", "pdf2zh_next"):
+            executable = bin_dir / (name + suffix)
+            executables[name] = str(executable) if executable.exists() else None
+        path_entries = environment_path_entries(env_dir, env_tool) or [bin_dir]
+        resolved = {
+            "env_tool": env_tool,
+            "env_name": self.env_name.get(engine, ENGINE_ENV_NAMES[engine]),
+            "env_dir": str(env_dir),
+            "python_path": str(python_path),
+            "bin_dir": str(bin_dir),
+            "site_packages": [str(path) for path in site_packages_dirs(env_dir)],
+            "executables": executables,
+            "path_prefix": os.pathsep.join(str(value) for value in path_entries),
+            "versions": self.validated_versions.get(str(python_path)),
+        }
+        resolved["fingerprint"] = self._fingerprint(resolved)
+        self.resolved[engine] = resolved
+        return resolved
+
+    def _cached_resolution(self, engine: str) -> dict | None:
+        resolved = self.resolved.get(engine)
+        if resolved is None:
+            return None
+        if self._fingerprint(resolved) != resolved["fingerprint"]:
+            print(f"🔄 {engine} 环境的文件有变化，重新检查环境: {resolved['env_dir']}")
+            self.invalidate(engine)
+            return None
+        self.curr_envtool = resolved["env_tool"]
+        self.curr_envname = resolved["env_name"]
+        self.curr_env_path = resolved["env_dir"]
+        return resolved
+
+    def invalidate(self, engine: str | None = None) -> None:
+        """Drop the resolved environment of ``engine`` (all engines when None)."""
+        with self.lock:
+            engines = list(self.resolved) if engine is None else [engine]
+            for name in engines:
+                resolved = self.resolved.pop(name, None)
+                self.ensured_env[name] = None
+                if resolved:
+                    self.validated_versions.pop(resolved["python_path"], None)
+                    # 常驻进程里导入的是旧版本的包
+                    warm_pool.retire(resolved["python_path"])
+
     def ensure_env(self, engine):
+        with self.lock:
+            return self._ensure_env(engine)
+
+    def _ensure_env(self, engine):
+        if self._cached_resolution(engine) is not None:
+            return True
         cached = self.ensured_env.get(engine)
         if cached:
             tool, _, cached_path = cached
@@ -346,39 +440,31 @@ class VirtualEnvManager:
         return bin_dir if os.path.exists(bin_dir) else False
 
     def _resolved_command(self, command):
-        engine = "pdf2zh_next" if "pdf2zh_next" in " ".join(command).lower() else "pdf2zh"
-        if not self.ensure_env(engine):
-            raise RuntimeError(
-                f"无法准备可用的 {engine} 托管翻译环境。Server 本身仍可运行，"
-                "但本次翻译无法执行。请稍后重试，或在 server 目录运行 "
-                "`python update_packages.py`。如需明确使用系统环境，请使用 "
-                "`--enable_venv=False` 启动 Server。"
-            )
-
-        existing = self._existing(engine, self.curr_envtool)
-        if not existing:
-            raise RuntimeError(f"已选择的 {engine} 翻译环境在执行前不可用。")
-        _, env_dir, python_path = existing
-        bin_dir = env_dir / ("Scripts" if self.is_windows else "bin")
+        engine = "pdf2zh_next" if any("pdf2zh_next" in str(part).lower() for part in command) else "pdf2zh"
+        with self.lock:
+            resolved = self._cached_resolution(engine)
+            if resolved is None:
+                if not self.ensure_env(engine):
+                    raise RuntimeError(
+                        f"无法准备可用的 {engine} 托管翻译环境。Server 本身仍可运行，"
+                        "但本次翻译无法执行。请稍后重试，或在 server 目录运行 "
+                        "`python update_packages.py`。如需明确使用系统环境，请使用 "
+                        "`--enable_venv=False` 启动 Server。"
+                    )
+                resolved = self._resolve(engine)
 
-        if command[0].lower() in {"pdf2zh", "pdf2zh_next"}:
-            executable = bin_dir / (command[0] + (".exe" if self.is_windows else ""))
-            if executable.exists():
-                final_cmd = [str(executable), *command[1:]]
-            else:
-                final_cmd = [str(python_path), "-u", "-m", command[0], *command[1:]]
+        executable = resolved["executables"].get(command[0].lower())
+        if executable:
+            final_cmd = [executable, *command[1:]]
+        elif command[0].lower() in {"pdf2zh", "pdf2zh_next"}:
+            final_cmd = [resolved["python_path"], "-u", "-m", command[0], *command[1:]]
         else:
-            final_cmd = [str(python_path), "-u", *command]
+            final_cmd = [resolved["python_path"], "-u", *command]
 
         env = os.environ.copy()
         env["PYTHONUNBUFFERED"] = "1"
-        path_entries = environment_path_entries(env_dir, self.curr_envtool)
-        if not path_entries:
-            path_entries = [bin_dir]
         current_path = env.get("PATH", "")
-        env["PATH"] = os.pathsep.join(
-            [str(value) for value in path_entries] + ([current_path] if current_path else [])
-        )
+        env["PATH"] = resolved["path_prefix"] + (os.pathsep + current_path if current_path else "")
         return final_cmd, env
 
     def get_command_and_env(self, command):
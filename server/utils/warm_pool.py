@@ -0,0 +1,269 @@
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import uuid
+
+from utils.warm_worker import EXIT_MARKER
+
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warm_worker.py')
+DEFAULT_WARM_WORKERS = 0
+RECV_SIZE = 4096
+# 子进程已开始执行后连接中断（被结束 / 崩溃）时的退出码：按任务失败处理，不再重跑
+LOST_EXIT_CODE = -1
+
+
+def split_command(cmd):
+    """``[.../pdf2zh_next, args...]`` 或 ``[python, -u, -m, pdf2zh_next, args...]`` -> (python, args)。
+
+    其他命令（pdf2zh 1.x、Windows 可执行文件）或找不到对应 Python 时返回 None。
+    """
+    if len(cmd) >= 4 and cmd[1:4] == ['-u', '-m', 'pdf2zh_next']:
+        return cmd[0], list(cmd[4:])
+    name = os.path.basename(str(cmd[0])).lower()
+    if name not in ('pdf2zh_next', 'pdf2zh-next'):
+        return None
+    executable = cmd[0] if os.path.isabs(cmd[0]) else shutil.which(cmd[0])
+    if not executable:
+        return None
+    # 不解析符号链接：虚拟环境的 bin/python 本身就是指向基础解释器的链接
+    bin_dir = os.path.dirname(executable)
+    for candidate in ('python', 'python3'):
+        python_path = os.path.join(bin_dir, candidate)
+        if os.path.exists(python_path):
+            return python_path, list(cmd[1:])
+    return None
+
+
+class _Worker:
+    def __init__(self, python_path, env):
+        self.python_path = python_path
+        self.socket_path = os.path.join(tempfile.gettempdir(), f"pdf2zh-warm-{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self.ready = threading.Event()
+        self.busy = False
+        self.retired = False
+        self.jobs = 0
+        self.process = subprocess.Popen(
+            [python_path, '-u', WORKER_SCRIPT, self.socket_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+        threading.Thread(target=self._wait_ready, daemon=True).start()
+
+    def _wait_ready(self):
+        for line in self.process.stdout:
+            if line.strip() == b'READY':
+                self.ready.set()
+                print(f"🔥 [WarmPool] 常驻 pdf2zh_next 进程已就绪 (pid={self.process.pid})")
+                return
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def stop(self):
+        if self.alive():
+            self.process.kill()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
+
+
+class WarmPool:
+    """Keep ``size`` resident pdf2zh_next workers per translation environment.
+
+    Workers import pdf2zh_next/BabelDOC once at startup and fork a fresh
+    child for every job (POSIX only), so jobs skip the interpreter start and
+    the heavy imports. They are started on the first pdf2zh_next job of an
+    environment; until one is ready, and whenever a worker dies before it
+    started the job, the job runs through the normal CLI path instead. A job
+    whose child dies mid-run fails instead of being translated twice.
+    """
+
+    def __init__(self, size=DEFAULT_WARM_WORKERS):
+        self.size = max(0, int(size or 0))
+        self.lock = threading.Lock()
+        self.workers = {}  # python_path -> [_Worker]
+        self.served = 0
+        self.fallbacks = 0
+        self.restarts = 0
+        self.lost = 0
+
+    @property
+    def enabled(self):
+        return self.size > 0 and sys.platform != 'win32' and hasattr(socket, 'AF_UNIX')
+
+    def configure(self, size):
+        with self.lock:
+            self.size = max(0, int(size or 0))
+
+    def _acquire(self, python_path, env):
+        with self.lock:
+            workers = self.workers.setdefault(python_path, [])
+            for worker in [w for w in workers if not w.alive()]:
+                print(f"⚠️ [WarmPool] 常驻进程已退出 (pid={worker.process.pid})，重新启动")
+                worker.stop()
+                workers.remove(worker)
+                self.restarts += 1
+            while len(workers) < self.size:
+                workers.append(_Worker(python_path, env))
+            for worker in workers:
+                if worker.ready.is_set() and not worker.busy:
+                    worker.busy = True
+                    return worker
+            return None
+
+    def _release(self, worker):
+        with self.lock:
+            worker.busy = False
+        if worker.retired:
+            worker.stop()
+
+    def run(self, cmd, env, on_output, progress_fd=None, on_start=None, on_exit=None):
+        """在常驻进程里执行 cmd，输出逐块交给 on_output(bytes)。
+
+        progress_fd 是进度事件管道的写端，会通过 Unix socket 传给执行任务的子进程；
+        on_start(pid) 在子进程开始执行时调用（子进程是独立进程组的组长，可整组结束）；
+        on_exit(usage) 在子进程正常结束时调用，usage 是它回传的 rusage 字段（见 warm_worker.py）。
+
+        返回子进程的退出码；没有可用的常驻进程、或子进程开始执行（回传 pid）之前连接就断开时
+        返回 None，由调用方改走命令行路径。开始执行之后连接中断则返回 LOST_EXIT_CODE，
+        此时任务可能已经跑了一部分（已调用过翻译 API、写过输出），不能再重跑一遍。
+        """
+        if not self.enabled:
+            return None
+        split = split_command(cmd)
+        if split is None:
+            return None
+        python_path, argv = split
+        worker = self._acquire(python_path, env)
+        if worker is None:
+            with self.lock:
+                self.fallbacks += 1
+            return None
+
+        print(f"🔥 [WarmPool] 使用常驻进程 pid={worker.process.pid} 执行 pdf2zh_next")
+        try:
+            code = self._run_on(worker, argv, env, on_output, progress_fd, on_start, on_exit)
+        finally:
+            self._release(worker)
+        with self.lock:
+            if code is None:
+                self.fallbacks += 1
+            elif code == LOST_EXIT_CODE:
+                self.lost += 1
+            else:
+                self.served += 1
+                worker.jobs += 1
+        return code
+
+    def _run_on(self, worker, argv, env, on_output, progress_fd=None, on_start=None, on_exit=None):
+        request = json.dumps({'argv': argv, 'env': dict(env), 'cwd': os.getcwd()}).encode('utf-8') + b'\n'
+        try:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.connect(worker.socket_path)
+        except OSError as e:
+            print(f"⚠️ [WarmPool] 无法连接常驻进程，改用命令行: {e}")
+            worker.stop()
+            return None
+
+        pending = b''
+        with conn:
+            # 第一个字节之后附带进度管道（没有时只发一个字节），然后是 JSON 请求
+            if progress_fd is not None and hasattr(socket, 'send_fds'):
+                socket.send_fds(conn, [b'F'], [progress_fd])
+            else:
+                conn.sendall(b'N')
+            conn.sendall(request)
+            # 子进程先回一行自己的 pid，之后才是输出
+            while b'\n' not in pending:
+                data = conn.recv(RECV_SIZE)
+                if not data:
+                    print("⚠️ [WarmPool] 常驻进程没有响应，改用命令行执行")
+                    return None
+                pending += data
+            pid_line, pending = pending.split(b'\n', 1)
+            if on_start is not None:
+                on_start(int(pid_line))
+            data = pending or conn.recv(RECV_SIZE)
+            pending = b''
+            while True:
+                if not data:
+                    # 没有收到退出标记：执行中的子进程异常退出
+                    if pending:
+                        on_output(pending)
+                    print("⚠️ [WarmPool] 常驻进程执行中途退出，任务按失败处理")
+                    return LOST_EXIT_CODE
+                pending += data
+                index = pending.find(EXIT_MARKER)
+                if index >= 0:
+                    if index:
+                        on_output(pending[:index])
+                    tail = pending[index + len(EXIT_MARKER):]
+                    while b'\n' not in tail:
+                        more = conn.recv(RECV_SIZE)
+                        if not more:
+                            break
+                        tail += more
+                    # 退出标记之后是 "<退出码> <rusage JSON>"
+                    code, _, usage = tail.split(b'\n', 1)[0].partition(b' ')
+                    try:
+                        code = int(code)
+                    except ValueError:
+                        return LOST_EXIT_CODE
+                    if on_exit is not None:
+                        try:
+                            on_exit(json.loads(usage) if usage else None)
+                        except ValueError:
+                            on_exit(None)
+                    return code
+                # 末尾可能是被截断的退出标记，先留着
+                keep = len(EXIT_MARKER) - 1
+                if len(pending) > keep:
+                    on_output(pending[:-keep])
+                    pending = pending[-keep:]
+                data = conn.recv(RECV_SIZE)
+
+    def retire(self, python_path):
+        """停止某个环境的常驻进程（环境更新后），下一个任务会按新环境重新启动。"""
+        with self.lock:
+            workers = self.workers.pop(str(python_path), [])
+            for worker in workers:
+                # 正在执行的任务让它跑完，释放时再停止
+                worker.retired = True
+                if not worker.busy:
+                    worker.stop()
+        if workers:
+            print(f"🔄 [WarmPool] 翻译环境已变化，停止 {len(workers)} 个常驻进程: {python_path}")
+
+    def stop(self):
+        with self.lock:
+            for workers in self.workers.values():
+                for worker in workers:
+                    worker.stop()
+            self.workers.clear()
+
+    def stats(self):
+        with self.lock:
+            workers = [w for ws in self.workers.values() for w in ws]
+            return {
+                'size': self.size,
+                'enabled': self.enabled,
+                'workers': len(workers),
+                'ready': sum(1 for w in workers if w.ready.is_set() and w.alive()),
+                'busy': sum(1 for w in workers if w.busy),
+                'served': self.served,
+                'fallbacks': self.fallbacks,
+                'restarts': self.restarts,
+                'lost': self.lost,
+            }
+
+
+# global singleton
+warm_pool = WarmPool()
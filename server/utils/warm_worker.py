@@ -0,0 +1,157 @@
+"""Resident pdf2zh_next worker, started by utils/warm_pool.py.
+
+Runs with the Python of the translation environment, so it only uses the
+standard library. It imports pdf2zh_next (and with it BabelDOC) once, then
+serves jobs on a Unix socket. Every job runs in a forked child: the child
+starts from the already imported state, and nothing one job changes leaks
+into the next. The child's stdout/stderr go to the socket, followed by an
+exit marker carrying the return code and the child's rusage.
+"""
+import importlib.util
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import traceback
+
+# 不能让 server/utils 出现在 sys.path 上：这里的 config.py / venv.py 会遮住同名模块
+if sys.path and os.path.abspath(sys.path[0] or '.') == os.path.dirname(os.path.abspath(__file__)):
+    del sys.path[0]
+
+EXIT_MARKER = b'\n\x00PDF2ZH_WARM_EXIT '
+# 尽量在 fork 之前导入的重模块；不存在时忽略（不同版本的 BabelDOC 结构不同）
+PRELOAD_MODULES = (
+    'babeldoc.format.pdf.high_level',
+    'babeldoc.docvision.doclayout',
+)
+
+
+def _load_progress_hook():
+    # 与本文件同目录，但 sys.path 上已经没有这个目录
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'progress_hook.py')
+    spec = importlib.util.spec_from_file_location('pdf2zh_progress_hook', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+progress_hook = _load_progress_hook()
+
+
+def _preload():
+    import importlib
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def _exit_code(exc):
+    if exc.code is None:
+        return 0
+    return exc.code if isinstance(exc.code, int) else 1
+
+
+def _usage():
+    """本次任务（fork 出的子进程，含它回收的子进程）的 rusage，字段同 resource_usage.raw_rusage。"""
+    try:
+        import resource
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    except Exception:
+        return {}
+    return {
+        'utime': own.ru_utime + children.ru_utime,
+        'stime': own.ru_stime + children.ru_stime,
+        'maxrss': max(own.ru_maxrss, children.ru_maxrss),
+        'inblock': own.ru_inblock + children.ru_inblock,
+        'oublock': own.ru_oublock + children.ru_oublock,
+    }
+
+
+def _receive_header(conn):
+    """第一个字节，以及随它传来的进度管道写端（没有时为 None）。"""
+    if hasattr(socket, 'recv_fds'):
+        _, fds, _, _ = socket.recv_fds(conn, 1, 1)
+        return fds[0] if fds else None
+    conn.recv(1)
+    return None
+
+
+def _run_job(conn, entry):
+    progress_fd = _receive_header(conn)
+    with conn.makefile('rb') as reader:
+        request = json.loads(reader.readline().decode('utf-8'))
+    # 独立进程组：Server 取消任务时按 pid 结束整组（含 BabelDOC 启动的子进程）
+    os.setsid()
+    conn.sendall(f"{os.getpid()}\n".encode())
+    os.environ.clear()
+    os.environ.update(request['env'])
+    if progress_fd is not None:
+        os.environ[progress_hook.PROGRESS_FD_ENV] = str(progress_fd)
+        progress_hook.install(progress_fd)
+    if request.get('cwd'):
+        os.chdir(request['cwd'])
+
+    fd = conn.fileno()
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    sys.stdout = os.fdopen(1, 'w', buffering=1, encoding='utf-8', errors='replace', closefd=False)
+    sys.stderr = os.fdopen(2, 'w', buffering=1, encoding='utf-8', errors='replace', closefd=False)
+    sys.argv = ['pdf2zh_next', *request['argv']]
+
+    code = 0
+    try:
+        result = entry()
+        if isinstance(result, int):
+            code = result
+    except SystemExit as exc:
+        code = _exit_code(exc)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    try:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except Exception:
+        pass
+    os.write(1, EXIT_MARKER + f"{code} {json.dumps(_usage())}\n".encode())
+
+
+def _exit_with_parent():
+    # Server 退出时会关闭我们的 stdin；读到 EOF 就退出，不留下孤儿进程
+    sys.stdin.buffer.read()
+    os._exit(0)
+
+
+def main(socket_path):
+    entry = progress_hook.load_entry()
+    _preload()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server.bind(socket_path)
+    server.listen()
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # 自动回收子进程
+    threading.Thread(target=_exit_with_parent, daemon=True).start()
+    print('READY', flush=True)
+
+    while True:
+        conn, _ = server.accept()
+        pid = os.fork()
+        if pid == 0:
+            server.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            try:
+                _run_job(conn, entry)
+            finally:
+                os._exit(0)
+        conn.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1])
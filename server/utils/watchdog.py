@@ -0,0 +1,146 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.cancellation import cancel_registry, JobTimeout
+
+
+# 多少秒没有任何进度变化就认为卡住（例如上游 LLM 接口无响应）；0 表示不检查（默认）。
+# 只有解析出的进度才算活动：pdf2zh 1.x、Windows 控制台模式、首次下载模型 / 字体时
+# 可能很久都没有可解析的进度，默认开启会误杀正常的任务，需要时由用户按环境设置。
+DEFAULT_STALL_TIMEOUT = 0
+# 单个任务（含重试）最多运行多少秒；0 表示不限制
+DEFAULT_JOB_TIMEOUT = 0
+# 卡住后重试几次（仅 pdf2zh_next）：已完成的分片保留，只把未完成的页码范围拆小重跑
+DEFAULT_STALL_RETRIES = 1
+CHECK_INTERVAL = 1.0
+
+
+class _Watch:
+    """Activity of one translator run; ``touch`` whenever it makes progress."""
+
+    def __init__(self, task_id, stall_timeout):
+        self.task_id = task_id
+        self.stall_timeout = stall_timeout
+        self.last_activity = time.monotonic()
+        self.last_report = None
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+    def reporting(self, report):
+        """包装进度回调：进度内容有变化时才算活动。
+
+        rich 的进度条会定时重绘，终端输出一直有字节，不能用来判断是否卡住。
+        """
+        def wrapped(updates):
+            if updates != self.last_report:
+                self.last_report = dict(updates)
+                self.touch()
+            if report is not None:
+                report(updates)
+        return wrapped
+
+
+class JobWatchdog:
+    """Inactivity and wall-clock budgets for running translation jobs.
+
+    A job registers its budgets with ``begin``; every translator run inside
+    it is wrapped in ``watch``. A single thread checks them once a second.
+    On a breach it terminates the job's process trees through
+    ``cancel_registry``, so the job raises ``JobTimeout`` and gives its slot
+    back instead of waiting on a hung API forever.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stall_timeout = DEFAULT_STALL_TIMEOUT
+        self.job_timeout = DEFAULT_JOB_TIMEOUT
+        self.stall_retries = DEFAULT_STALL_RETRIES
+        self.jobs = {}         # task_id -> (deadline or None, stall_timeout, budget)
+        self.watches = set()
+        self.thread = None
+        self.stalled = 0
+        self.timed_out = 0
+        self.retries = 0
+
+    def configure(self, stall_timeout=None, job_timeout=None, stall_retries=None):
+        with self.lock:
+            if stall_timeout is not None:
+                self.stall_timeout = max(0.0, float(stall_timeout))
+            if job_timeout is not None:
+                self.job_timeout = max(0.0, float(job_timeout))
+            if stall_retries is not None:
+                self.stall_retries = max(0, int(stall_retries))
+
+    def begin(self, task_id, stall_timeout=None, job_timeout=None):
+        """登记任务的预算；参数为 None 时使用 Server 的默认值。"""
+        with self.lock:
+            stall = self.stall_timeout if stall_timeout is None else max(0.0, float(stall_timeout))
+            budget = self.job_timeout if job_timeout is None else max(0.0, float(job_timeout))
+            deadline = time.monotonic() + budget if budget else None
+            self.jobs[task_id] = (deadline, stall, budget)
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._loop, name="pdf2zh-watchdog", daemon=True)
+                self.thread.start()
+
+    def finish(self, task_id):
+        with self.lock:
+            self.jobs.pop(task_id, None)
+
+    def retry_count(self, requested=None):
+        return self.stall_retries if requested is None else max(0, int(requested))
+
+    def record_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    @contextmanager
+    def watch(self, task_id):
+        with self.lock:
+            _, stall, _ = self.jobs.get(task_id, (None, 0, 0))
+            watch = _Watch(task_id, stall)
+            if task_id is not None:
+                self.watches.add(watch)
+        try:
+            yield watch
+        finally:
+            with self.lock:
+                self.watches.discard(watch)
+
+    def _loop(self):
+        while True:
+            time.sleep(CHECK_INTERVAL)
+            now = time.monotonic()
+            breaches = []
+            with self.lock:
+                for task_id, (deadline, stall, budget) in list(self.jobs.items()):
+                    if deadline is not None and now >= deadline:
+                        breaches.append((task_id, 'budget', f"任务运行超过时间上限 {int(budget)} 秒"))
+                        self.jobs[task_id] = (None, stall, budget)
+                        self.timed_out += 1
+                for watch in list(self.watches):
+                    if watch.stall_timeout and now - watch.last_activity >= watch.stall_timeout:
+                        breaches.append((watch.task_id, 'stall', f"翻译进程 {int(watch.stall_timeout)} 秒没有进度"))
+                        # 同一次运行只报告一次；重试会创建新的 watch
+                        self.watches.discard(watch)
+                        self.stalled += 1
+            for task_id, kind, message in breaches:
+                print(f"⏱️ [Zotero PDF2zh Server] 任务 {task_id}: {message}，结束翻译进程")
+                cancel_registry.terminate(task_id, JobTimeout(kind, message))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'stallTimeout': self.stall_timeout,
+                'jobTimeout': self.job_timeout,
+                'stallRetries': self.stall_retries,
+                'watching': len(self.watches),
+                'stalled': self.stalled,
+                'timedOut': self.timed_out,
+                'retries': self.retries,
+            }
+
+
+# global singleton
+job_watchdog = JobWatchdog()